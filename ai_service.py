@@ -1,105 +1,538 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+import asyncio
 import json
-import httpx
-from utils import load_system_prompt
-from config import DIRECTORY_EXTRACTION_PROMPT, FILENAME_GENERATION_PROMPT, COMPARE_PROMPT
-from header_utils import get_question_type
+import metrics
+from http_client import get_client, UpstreamError
+from utils import estimate_tokens
+from config import DIRECTORY_EXTRACTION_PROMPT, FILENAME_GENERATION_PROMPT, COMPARE_PROMPT, RESPONSE_CACHE_ENABLED, STREAM_ABORT_ON_INVALID
+from config import CHUNK_ENABLED, CHUNK_MAX_TOKENS, CHUNK_MAX_CONCURRENCY, RELAY_COALESCE_WINDOW, USAGE_STREAM_INCLUDE_USAGE
+from config import QUESTION_STORE_SAVE_GENERATED
+from prompt_template import render_system_prompt, build_user_prompt
+from scheduler import stream_with_retry, multiplex, coalesce
+from provider_router import router, is_pool, limiter_for
+from json_codec import loads, sse_frame
+from response_cache import response_cache, audit_results, cache_key
+from stream_parser import QuestionStreamParser, StreamParseError, extract_questions
+from chunker import split_source
+from pre_audit import audit_pair
+from usage import Usage, usage_tracker
+from question_store import get_question_store
 
 
-async def call_ai_api(api_url, api_key, model, system_prompt, user_prompt):
-    """通用 AI API 调用函数"""
-    async with httpx.AsyncClient(timeout=60.0) as client:
+async def call_ai_api(api_url, api_key, model, system_prompt, user_prompt, use_cache=True):
+    """通用 AI API 调用函数，use_cache=False 时跳过缓存强制请求（结果仍会写入缓存，因输出上限被截断的除外）"""
+    messages = [
+        {'role': 'system', 'content': system_prompt},
+        {'role': 'user', 'content': user_prompt}
+    ]
+    key = cache_key(api_url, model, messages) if RESPONSE_CACHE_ENABLED else None
+    if key and use_cache:
+        cached = await response_cache.aget(key)
+        if cached is not None:
+            return cached
+
+    usage = Usage(model)
+    if is_pool(api_url):
+        result = await router.call(model, messages, request_completion, usage)
+    else:
+        result = await request_completion(api_url, api_key, model, messages, usage=usage)
+    if key and result and not usage.truncated:
+        await response_cache.aset(key, result)
+    return result
+
+
+async def request_completion(api_url, api_key, model, messages, on_headers=None, usage=None):
+    """
+    非流式调用 chat/completions
+
+    参数:
+        on_headers: 收到响应时以响应头调用（用于读取限速额度）
+        usage: 用量记录（usage.Usage），可选；累计用量总会记录
+
+    返回:
+        回复文本，没有回复时为 None
+
+    异常:
+        UpstreamError: 上游返回错误状态码
+    """
+    client = get_client(api_url)
+    start = metrics.begin_call(model, api_url)
+    try:
         response = await client.post(
             f"{api_url}/chat/completions",
             headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
             json={
                 'model': model,
-                'messages': [
-                    {'role': 'system', 'content': system_prompt},
-                    {'role': 'user', 'content': user_prompt}
-                ],
+                'messages': messages,
                 'stream': False
-            }
+            },
+            timeout=60.0
         )
-        data = response.json()
-        if 'choices' in data and len(data['choices']) > 0:
-            return data['choices'][0]['message']['content'].strip()
+    except Exception as e:
+        metrics.record_error(model, api_url, e)
+        raise
+    if on_headers is not None:
+        on_headers(response.headers)
+    if response.status_code >= 400:
+        metrics.record_error(model, api_url, str(response.status_code))
+        raise UpstreamError(response.status_code, response.text, response.headers.get('retry-after'))
+    data = response.json()
+    if 'choices' in data and len(data['choices']) > 0:
+        choice = data['choices'][0]
+        result = choice['message']['content'].strip()
+        metrics.record_call(model, api_url, start, result)
+        usage_tracker.record(model, api_url, messages, result, data.get('usage'), choice.get('finish_reason'), usage)
+        return result
+    return None
+
+
+async def lookup_cache(api_url, model, messages):
+    """查询流式请求的缓存结果"""
+    if not RESPONSE_CACHE_ENABLED:
         return None
+    return await response_cache.aget(cache_key(api_url, model, messages))
 
 
-async def generate_questions_stream(api_url, api_key, model, question_types, user_input, system_prompt_override, directory):
-    """流式生成题目"""
-    with open('demo_questions.json', 'r', encoding='utf-8') as f:
-        demo_data = json.load(f)
+async def replay_cached(text):
+    """以单个增量的形式回放缓存结果"""
+    yield text
 
-    examples_text = ""
-    for qtype in question_types:
-        examples = [q for q in demo_data['questions'] if get_question_type(q) == qtype]
-        if examples:
-            examples_text += f"\n{qtype}示例：\n{json.dumps(examples[0], ensure_ascii=False, indent=2)}\n"
 
-    system_prompt = system_prompt_override if system_prompt_override else load_system_prompt()
-    system_prompt = system_prompt.replace('{{json_example}}', examples_text)
-    system_prompt = system_prompt.replace('{{TOP}}', directory if directory else '无')
+async def stream_chat(api_url, api_key, model, messages, use_cache=True, usage=None):
+    """
+    带缓存的流式调用：命中时回放完整结果，否则请求上游并在正常结束后写入缓存（usage 同 request_completion）
 
-    user_prompt = f"用户需求：\n{user_input}\n\n请按照system prompt中的格式要求生成题目。"
+    因输出上限被截断（finish_reason 为 length）的结果不写入缓存，重试时重新请求
+    """
+    if use_cache:
+        cached = await lookup_cache(api_url, model, messages)
+        if cached is not None:
+            yield cached
+            return
 
-    async with httpx.AsyncClient(timeout=300.0) as client:
+    usage = usage if usage is not None else Usage(model)
+    truncated_before = usage.truncated
+    parts = []
+    if is_pool(api_url):
+        deltas = router.stream(model, messages, stream_chat_deltas, usage)
+    else:
+        deltas = stream_chat_deltas(api_url, api_key, model, messages, usage=usage)
+    if RELAY_COALESCE_WINDOW > 0:
+        deltas = coalesce(deltas, RELAY_COALESCE_WINDOW)
+    try:
+        async for text in deltas:
+            if text:
+                parts.append(text)
+            yield text
+    finally:
+        # 提前结束时立即关闭上游连接，不等待垃圾回收
+        await deltas.aclose()
+    if RESPONSE_CACHE_ENABLED and parts and usage.truncated == truncated_before:
+        await response_cache.aset(cache_key(api_url, model, messages), ''.join(parts))
+
+
+async def stream_chat_deltas(api_url, api_key, model, messages, on_headers=None, usage=None):
+    """
+    流式调用 chat/completions，逐个产出文本增量（on_headers、usage 同 request_completion）
+
+    上游接受请求后，无论正常结束、出错还是提前关闭都记录用量：最后一帧带 usage 时使用
+    上游返回的值，否则按已输出的内容估算。
+    """
+    client = get_client(api_url)
+    timer = metrics.StreamTimer(model, api_url)
+    completed = False
+    accepted = False
+    parts = []
+    reported = finish_reason = None
+    body = {'model': model, 'messages': messages, 'stream': True}
+    if USAGE_STREAM_INCLUDE_USAGE:
+        body['stream_options'] = {'include_usage': True}
+    try:
         async with client.stream(
             'POST',
             f"{api_url}/chat/completions",
             headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
-            json={'model': model, 'messages': [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}], 'stream': True}
+            json=body,
+            timeout=300.0
         ) as response:
+            if on_headers is not None:
+                on_headers(response.headers)
+            if response.status_code >= 400:
+                await response.aread()
+                raise UpstreamError(response.status_code, response.text, response.headers.get('retry-after'))
+            accepted = True
             async for line in response.aiter_lines():
-                if line.startswith('data: '):
-                    data = line[6:]
-                    if data.strip() == '[DONE]':
-                        break
-                    try:
-                        chunk = json.loads(data)
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('delta', {})
-                            if 'content' in delta:
-                                yield f"data: {json.dumps({'text': delta['content']}, ensure_ascii=False)}\n\n"
-                    except:
-                        pass
-
-
-async def extract_directory(api_url, api_key, model, content):
+                if not line.startswith('data:'):
+                    # 空行、注释（心跳）和 event: 等字段
+                    continue
+                data = line[6:] if line.startswith('data: ') else line[5:]
+                if data.strip() == '[DONE]':
+                    break
+                try:
+                    chunk = loads(data)
+                except ValueError:
+                    timer.malformed()
+                    continue
+                # yield 不能放在 try 中，否则提前关闭生成器时 GeneratorExit 会被吞掉
+                text = delta_text(chunk)
+                if text is MALFORMED:
+                    timer.malformed()
+                    continue
+                if chunk.get('usage'):
+                    reported = chunk['usage']
+                if chunk.get('choices') and chunk['choices'][0].get('finish_reason'):
+                    finish_reason = chunk['choices'][0]['finish_reason']
+                if text:
+                    timer.delta(text)
+                    parts.append(text)
+                    yield text
+        completed = True
+    except Exception as e:
+        # 只统计上游错误；客户端提前断开（GeneratorExit）不计入
+        timer.error(e)
+        raise
+    finally:
+        timer.finish(completed)
+        if accepted:
+            usage_tracker.record(model, api_url, messages, ''.join(parts), reported, finish_reason, usage)
+
+
+MALFORMED = object()
+
+
+def delta_text(chunk):
+    """
+    取出流式响应一帧中的文本增量
+
+    返回:
+        文本（可能为空或 None，如只含 usage 的帧），结构不符合预期时返回 MALFORMED
+
+    异常:
+        UpstreamError: 上游在流中返回了错误对象
+    """
+    if not isinstance(chunk, dict):
+        return MALFORMED
+    if chunk.get('error'):
+        error = chunk['error']
+        code = error.get('code') if isinstance(error, dict) else None
+        status = code if isinstance(code, int) and 400 <= code < 600 else 502
+        message = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+        raise UpstreamError(status, message)
+    choices = chunk.get('choices')
+    if not choices:
+        return None
+    if not isinstance(choices, list) or not isinstance(choices[0], dict):
+        return MALFORMED
+    delta = choices[0].get('delta') or {}
+    if not isinstance(delta, dict):
+        return MALFORMED
+    return delta.get('content')
+
+
+async def parse_generation(stream):
+    """
+    在文本增量之间穿插逐题解析结果
+
+    产出 {'text': 增量} 和 {'question': 题目, 'index': 序号}；输出结构无法恢复时
+    关闭上游流并抛出 StreamParseError（STREAM_ABORT_ON_INVALID 关闭时只提示一次）。
+    """
+    parser = QuestionStreamParser()
+    reported = False
+    try:
+        async for text in stream:
+            yield {'text': text}
+            for index, question in parser.feed(text):
+                yield {'question': question, 'index': index}
+            if parser.error and not reported:
+                if STREAM_ABORT_ON_INVALID:
+                    raise StreamParseError(f"生成内容格式无法解析，已提前终止：{parser.error}")
+                reported = True
+                yield {'parseError': parser.error}
+    finally:
+        await stream.aclose()
+
+
+async def generate_questions_stream(api_url, api_key, model, question_types, user_input, system_prompt_override, directory, use_cache=True):
+    """
+    流式生成题目（输入过长时自动切分为多段并发生成）
+
+    开启 QUESTION_STORE_SAVE_GENERATED 时最后发送 {'stored': 题目保存到题库的结果}
+    """
+    system_prompt = render_system_prompt(question_types, system_prompt_override, directory)
+    usage = Usage(model)
+    if needs_chunking(user_input, usage_tracker.chunk_budget(model, estimate_tokens(system_prompt))):
+        frames = chunked_generation(api_url, api_key, model, system_prompt, user_input, limiter_for(api_url), use_cache, usage)
+    else:
+        user_prompt = build_user_prompt(user_input)
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+        frames = track_generation(parse_generation(stream_chat(api_url, api_key, model, messages, use_cache, usage)),
+                                  model, estimate_tokens(user_input), usage)
+    generated = []
+    try:
+        async for frame in frames:
+            if QUESTION_STORE_SAVE_GENERATED and 'question' in frame:
+                generated.append(frame['question'])
+            yield sse_frame(frame)
+    finally:
+        await frames.aclose()
+    if generated:
+        yield sse_frame({'stored': await store_generated(generated)})
+
+
+async def store_generated(questions):
+    """把生成的题目保存到服务端题库（QUESTION_STORE_SAVE_GENERATED），跳过格式不正确的题目"""
+    # 首次使用时创建数据库，也在线程中执行
+    result = await asyncio.get_running_loop().run_in_executor(None, lambda: get_question_store().upsert(questions, True))
+    return {key: result[key] for key in ('inserted', 'updated', 'unchanged', 'invalid', 'version')}
+
+
+def needs_chunking(user_input, max_tokens=CHUNK_MAX_TOKENS):
+    """输入超过单次生成的 token 预算（usage_tracker.chunk_budget）时需要切分"""
+    return CHUNK_ENABLED and estimate_tokens(user_input) > max_tokens
+
+
+def generation_tokens(model, system_tokens, user_prompt, material):
+    """一次生成请求预计使用的 token 数（prompt 加预计输出），用于 TPM 限速"""
+    return system_tokens + estimate_tokens(user_prompt) + usage_tracker.expected_output(model, estimate_tokens(material))
+
+
+async def track_generation(frames, model, material_tokens, usage):
+    """生成结束后按实际输出更新该模型的输出比例，最后产出 {'usage': 本次用量}"""
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        await frames.aclose()
+    usage_tracker.observe_generation(model, material_tokens, usage)
+    yield {'usage': usage.to_dict()}
+
+
+async def chunked_generation(api_url, api_key, model, system_prompt, user_input, limiter, use_cache=True, usage=None):
+    """
+    切分大段材料并发生成，按原文顺序合并
+
+    每段的大小按该模型的输出上限和输出比例计算（usage_tracker.chunk_budget），避免输出被截断。
+    依次产出 {'chunks': 段数}、按原文顺序编号的 {'question', 'index'}、每段结束时的
+    {'chunk': 段号, 'count': 题数}（该段失败时为 {'chunk', 'chunkError'}），
+    然后以一个 text 帧输出合并后的 ```json 代码块，前端按原有方式提取即可，最后是各段合计的 {'usage'}。
+    """
+    usage = usage if usage is not None else Usage(model)
+    system_tokens = estimate_tokens(system_prompt)
+    chunks = split_source(user_input, usage_tracker.chunk_budget(model, system_tokens))
+    gate = asyncio.Semaphore(CHUNK_MAX_CONCURRENCY)
+
+    async def run_chunk(chunk, queue):
+        user_prompt = build_user_prompt(chunk)
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+        tokens = generation_tokens(model, system_tokens, user_prompt, chunk)
+        parts = []
+        try:
+            async with gate:
+                frames = scheduled_generation(api_url, api_key, model, messages, tokens, limiter, use_cache,
+                                              usage.child(), estimate_tokens(chunk))
+                try:
+                    async for frame in frames:
+                        if 'question' in frame:
+                            queue.put_nowait(('question', frame['question']))
+                        elif 'text' in frame:
+                            parts.append(frame['text'] or '')
+                finally:
+                    await frames.aclose()
+            questions = extract_questions(''.join(parts))
+            if questions is None:
+                raise StreamParseError('未能从输出中提取题目')
+            queue.put_nowait(('done', questions))
+        except Exception as e:
+            queue.put_nowait(('error', e))
+
+    queues = [asyncio.Queue() for _ in chunks]
+    tasks = [asyncio.create_task(run_chunk(chunk, queue)) for chunk, queue in zip(chunks, queues)]
+    try:
+        yield {'chunks': len(chunks)}
+        merged = []
+        for i, queue in enumerate(queues):
+            # 当前段解析出的题目立即输出，后面的段在各自的队列中等待
+            streamed = 0
+            while True:
+                kind, payload = await queue.get()
+                if kind == 'question':
+                    yield {'question': payload, 'index': len(merged)}
+                    merged.append(payload)
+                    streamed += 1
+                    continue
+                if kind == 'error':
+                    yield {'chunk': i, 'chunkError': str(payload)}
+                else:
+                    # 增量解析放弃时，补上从完整输出中提取的其余题目
+                    for question in payload[streamed:]:
+                        yield {'question': question, 'index': len(merged)}
+                        merged.append(question)
+                    yield {'chunk': i, 'count': max(streamed, len(payload))}
+                break
+        yield {'text': f"```json\n{json.dumps({'questions': merged}, ensure_ascii=False, indent=2)}\n```"}
+        yield {'usage': usage.to_dict()}
+    finally:
+        # 客户端断开时取消尚未完成的分段
+        for task in tasks:
+            task.cancel()
+
+
+async def scheduled_generation(api_url, api_key, model, messages, tokens, limiter, use_cache=True, usage=None, material_tokens=0):
+    """
+    单个生成任务：命中缓存时直接回放，否则在限速器下请求上游（429/5xx 自动重试）
+
+    参数:
+        tokens: 预计使用的 token 数（见 generation_tokens）
+        material_tokens: 材料的 token 数，用于更新输出比例
+
+    产出 parse_generation 的输出（文本增量与逐题解析结果），最后是 {'usage'}
+    """
+    usage = usage if usage is not None else Usage(model)
+    cached = await lookup_cache(api_url, model, messages) if use_cache else None
+    if cached is not None:
+        # 命中缓存的任务不占用上游并发和限速额度
+        frames = track_generation(parse_generation(replay_cached(cached)), model, 0, usage)
+    else:
+        make_stream = lambda: stream_chat(api_url, api_key, model, messages, use_cache=False, usage=usage)
+        frames = track_generation(parse_generation(stream_with_retry(make_stream, limiter, tokens, usage=usage)),
+                                  model, material_tokens, usage)
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        await frames.aclose()
+
+
+async def generate_batch_stream(api_url, api_key, model, question_types, items, system_prompt_override, directory, use_cache=True):
+    """
+    批量流式生成题目：服务端调度所有输入，结果合并为一路 SSE，每帧带输入 id
+
+    每个输入结束前发送 {'id', 'usage': 该输入的用量}，最后的 {'batchDone': True, 'usage'} 为整批合计，
+    开启 QUESTION_STORE_SAVE_GENERATED 时附带 'stored'（题目保存到题库的结果）。
+
+    参数:
+        items: [{'id': 输入 id, 'userInput': 输入内容}, ...]
+    """
+    limiter = limiter_for(api_url)
+    system_prompt = render_system_prompt(question_types, system_prompt_override, directory)
+    system_tokens = estimate_tokens(system_prompt)
+    budget = usage_tracker.chunk_budget(model, system_tokens)
+    usage = Usage(model)
+    jobs = {}
+    for item in items:
+        if item['id'] in jobs:
+            raise ValueError(f"重复的输入 id: {item['id']}")
+        if needs_chunking(item['userInput'], budget):
+            jobs[item['id']] = chunked_generation(api_url, api_key, model, system_prompt, item['userInput'], limiter,
+                                                  use_cache, usage.child())
+            continue
+        user_prompt = build_user_prompt(item['userInput'])
+        messages = [{'role': 'system', 'content': system_prompt}, {'role': 'user', 'content': user_prompt}]
+        tokens = generation_tokens(model, system_tokens, user_prompt, item['userInput'])
+        jobs[item['id']] = scheduled_generation(api_url, api_key, model, messages, tokens, limiter, use_cache,
+                                                usage.child(), estimate_tokens(item['userInput']))
+
+    generated = []
+    async for job_id, kind, payload in multiplex(jobs):
+        if kind == 'chunk':
+            frame = {'id': job_id, **payload}
+            if QUESTION_STORE_SAVE_GENERATED and 'question' in payload:
+                generated.append(payload['question'])
+        elif kind == 'error':
+            frame = {'id': job_id, 'error': str(payload)}
+        else:
+            frame = {'id': job_id, 'done': True}
+        yield sse_frame(frame)
+    done = {'batchDone': True, 'usage': usage.to_dict()}
+    if generated:
+        done['stored'] = await store_generated(generated)
+    yield sse_frame(done)
+
+
+async def extract_directory(api_url, api_key, model, content, use_cache=True):
     """使用 AI 提取目录结构"""
     user_prompt = f'请根据以下内容提取或生成目录结构：\n\n{content}\n\n请直接输出目录结构，不要有其他说明文字。'
-    return await call_ai_api(api_url, api_key, model, DIRECTORY_EXTRACTION_PROMPT, user_prompt)
+    return await call_ai_api(api_url, api_key, model, DIRECTORY_EXTRACTION_PROMPT, user_prompt, use_cache)
 
 
-async def generate_filename(api_url, api_key, model, content):
+async def generate_filename(api_url, api_key, model, content, use_cache=True):
     """使用 AI 生成文件名"""
     user_prompt = f'请根据以下内容生成一个合适的文件名：\n\n{content}\n\n请直接输出文件名，不要有其他说明文字，不要包含扩展名。'
-    return await call_ai_api(api_url, api_key, model, FILENAME_GENERATION_PROMPT, user_prompt)
+    return await call_ai_api(api_url, api_key, model, FILENAME_GENERATION_PROMPT, user_prompt, use_cache)
 
 
-async def compare_files_stream(api_url, api_key, model, file_a, file_b):
-    """流式对比两份文件"""
+def compare_messages(file_a, file_b):
+    """构造对比审核的消息列表"""
     prompt = COMPARE_PROMPT.replace('{file_a}', file_a).replace('{file_b}', file_b)
+    return [{'role': 'user', 'content': prompt}]
 
-    async with httpx.AsyncClient(timeout=300.0) as client:
-        async with client.stream(
-            'POST',
-            f"{api_url}/chat/completions",
-            headers={'Authorization': f'Bearer {api_key}', 'Content-Type': 'application/json'},
-            json={'model': model, 'messages': [{'role': 'user', 'content': prompt}], 'stream': True}
-        ) as response:
-            async for line in response.aiter_lines():
-                if line.startswith('data: '):
-                    data = line[6:]
-                    if data.strip() == '[DONE]':
-                        break
-                    try:
-                        chunk = json.loads(data)
-                        if 'choices' in chunk and len(chunk['choices']) > 0:
-                            delta = chunk['choices'][0].get('delta', {})
-                            if 'content' in delta:
-                                yield f"data: {json.dumps({'text': delta['content']}, ensure_ascii=False)}\n\n"
-                    except:
-                        pass
+
+async def compare_files_stream(api_url, api_key, model, file_a, file_b, use_cache=True):
+    """流式对比两份文件"""
+    messages = compare_messages(file_a, file_b)
+    async for text in stream_chat(api_url, api_key, model, messages, use_cache):
+        yield sse_frame({'text': text})
+
+
+async def compare_batch_stream(api_url, api_key, model, items, use_cache=True, pre_audit=True):
+    """
+    批量对比审核：并发执行并按上游限速，结果合并为一路 SSE，每帧带输入 id
+
+    pre_audit 为 True 时先做本地预审并发送 {'id', 'audit': 报告}，预审通过的输入
+    不再调用 AI。内容与上次审核相同的输入（audit_results 中有记录，或响应缓存命中）不再请求上游，
+    先发送 {'id', 'unchanged': True} 再回放上次的审核结果；use_cache 为 False 时全部重新审核。
+    最后的 {'batchDone': True, 'usage'} 为整批用量。
+
+    参数:
+        items: [{'id': 输入 id, 'fileA': 生成结果, 'fileB': 原始输入}, ...]
+    """
+    limiter = limiter_for(api_url)
+    usage = Usage(model)
+    jobs = {}
+    keys = {}
+    unchanged = set()
+    seen = set()
+    for item in items:
+        if item['id'] in seen:
+            raise ValueError(f"重复的输入 id: {item['id']}")
+        seen.add(item['id'])
+        if pre_audit:
+            report = audit_pair(item['fileA'], item['fileB'])
+            yield sse_frame({'id': item['id'], 'audit': report})
+            if report['status'] == 'pass':
+                yield sse_frame({'id': item['id'], 'done': True})
+                continue
+        messages = compare_messages(item['fileA'], item['fileB'])
+        keys[item['id']] = key = cache_key(api_url, model, messages)
+        cached = None
+        if use_cache:
+            cached = audit_results.get(key)
+            if cached is None:
+                cached = await lookup_cache(api_url, model, messages)
+        if cached is not None:
+            unchanged.add(item['id'])
+            jobs[item['id']] = replay_cached(cached)
+            continue
+        item_usage = usage.child()
+        make_stream = lambda messages=messages, item_usage=item_usage: stream_chat(
+            api_url, api_key, model, messages, use_cache=False, usage=item_usage)
+        jobs[item['id']] = stream_with_retry(make_stream, limiter, estimate_tokens(messages[0]['content']),
+                                             usage=item_usage)
+
+    for job_id in unchanged:
+        yield sse_frame({'id': job_id, 'unchanged': True})
+    texts = {job_id: [] for job_id in jobs}
+    async for job_id, kind, payload in multiplex(jobs):
+        if kind == 'chunk':
+            frame = {'id': job_id, 'text': payload}
+            if payload:
+                texts[job_id].append(payload)
+        elif kind == 'error':
+            frame = {'id': job_id, 'error': str(payload)}
+        else:
+            frame = {'id': job_id, 'done': True}
+            if texts[job_id]:
+                audit_results.set(keys[job_id], ''.join(texts[job_id]))
+        yield sse_frame(frame)
+    yield sse_frame({'batchDone': True, 'usage': usage.to_dict()})
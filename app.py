@@ -1,84 +1,99 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 from fastapi import FastAPI, Request
-from fastapi.responses import StreamingResponse, FileResponse, HTMLResponse
+from fastapi.responses import StreamingResponse, HTMLResponse, JSONResponse, Response, FileResponse, PlainTextResponse
 from pydantic import BaseModel
-import os
+from typing import List, Optional, Union
+import asyncio
+import sqlite3
 import time
 import json
+import metrics
+from contextlib import asynccontextmanager
 from utils import get_or_create_key
-from ai_service import generate_questions_stream, extract_directory, generate_filename, compare_files_stream
-from excel_service import export_to_excel
-from logger import log_api_call
-from header_utils import get_question_type
-
-app = FastAPI()
+from ai_service import generate_questions_stream, generate_batch_stream, extract_directory, generate_filename, compare_files_stream, compare_batch_stream
+from excel_service import iter_export
+from export_writers import get_writer
+from export_pool import (export_pool, check_export_options, prepare_export, build_export, stream_grouped_zip,
+                         ExportRejected, ExportCancelled)
+from export_jobs import export_jobs
+from log_middleware import RequestLogMiddleware
+from logger import log_api_call, get_recent_logs, start_log_writer, stop_log_writer
+from sample_bank import get_sample_bank
+from prompt_template import estimate_prompt_tokens
+from http_client import close_clients, get_pool_stats
+from provider_router import router
+from usage import usage_tracker
+from response_cache import response_cache, audit_results
+from question_store import get_question_store
+from pre_audit import audit_pair
+from config import EXPORT_DEDUP_MODE
+
+
+@asynccontextmanager
+async def lifespan(app):
+    start_log_writer()
+    export_jobs.start()
+    usage_tracker.start()
+    metrics.start_publisher()
+    # 上游客户端按地址懒创建，应用退出时统一关闭
+    yield
+    await close_clients()
+    await export_jobs.stop()
+    await usage_tracker.stop()
+    await metrics.stop_publisher()
+    export_pool.shutdown()
+    await stop_log_writer()
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(RequestLogMiddleware)
 
+ENCRYPTION_KEY = get_or_create_key()
 
-@app.middleware("http")
-async def log_requests(request: Request, call_next):
-    start_time = time.time()
 
-    # 读取请求体
-    request_body = None
-    if request.method in ["POST", "PUT", "PATCH"]:
-        try:
-            body = await request.body()
-            if body:
-                request_body = json.loads(body.decode())
-                # 隐藏敏感信息
-                if isinstance(request_body, dict) and 'apiKey' in request_body:
-                    request_body = {**request_body, 'apiKey': '***'}
-        except:
-            pass
-
-    # 调用实际的路由处理
-    response = await call_next(request)
-
-    # 计算耗时
-    duration_ms = int((time.time() - start_time) * 1000)
-
-    # 捕获响应体
-    response_body = None
-    if response.headers.get("content-type") == "application/json":
-        from fastapi.responses import Response
-        body_bytes = b""
-        async for chunk in response.body_iterator:
-            body_bytes += chunk
-        try:
-            response_body = json.loads(body_bytes.decode())
-        except:
-            pass
-        response = Response(content=body_bytes, status_code=response.status_code, headers=dict(response.headers), media_type=response.media_type)
-
-    # 记录日志（排除静态文件）
-    if not request.url.path.startswith('/static'):
-        log_api_call(
-            method=request.method,
-            path=request.url.path,
-            status_code=response.status_code,
-            request_body=request_body,
-            response_body=response_body,
-            duration_ms=duration_ms
-        )
+class GenerateRequest(BaseModel):
+    apiUrl: str
+    apiKey: str
+    model: str
+    questionTypes: list
+    userInput: str
+    systemPrompt: str = ""
+    directory: str = ""
+    noCache: bool = False
 
-    return response
 
-ENCRYPTION_KEY = get_or_create_key()
+class BatchInput(BaseModel):
+    id: Union[int, str]
+    userInput: str
 
 
-class GenerateRequest(BaseModel):
+class GenerateBatchRequest(BaseModel):
     apiUrl: str
     apiKey: str
     model: str
     questionTypes: list
-    userInput: str
+    items: List[BatchInput]
     systemPrompt: str = ""
     directory: str = ""
+    noCache: bool = False
+
+
+class PromptEstimateRequest(BaseModel):
+    questionTypes: list
+    userInputs: List[str]
+    systemPrompt: str = ""
+    directory: str = ""
+    model: str = ""
 
 
 class ExportRequest(BaseModel):
     questions: list
+    dedup: str = EXPORT_DEDUP_MODE
+
+
+class StoreRequest(BaseModel):
+    questions: list
 
 
 class AIRequest(BaseModel):
@@ -86,6 +101,7 @@ class AIRequest(BaseModel):
     apiKey: str
     model: str
     content: str
+    noCache: bool = False
 
 
 class CompareRequest(BaseModel):
@@ -94,12 +110,33 @@ class CompareRequest(BaseModel):
     model: str
     fileA: str
     fileB: str
+    noCache: bool = False
+
+
+class CompareInput(BaseModel):
+    id: Union[int, str]
+    fileA: str
+    fileB: str
+
+
+class CompareBatchRequest(BaseModel):
+    apiUrl: str
+    apiKey: str
+    model: str
+    items: List[CompareInput]
+    noCache: bool = False
+    preAudit: bool = True
+
+
+class PreAuditRequest(BaseModel):
+    items: List[CompareInput]
 
 
 async def handle_ai_request(ai_func, req: AIRequest, result_key: str, error_msg: str):
     """通用 AI 请求处理函数"""
     try:
-        result = await ai_func(req.apiUrl, req.apiKey, req.model, req.content)
+        start_time = time.time()
+        result = await ai_func(req.apiUrl, req.apiKey, req.model, req.content, not req.noCache)
         # print(result)
         log_api_call(
             method="POST",
@@ -107,7 +144,7 @@ async def handle_ai_request(ai_func, req: AIRequest, result_key: str, error_msg:
             status_code=200,
             request_body=req.dict(),
             response_body=result,
-            duration_ms=0
+            duration_ms=int((time.time() - start_time) * 1000)
         )
         return {result_key: result} if result else {"error": error_msg}
     except Exception as e:
@@ -125,31 +162,59 @@ async def get_encryption_key():
     return {"key": ENCRYPTION_KEY}
 
 
+@app.get("/metrics")
+async def get_metrics():
+    return PlainTextResponse(await metrics.render_all(), media_type=metrics.CONTENT_TYPE)
+
+
+@app.get("/api/http-pool")
+async def get_http_pool():
+    return get_pool_stats()
+
+
+@app.get("/api/providers")
+async def get_providers():
+    return router.stats()
+
+
+@app.get("/api/usage")
+async def get_usage():
+    try:
+        return await usage_tracker.snapshot()
+    except sqlite3.OperationalError:
+        return JSONResponse({"error": "共享状态繁忙，请稍后重试"}, status_code=503)
+
+
+@app.get("/api/cache-stats")
+async def get_cache_stats():
+    return {**response_cache.stats(), "audit_results": audit_results.stats()}
+
+
+@app.get("/api/logs")
+async def get_logs():
+    return {"logs": await get_recent_logs()}
+
+
 @app.get("/api/system-prompt")
 async def get_system_prompt():
     from utils import load_system_prompt
     return {"systemPrompt": load_system_prompt()}
 
 
+@app.post("/api/prompt-estimate")
+async def prompt_estimate(req: PromptEstimateRequest):
+    return estimate_prompt_tokens(req.questionTypes, req.userInputs, req.systemPrompt, req.directory, req.model)
+
+
 @app.get("/api/question-types")
 async def get_question_types():
-    import json
     try:
-        with open('demo_questions.json', 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            types = []
-            for q in data.get('questions', []):
-                question_type = get_question_type(q)
-                if question_type:
-                    types.append(question_type)
-            # 如果出现重复，添加提示
-            notice_tip = None
-            if len(types) != len(set(types)):
-                same_types = [t for t in types if types.count(t) > 1]
-                notice_tip = f"（重复题型出现！！！可能无法正常匹配！）[{', '.join(same_types)}]"
-            # 去重
-            types = list(set(types))
-            return {"questionTypes": types, "sampleData": data, "noticeTip": notice_tip}
+        bank = get_sample_bank()
+        # 如果出现重复，添加提示
+        notice_tip = None
+        if bank.duplicate_types:
+            notice_tip = f"（重复题型出现！！！可能无法正常匹配！）[{', '.join(bank.duplicate_types)}]"
+        return {"questionTypes": bank.unique_types, "sampleData": bank.data, "noticeTip": notice_tip}
     except Exception as e:
         return {"error": str(e), "questionTypes": [], "sampleData": {}, "noticeTip": None}
 
@@ -158,22 +223,199 @@ async def get_question_types():
 async def generate_questions(req: GenerateRequest):
     async def generate():
         try:
-            async for chunk in generate_questions_stream(req.apiUrl, req.apiKey, req.model, req.questionTypes, req.userInput, req.systemPrompt, req.directory):
+            async for chunk in generate_questions_stream(req.apiUrl, req.apiKey, req.model, req.questionTypes, req.userInput, req.systemPrompt, req.directory, not req.noCache):
                 yield chunk
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(metrics.track_sse('generate', generate()), media_type="text/event-stream")
+
+
+@app.post("/api/generate-batch")
+async def generate_questions_batch(req: GenerateBatchRequest):
+    async def generate():
+        try:
+            items = [item.dict() for item in req.items]
+            async for chunk in generate_batch_stream(req.apiUrl, req.apiKey, req.model, req.questionTypes, items, req.systemPrompt, req.directory, not req.noCache):
+                yield chunk
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+
+    return StreamingResponse(metrics.track_sse('generate-batch', generate()), media_type="text/event-stream")
+
+
+async def send_export(request, writer, questions, dedup, group_by, layout, extra_headers=None):
+    """在导出任务池中去重、分组并生成文件，返回下载响应"""
+    # 去重、分组和生成文件都在导出任务池中执行，不阻塞事件循环
+    start = time.perf_counter()
+    try:
+        if writer.streamable or (group_by and layout == 'files'):
+            questions, flagged, duplicate_count, groups = await export_pool.run(
+                request, len(questions), prepare_export, questions, dedup, group_by)
+        else:
+            buffer, duplicate_count = await export_pool.run(
+                request, len(questions), build_export, writer.name, questions, dedup, group_by)
+    except ExportRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    except ExportCancelled:
+        # 客户端已断开，响应不会被接收
+        return Response(status_code=499)
+
+    headers = {
+        'Content-Disposition': f'attachment; filename="exam_questions.{writer.extension}"',
+        'X-Duplicate-Count': str(duplicate_count),
+        'X-Dedup-Mode': dedup,
+        **(extra_headers or {})
+    }
+    if group_by and layout == 'files':
+        # 每组一个文件，在导出任务池中生成并压缩，写完一组发送一组
+        try:
+            body = stream_grouped_zip(request, groups, writer)
+        except ExportRejected as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        headers['Content-Disposition'] = 'attachment; filename="exam_questions.zip"'
+        body = metrics.track_export_body(body, writer.name, len(questions), start)
+        return StreamingResponse(body, media_type='application/zip', headers=headers)
+    if writer.streamable:
+        # 文本格式边生成边发送，不经过临时文件
+        body = metrics.track_export_body(writer.iter_bytes(questions), writer.name, len(questions), start)
+        return StreamingResponse(body, media_type=writer.media_type, headers=headers)
+
+    metrics.observe_export(writer.name, len(questions), start)
+    headers['Content-Length'] = str(buffer.seek(0, 2))
+    buffer.seek(0)
+    return StreamingResponse(iter_export(buffer), media_type=writer.media_type, headers=headers)
 
 
 @app.post("/api/export")
-async def export_excel(req: ExportRequest):
-    excel_path, json_path = export_to_excel(req.questions)
+async def export_excel(req: ExportRequest, request: Request, format: str = 'xlsx', groupBy: str = '', layout: str = 'sheets'):
     try:
-        return FileResponse(excel_path, filename='exam_questions.xlsx', media_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    finally:
-        if os.path.exists(json_path):
-            os.unlink(json_path)
+        writer = get_writer(format)
+        check_export_options(writer, req.dedup, groupBy, layout)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    return await send_export(request, writer, req.questions, req.dedup, groupBy, layout)
+
+
+@app.post("/api/export/jobs", status_code=202)
+async def create_export_job(req: ExportRequest, format: str = 'xlsx', groupBy: str = '', layout: str = 'sheets'):
+    try:
+        writer = get_writer(format)
+        check_export_options(writer, req.dedup, groupBy, layout)
+        job = await export_jobs.create(export_pool, writer, req.questions, req.dedup, groupBy, layout)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    except ExportRejected as e:
+        return JSONResponse({"error": str(e)}, status_code=e.status_code)
+    return job.info()
+
+
+@app.get("/api/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    job = await export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "导出任务不存在或已过期"}, status_code=404)
+    return job.info()
+
+
+@app.get("/api/export/jobs/{job_id}/download")
+async def download_export_job(job_id: str):
+    job = await export_jobs.get(job_id)
+    if job is None:
+        return JSONResponse({"error": "导出任务不存在或已过期"}, status_code=404)
+    if job.state != 'done':
+        return JSONResponse({"error": f"导出任务尚未完成（{job.state}）"}, status_code=409)
+    # FileResponse 支持 Range 请求，可以断点续传
+    return FileResponse(job.path, media_type=job.media_type, filename=job.filename, headers={'X-Duplicate-Count': str(job.duplicate_count)})
+
+
+@app.delete("/api/export/jobs/{job_id}")
+async def delete_export_job(job_id: str):
+    if not await export_jobs.delete(job_id):
+        return JSONResponse({"error": "导出任务不存在或已过期"}, status_code=404)
+    return {"deleted": job_id}
+
+
+@app.get("/api/export-queue")
+async def get_export_queue():
+    return export_pool.stats()
+
+
+async def in_thread(func, *args, **kwargs):
+    """题库读写（包括首次使用时创建数据库）是同步的 SQLite 操作，放在线程中执行"""
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+@app.get("/api/questions")
+async def query_questions(q: str = '', type: Optional[str] = None, chapter: Optional[str] = None,
+                          difficulty: Optional[str] = None, since: int = 0, limit: int = 0, offset: int = 0):
+    store = await in_thread(get_question_store)
+    filters = {'type': type, 'chapter': chapter, 'difficulty': difficulty}
+    return await in_thread(store.query, q, since, limit, offset, **filters)
+
+
+@app.post("/api/questions")
+async def save_questions(req: StoreRequest):
+    store = await in_thread(get_question_store)
+    try:
+        return await in_thread(store.upsert, req.questions)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+
+@app.get("/api/questions/stats")
+async def get_question_stats():
+    store = await in_thread(get_question_store)
+    return await in_thread(store.stats)
+
+
+@app.delete("/api/questions/{question_hash}")
+async def delete_question(question_hash: str):
+    store = await in_thread(get_question_store)
+    if not await in_thread(store.delete, [question_hash]):
+        return JSONResponse({"error": "题目不存在"}, status_code=404)
+    return {"deleted": question_hash}
+
+
+@app.post("/api/questions/export")
+async def export_stored_questions(request: Request, format: str = 'xlsx', groupBy: str = '', layout: str = 'sheets',
+                                  dedup: str = EXPORT_DEDUP_MODE, cursor: str = '', since: Optional[int] = None,
+                                  background: bool = False, q: str = '', type: Optional[str] = None,
+                                  chapter: Optional[str] = None, difficulty: Optional[str] = None):
+    """
+    从题库导出，不经过浏览器
+
+    since 为空时使用导出游标 cursor 上次导出到的版本（没有游标时导出全部），只导出之后保存或修改过的题目；
+    导出文件生成后（后台任务为创建后）游标前移到当前版本，响应头 X-Store-Since / X-Store-Version
+    为本次导出的版本范围，下载中断时可以用 since 重新导出
+    """
+    try:
+        writer = get_writer(format)
+        check_export_options(writer, dedup, groupBy, layout)
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+    store = await in_thread(get_question_store)
+    if since is None:
+        since = await in_thread(store.cursor, cursor) if cursor else 0
+    filters = {'type': type, 'chapter': chapter, 'difficulty': difficulty}
+    questions, deleted, version = await in_thread(store.changes, since, q, **filters)
+    headers = {'X-Store-Since': str(since), 'X-Store-Version': str(version), 'X-Deleted-Count': str(len(deleted))}
+
+    if not questions:
+        response = Response(status_code=204, headers=headers)
+    elif background:
+        try:
+            job = await export_jobs.create(export_pool, writer, questions, dedup, groupBy, layout)
+        except ExportRejected as e:
+            return JSONResponse({"error": str(e)}, status_code=e.status_code)
+        response = JSONResponse({**job.info(), 'storeSince': since, 'storeVersion': version}, status_code=202)
+    else:
+        response = await send_export(request, writer, questions, dedup, groupBy, layout, headers)
+        if response.status_code != 200:
+            return response
+    if cursor:
+        await in_thread(store.move_cursor, cursor, version)
+    return response
 
 
 @app.post("/api/extract-directory")
@@ -190,24 +432,32 @@ async def generate_filename_endpoint(req: AIRequest):
 async def compare_files(req: CompareRequest):
     async def generate():
         try:
-            async for chunk in compare_files_stream(req.apiUrl, req.apiKey, req.model, req.fileA, req.fileB):
+            async for chunk in compare_files_stream(req.apiUrl, req.apiKey, req.model, req.fileA, req.fileB, not req.noCache):
                 yield chunk
         except Exception as e:
             yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
-    return StreamingResponse(generate(), media_type="text/event-stream")
+    return StreamingResponse(metrics.track_sse('compare', generate()), media_type="text/event-stream")
 
 
-if __name__ == '__main__':
-    import sys
+@app.post("/api/compare-batch")
+async def compare_files_batch(req: CompareBatchRequest):
+    async def generate():
+        try:
+            items = [item.dict() for item in req.items]
+            async for chunk in compare_batch_stream(req.apiUrl, req.apiKey, req.model, items, not req.noCache, req.preAudit):
+                yield chunk
+        except Exception as e:
+            yield f"data: {json.dumps({'error': str(e)})}\n\n"
 
-    # 检查是否使用 hypercorn（支持 HTTP/2）
-    if '--http2' in sys.argv:
-        print("启动 HTTP/2 服务器（支持无限并发连接）...")
-        import os
-        os.system('hypercorn app:app --bind 0.0.0.0:8111')
-    else:
-        print("启动 HTTP/1.1 服务器（最多 6 个并发连接）...")
-        print("提示：使用 'python app.py --http2' 启用 HTTP/2 支持")
-        import uvicorn
-        uvicorn.run(app, host='127.0.0.1', port=8111)
+    return StreamingResponse(metrics.track_sse('compare-batch', generate()), media_type="text/event-stream")
+
+
+@app.post("/api/pre-audit")
+async def pre_audit_endpoint(req: PreAuditRequest):
+    return {"reports": [{"id": item.id, **audit_pair(item.fileA, item.fileB)} for item in req.items]}
+
+
+if __name__ == '__main__':
+    from server import main
+    main()
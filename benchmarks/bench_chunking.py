@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+大段材料分段生成测试：500 道题的合成材料，对比单次生成与切分并发生成的
+总耗时、首题耗时和最终得到的题目数。
+
+模拟接口默认有单次输出上限，单次生成会被截断；另起一个不限输出的模拟接口，
+给出单次生成完整输出所需的时间作为参照。
+
+用法:
+    python benchmarks/bench_chunking.py
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+import ai_service
+from stream_parser import extract_questions
+from chunker import split_source
+
+QUESTION_COUNT = 500
+PORT = 9911
+UNCAPPED_PORT = 9912
+
+
+def make_source(count):
+    """合成材料：每行一道题"""
+    return '\n'.join(f'{i + 1}. 下列关于第{i + 1}个知识点的说法中，哪一项是正确的？' for i in range(count))
+
+
+def wait_for_port(port, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        with socket.socket() as sock:
+            if sock.connect_ex(('127.0.0.1', port)) == 0:
+                return
+        time.sleep(0.1)
+    raise RuntimeError('模拟接口启动超时')
+
+
+async def run(source, chunked, port):
+    ai_service.CHUNK_ENABLED = chunked
+    start = time.perf_counter()
+    first_question = None
+    text = ''
+    errors = []
+    async for frame in ai_service.generate_questions_stream(f'http://127.0.0.1:{port}/v1', 'test-key', 'mock-model', ['单选题'], source, '', '', use_cache=False):
+        data = json.loads(frame[len('data: '):])
+        if 'question' in data and first_question is None:
+            first_question = time.perf_counter() - start
+        elif 'chunkError' in data:
+            errors.append(data['chunkError'])
+        elif 'text' in data:
+            text += data['text'] or ''
+    elapsed = time.perf_counter() - start
+    questions = extract_questions(text) or []
+    return elapsed, first_question, len(questions), errors
+
+
+async def main():
+    source = make_source(QUESTION_COUNT)
+    print(f'材料: {QUESTION_COUNT} 道题, {len(source)} 字符, 切分为 {len(split_source(source))} 段')
+    print(f"{'模式':<12}{'总耗时(s)':>12}{'首题(s)':>10}{'题目数':>8}")
+    for label, chunked, port in (('单次', False, PORT), ('单次(不截断)', False, UNCAPPED_PORT), ('分段', True, PORT)):
+        elapsed, first, count, errors = await run(source, chunked, port)
+        first_text = f'{first:.2f}' if first is not None else '-'
+        print(f'{label:<12}{elapsed:>12.2f}{first_text:>10}{count:>8}')
+        for error in errors:
+            print(f'  分段失败: {error}')
+
+
+if __name__ == '__main__':
+    script = os.path.join(os.path.dirname(__file__), 'mock_openai.py')
+    mocks = [
+        subprocess.Popen([sys.executable, script, '--port', str(PORT)]),
+        subprocess.Popen([sys.executable, script, '--port', str(UNCAPPED_PORT), '--max-output', str(10 ** 9)]),
+    ]
+    try:
+        wait_for_port(PORT)
+        wait_for_port(UNCAPPED_PORT)
+        asyncio.run(main())
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Excel 导出基准测试：对比旧流程（临时 JSON + 普通工作簿 + 临时 xlsx）与
+只写模式流式导出在 1k/10k/100k 题目下的耗时和峰值内存。
+
+每个用例在独立子进程中运行，保证峰值内存互不影响。
+
+用法:
+    python benchmarks/bench_export.py [题目数 ...]
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from common import make_questions, peak_rss_mb
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def run_legacy(questions):
+    """旧流程：写入临时 JSON，再读回并用普通工作簿生成 xlsx 文件"""
+    from openpyxl import Workbook
+    from openpyxl.styles import Font, Alignment, Border, Side
+    from generate_excel import load_json_data, SHEET_TITLE
+    from header_utils import HEADERS, match_header
+
+    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
+        json.dump({'questions': questions}, f, ensure_ascii=False, indent=2)
+        json_path = f.name
+    excel_path = json_path[:-5] + '.xlsx'
+    try:
+        data = load_json_data(json_path)
+        wb = Workbook()
+        ws = wb.active
+        ws.title = SHEET_TITLE
+        thin = Side(style='thin')
+        for col_idx, header in enumerate(HEADERS, 1):
+            ws.cell(row=1, column=col_idx, value=header)
+        for row_idx, question in enumerate(data['questions'], 2):
+            for col_idx, header in enumerate(HEADERS, 1):
+                cell = ws.cell(row=row_idx, column=col_idx)
+                cell.value = match_header(header, question)
+                cell.font = Font(name='宋体', size=11)
+                cell.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
+                cell.border = Border(left=thin, right=thin, top=thin, bottom=thin)
+            ws.row_dimensions[row_idx].height = 30
+        wb.save(excel_path)
+        return os.path.getsize(excel_path)
+    finally:
+        os.unlink(json_path)
+        if os.path.exists(excel_path):
+            os.unlink(excel_path)
+
+
+def run_streaming(questions):
+    """新流程：只写模式写入内存/溢出缓冲区"""
+    from excel_service import export_to_excel, iter_export
+    buffer = export_to_excel(questions)
+    return sum(len(chunk) for chunk in iter_export(buffer))
+
+
+def child(mode, count):
+    """子进程入口：生成数据、执行导出并输出 JSON 结果"""
+    questions = make_questions(count)
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    size = run_legacy(questions) if mode == 'legacy' else run_streaming(questions)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'base_rss_mb': base_rss, 'bytes': size}))
+
+
+def main(sizes):
+    print(f"{'题目数':>8} {'模式':>10} {'耗时(s)':>10} {'峰值RSS(MB)':>12} {'导出增量(MB)':>12} {'文件(KB)':>10}")
+    for count in sizes:
+        for mode in ('legacy', 'streaming'):
+            output = subprocess.check_output([sys.executable, __file__, '--child', mode, str(count)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{count:>8} {mode:>10} {result['seconds']:>10.2f} {result['peak_rss_mb']:>12.1f} "
+                  f"{result['peak_rss_mb'] - result['base_rss_mb']:>12.1f} {result['bytes'] / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
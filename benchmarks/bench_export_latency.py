@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+导出对流式接口的影响：几路生成请求（经模拟接口）正在流式输出时，同一事件循环上
+导出 10000 道题的 Excel，统计流式帧间隔。
+
+- 无导出:   参照
+- 事件循环: 在事件循环上直接生成文件（改为导出任务池之前的做法）
+- 线程池:   ExportPool('thread')
+- 进程池:   ExportPool('process')
+
+用法:
+    python benchmarks/bench_export_latency.py [题目数] [并发流数]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from common import make_questions
+import ai_service
+from export_pool import ExportPool, build_export
+from bench_chunking import wait_for_port
+
+DEFAULT_COUNT = 10000
+DEFAULT_STREAMS = 4
+PORT = 9913
+STREAM_QUESTIONS = 120   # 每路生成的题目数，输出持续时间需长于导出耗时
+EXPORT_DELAY = 1.0       # 流开始后多久发起导出
+
+
+def make_source(count):
+    return '\n'.join(f'{i + 1}. 关于第{i + 1}个知识点的说法中，正确的是？' for i in range(count))
+
+
+async def consume(source, gaps):
+    """消费一路生成流，记录相邻两帧的间隔（毫秒）"""
+    last = None
+    async for _ in ai_service.generate_questions_stream(f'http://127.0.0.1:{PORT}/v1', 'test-key', 'mock-model', ['单选题'], source, '', '', use_cache=False):
+        now = time.perf_counter()
+        if last is not None:
+            gaps.append((now - last) * 1000)
+        last = now
+
+
+async def export(mode, questions):
+    await asyncio.sleep(EXPORT_DELAY)
+    start = time.perf_counter()
+    if mode == 'inline':
+        buffer, _ = build_export('xlsx', questions, 'flag', '')
+    else:
+        pool = ExportPool(mode=mode)
+        try:
+            buffer, _ = await pool.run(None, len(questions), build_export, 'xlsx', questions, 'flag', '')
+        finally:
+            pool.shutdown()
+    buffer.close()
+    return time.perf_counter() - start
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+async def run(mode, questions, streams):
+    source = make_source(STREAM_QUESTIONS)
+    gaps = []
+    tasks = [consume(source, gaps) for _ in range(streams)]
+    if mode is not None:
+        tasks.append(export(mode, questions))
+    results = await asyncio.gather(*tasks)
+    elapsed = results[-1] if mode is not None else None
+    return elapsed, gaps
+
+
+async def main(count, streams):
+    ai_service.CHUNK_ENABLED = False
+    questions = make_questions(count)
+    print(f'{streams} 路流式生成，同时导出 {count} 道题（xlsx）')
+    print(f"{'模式':<10}{'导出(s)':>10}{'帧数':>8}{'p50(ms)':>10}{'p99(ms)':>10}{'最大(ms)':>10}")
+    for label, mode in (('无导出', None), ('事件循环', 'inline'), ('线程池', 'thread'), ('进程池', 'process')):
+        elapsed, gaps = await run(mode, questions, streams)
+        elapsed_text = f'{elapsed:.2f}' if elapsed is not None else '-'
+        print(f'{label:<10}{elapsed_text:>10}{len(gaps):>8}{percentile(gaps, 0.5):>10.1f}'
+              f'{percentile(gaps, 0.99):>10.1f}{max(gaps):>10.1f}')
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+    streams = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_STREAMS
+    script = os.path.join(os.path.dirname(__file__), 'mock_openai.py')
+    mock = subprocess.Popen([sys.executable, script, '--port', str(PORT), '--ttft', '0.1',
+                             '--delta-delay', '0.01', '--max-output', str(10 ** 9)])
+    try:
+        wait_for_port(PORT)
+        asyncio.run(main(count, streams))
+    finally:
+        mock.terminate()
+        mock.wait()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+导出格式吞吐量测试：各个 writer 在不同题目数下的耗时、每秒题数、导出增量内存和文件大小。
+
+每个用例在独立子进程中运行，保证峰值内存互不影响；可流式输出的格式按
+iter_bytes 逐块消费，不保留完整结果。
+
+用法:
+    python benchmarks/bench_formats.py [题目数 ...]
+"""
+import json
+import subprocess
+import sys
+import time
+
+from common import make_questions, peak_rss_mb
+
+DEFAULT_SIZES = [10000, 100000]
+
+
+def child(name, count):
+    """子进程入口：生成数据、执行导出并输出 JSON 结果"""
+    from excel_service import export_to_excel, iter_export
+    from export_writers import WRITERS
+    writer = WRITERS[name]
+    questions = make_questions(count)
+    base_rss = peak_rss_mb()
+    start = time.perf_counter()
+    if writer.streamable:
+        size = sum(len(chunk) for chunk in writer.iter_bytes(questions))
+    else:
+        size = sum(len(chunk) for chunk in iter_export(export_to_excel(questions, writer=writer)))
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'base_rss_mb': base_rss, 'bytes': size}))
+
+
+def main(sizes):
+    from export_writers import WRITERS, PYARROW_AVAILABLE
+    names = [name for name in WRITERS if name != 'parquet' or PYARROW_AVAILABLE]
+    print(f"{'题目数':>8} {'格式':>10} {'耗时(s)':>10} {'题/秒':>10} {'导出增量(MB)':>12} {'文件(KB)':>10}")
+    for count in sizes:
+        for name in names:
+            output = subprocess.check_output([sys.executable, __file__, '--child', name, str(count)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{count:>8} {name:>10} {result['seconds']:>10.2f} {count / result['seconds']:>10.0f} "
+                  f"{result['peak_rss_mb'] - result['base_rss_mb']:>12.1f} {result['bytes'] / 1024:>10.0f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
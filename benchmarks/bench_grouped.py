@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分组导出测试：按章节分组后每组一个文件打包为 zip（每组是导出任务池中的一个任务），
+对比任务池为线程模式（受 GIL 限制）与进程模式（使用全部 CPU 核心）的总耗时和首字节耗时，
+并给出不分组导出单个文件的耗时作参照。
+
+用法:
+    python benchmarks/bench_grouped.py [题目数] [章节数]
+"""
+import asyncio
+import io
+import os
+import sys
+import time
+import zipfile
+
+from common import make_questions
+from excel_service import export_to_excel, iter_export
+from export_pool import ExportPool, stream_grouped_zip
+from export_writers import WRITERS
+from grouped_export import group_questions
+
+DEFAULT_COUNT = 50000
+DEFAULT_CHAPTERS = 16
+
+
+async def run_zip(pool, groups, writer):
+    start = time.perf_counter()
+    first_byte = None
+    output = io.BytesIO()
+    async for chunk in stream_grouped_zip(None, groups, writer, pool):
+        if chunk and first_byte is None:
+            first_byte = time.perf_counter() - start
+        output.write(chunk)
+    elapsed = time.perf_counter() - start
+    assert zipfile.ZipFile(output).testzip() is None
+    return elapsed, first_byte
+
+
+def main(count, chapters):
+    questions = make_questions(count)
+    for i, question in enumerate(questions):
+        question['章节（勿删）'] = f'第{i % chapters + 1}章'
+    groups = group_questions(questions, 'chapter')
+    workers = os.cpu_count() or 1
+    pools = {mode: ExportPool(mode=name, workers=workers, max_questions=count)
+             for mode, name in (('线程', 'thread'), ('进程', 'process'))}
+    print(f'{count} 道题，{len(groups)} 个章节')
+    print(f"{'格式':>10} {'方式':>10} {'总耗时(s)':>10} {'首字节(s)':>10}")
+
+    for name in ('xlsx', 'xlsx-fast'):
+        writer = WRITERS[name]
+        start = time.perf_counter()
+        for _ in iter_export(export_to_excel(questions, writer=writer)):
+            pass
+        print(f"{name:>10} {'单文件':>10} {time.perf_counter() - start:>10.2f} {'-':>10}")
+
+        for mode, pool in pools.items():
+            elapsed, first_byte = asyncio.run(run_zip(pool, groups, writer))
+            print(f'{name:>10} {mode:>10} {elapsed:>10.2f} {first_byte:>10.2f}')
+    for pool in pools.values():
+        pool.shutdown()
+
+
+if __name__ == '__main__':
+    args = [int(arg) for arg in sys.argv[1:]]
+    main(*(args + [DEFAULT_COUNT, DEFAULT_CHAPTERS][len(args):]))
@@ -0,0 +1,65 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+表头匹配微基准：逐单元格调用 match_header（原实现）与 HeaderResolver 整行解析对比，
+并校验两者结果完全一致。
+
+用法:
+    python benchmarks/bench_header.py [题目数]
+"""
+import sys
+import time
+
+from common import make_questions
+from header_utils import HEADERS, HEADER_MAPPING, HeaderResolver, match_header
+
+
+def legacy_match_header(header, question):
+    """原 match_header 实现（每次调用都重新归一化表头）"""
+    target = header.replace('\n', '')
+    for key, value in HEADER_MAPPING.items():
+        if key in target:
+            target = key
+            break
+    for key, value in question.items():
+        if target in key:
+            return value
+    return None
+
+
+def variant_questions(questions):
+    """为部分题目换用其他键写法，覆盖 "选项H(勿删)" / "选项H\\n(勿删)" 等情况"""
+    renames = [
+        {'选项H(勿删)': '选项H\n(勿删)', '正确答案（必填）': '正确答案'},
+        {'选项 A': '选项A', '解析（勿删）': '解析\n（勿删）'},
+    ]
+    result = []
+    for i, question in enumerate(questions):
+        mapping = renames[i % 3] if i % 3 < len(renames) else {}
+        result.append({mapping.get(key, key): value for key, value in question.items()})
+    return result
+
+
+def bench(name, func, questions):
+    start = time.perf_counter()
+    rows = func(questions)
+    elapsed = time.perf_counter() - start
+    print(f"{name:<28} {elapsed * 1000:>10.1f} ms  {len(questions) / elapsed:>12.0f} 行/秒")
+    return rows, elapsed
+
+
+def main(count):
+    questions = variant_questions(make_questions(count))
+    print(f"题目数: {count}，列数: {len(HEADERS)}")
+
+    legacy_rows, legacy = bench('legacy match_header', lambda qs: [[legacy_match_header(h, q) for h in HEADERS] for q in qs], questions)
+    cached_rows, _ = bench('match_header (缓存表头)', lambda qs: [[match_header(h, q) for h in HEADERS] for q in qs], questions)
+    resolver = HeaderResolver(HEADERS)
+    resolver_rows, fast = bench('HeaderResolver.resolve', lambda qs: [resolver.resolve(q) for q in qs], questions)
+
+    assert legacy_rows == cached_rows == resolver_rows, '解析结果与原实现不一致'
+    print(f"结果一致，加速比 {legacy / fast:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
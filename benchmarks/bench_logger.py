@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+日志写入负载测试：对比旧的"读取整个 JSON 数组-插入-重写"与后台队列写入，
+在不同日志体积下 200 个并发请求中 log_api_call 的耗时分布，并校验日志没有丢失。
+
+用法:
+    python benchmarks/bench_logger.py
+"""
+import asyncio
+import contextlib
+import io
+import json
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+import logger
+
+PAYLOAD_SIZES = [1024, 64 * 1024, 512 * 1024]
+CONCURRENCY = 200
+
+
+def legacy_log(log_file, entry):
+    """旧实现：每次调用都读取并重写整个日志文件"""
+    logs = []
+    if log_file.exists():
+        with open(log_file, 'r', encoding='utf-8') as f:
+            logs = json.load(f)
+    logs.insert(0, entry)
+    logs = logs[:logger.MAX_ENTRIES]
+    with open(log_file, 'w', encoding='utf-8') as f:
+        json.dump(logs, f, ensure_ascii=False, indent=2)
+
+
+async def run(mode, payload_size, log_dir):
+    payload = {'fileA': '题' * (payload_size // 3)}
+    log_file = log_dir / 'api.log'
+    logger.LOG_DIR, logger.LOG_FILE = log_dir, log_file
+
+    # 预先写满 MAX_ENTRIES 条日志
+    for _ in range(logger.MAX_ENTRIES):
+        legacy_log(log_file, {'request': payload})
+    if mode == 'queue':
+        log_file.unlink()
+        logger.start_log_writer()
+
+    async def request():
+        await asyncio.sleep(0)
+        start = time.perf_counter()
+        if mode == 'legacy':
+            legacy_log(log_file, {'request': payload})
+        else:
+            logger.log_api_call('POST', '/api/compare', 200, request_body=payload)
+        return (time.perf_counter() - start) * 1000
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        latencies = sorted(await asyncio.gather(*(request() for _ in range(CONCURRENCY))))
+    if mode == 'queue':
+        await logger.stop_log_writer()
+        with open(log_file, 'r', encoding='utf-8') as f:
+            written = sum(1 for _ in f)
+        assert written == CONCURRENCY, f'日志丢失：写入 {written} / {CONCURRENCY}'
+
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(f"{payload_size // 1024:>8}KB {mode:>8} {statistics.median(latencies):>10.3f} {p99:>10.3f} {max(latencies):>10.3f}")
+
+
+async def main():
+    print(f"{'单条大小':>8} {'模式':>8} {'p50(ms)':>10} {'p99(ms)':>10} {'max(ms)':>10}")
+    for size in PAYLOAD_SIZES:
+        for mode in ('legacy', 'queue'):
+            with tempfile.TemporaryDirectory() as tmp:
+                await run(mode, size, Path(tmp))
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+指标开销测试：每个上游文本增量的记录开销（StreamTimer.delta），以及
+标签组合较多时渲染 /metrics 的耗时。
+
+用法:
+    python benchmarks/bench_metrics.py
+"""
+import time
+
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+import metrics
+
+DELTAS = 1000000
+SERIES = 200
+
+
+def main():
+    timer = metrics.StreamTimer('bench-model', 'http://127.0.0.1:9911/v1')
+    start = time.perf_counter()
+    for _ in range(DELTAS):
+        timer.delta('题')
+    per_delta = (time.perf_counter() - start) / DELTAS
+    timer.finish(True)
+
+    start = time.perf_counter()
+    for _ in range(DELTAS):
+        pass
+    baseline = (time.perf_counter() - start) / DELTAS
+    print(f'每个增量的记录开销: {(per_delta - baseline) * 1e9:.0f} ns（{DELTAS} 次）')
+
+    for i in range(SERIES):
+        timer = metrics.StreamTimer(f'model-{i % 20}', f'http://upstream-{i // 20}/v1')
+        timer.delta('a')
+        timer.delta('b')
+        timer.finish(True)
+    start = time.perf_counter()
+    text = metrics.render()
+    elapsed = time.perf_counter() - start
+    print(f'渲染 /metrics: {len(text.splitlines())} 行, {len(text) / 1024:.0f} KB, {elapsed * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,40 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地预审耗时：不同题目数下 audit_pair 的单次耗时，以及预审结果的分布。
+
+用法:
+    python benchmarks/bench_pre_audit.py
+"""
+import json
+import statistics
+import time
+
+from common import make_questions
+from header_utils import HEADER_MAPPING, match_header
+from pre_audit import audit_pair
+
+SIZES = [10, 100, 1000]
+ROUNDS = 20
+
+
+def make_pair(count):
+    questions = make_questions(count)
+    source = '\n'.join(f'{i + 1}. {match_header(HEADER_MAPPING["题干"], q)}' for i, q in enumerate(questions))
+    return json.dumps({'questions': questions}, ensure_ascii=False), source
+
+
+def main():
+    print(f"{'题目数':>8}{'p50(ms)':>10}{'max(ms)':>10}  结果")
+    for size in SIZES:
+        generated, source = make_pair(size)
+        timings = []
+        for _ in range(ROUNDS):
+            start = time.perf_counter()
+            report = audit_pair(generated, source)
+            timings.append((time.perf_counter() - start) * 1000)
+        print(f'{size:>8}{statistics.median(timings):>10.2f}{max(timings):>10.2f}  {report["status"]} ({len(report["issues"])} 个问题)')
+
+
+if __name__ == '__main__':
+    main()
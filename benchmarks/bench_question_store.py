@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务端题库：题库中已有 N 道题，每轮新增或修改 CHANGES 道后导出。
+
+- 全量导出:  每轮把整个题库交给 build_export 重新生成 xlsx（原做法，题目由浏览器提交）
+- 增量导出:  保存到 QuestionStore 后只导出导出游标之后变化的题目
+
+另外对比查询：按题型和章节筛选、按题干关键词检索，与在内存列表中逐题匹配的耗时。
+
+用法:
+    python benchmarks/bench_question_store.py [题目数] [每轮变化数] [轮数]
+"""
+import os
+import sys
+import tempfile
+import time
+
+from common import make_questions
+from export_pool import build_export
+from question_store import QuestionStore
+
+DEFAULT_COUNT = 20000
+DEFAULT_CHANGES = 200
+DEFAULT_ROUNDS = 3
+CHAPTERS = 16
+DIFFICULTIES = ('易', '中', '难')
+QUERY_REPEAT = 20
+
+
+def make_bank(count):
+    questions = make_questions(count)
+    for i, question in enumerate(questions):
+        question['章节（勿删）'] = f'第{i % CHAPTERS + 1}单元'
+        question['难度'] = DIFFICULTIES[i % len(DIFFICULTIES)]
+    return questions
+
+
+def change_round(bank, number, changes):
+    """一半修改已有题目的解析，一半新增题目，返回变化的题目"""
+    changed = []
+    for i in range(changes // 2):
+        index = (number * changes + i * 7) % len(bank)
+        bank[index] = dict(bank[index], **{'解析（勿删）': f'第{number}轮修改的解析'})
+        changed.append(bank[index])
+    added = make_bank(len(bank) + changes - len(changed))[len(bank):]
+    bank.extend(added)
+    return changed + added
+
+
+def export_seconds(questions):
+    start = time.perf_counter()
+    buffer, _ = build_export('xlsx', questions, 'off', '')
+    buffer.close()
+    return time.perf_counter() - start
+
+
+def timed(func, repeat=QUERY_REPEAT):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func()
+    return (time.perf_counter() - start) / repeat * 1000, result
+
+
+def compare_queries(store, bank):
+    print(f"\n{'查询':<22}{'内存列表(ms)':>14}{'题库(ms)':>12}{'结果数':>8}")
+    cases = [
+        ('题型 + 章节', lambda q: q['题型 （必填）'] == '单选题' and q['章节（勿删）'] == '第3单元',
+         lambda: store.query(type='单选题', chapter='第3单元', limit=1)),
+        ('难度', lambda q: q['难度'] == '难', lambda: store.query(difficulty='难', limit=1)),
+        ('题干关键词（三字以上）', lambda q: '第12345题' in q['题干（必填）'], lambda: store.query('第12345题', limit=1)),
+    ]
+    for label, match, query in cases:
+        scan_ms, _ = timed(lambda: [q for q in bank if match(q)])
+        store_ms, result = timed(query)
+        print(f'{label:<22}{scan_ms:>14.2f}{store_ms:>12.2f}{result["total"]:>8}')
+
+
+def main(count, changes, rounds):
+    bank = make_bank(count)
+    with tempfile.TemporaryDirectory() as directory:
+        store = QuestionStore(os.path.join(directory, 'questions.sqlite3'))
+        start = time.perf_counter()
+        store.upsert(bank)
+        print(f'题库 {count} 道题，写入耗时 {time.perf_counter() - start:.2f}s，全文检索: {store.fts}')
+        store.move_cursor('bench', store.version())
+
+        print(f"\n{'轮次':<6}{'全量题数':>10}{'全量(s)':>10}{'增量题数':>10}{'保存(s)':>10}{'增量导出(s)':>12}")
+        for number in range(1, rounds + 1):
+            changed = change_round(bank, number, changes)
+            full = export_seconds(bank)
+
+            start = time.perf_counter()
+            store.upsert(changed)
+            saved = time.perf_counter() - start
+            start = time.perf_counter()
+            questions, _, version = store.changes(store.cursor('bench'))
+            export_seconds(questions)
+            incremental = time.perf_counter() - start
+            store.move_cursor('bench', version)
+            print(f'{number:<6}{len(bank):>10}{full:>10.2f}{len(questions):>10}{saved:>10.3f}{incremental:>12.3f}')
+
+        compare_queries(store, bank)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_COUNT
+    changes = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_CHANGES
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else DEFAULT_ROUNDS
+    main(count, changes, rounds)
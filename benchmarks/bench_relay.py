@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式转发的 CPU 开销：多个客户端同时请求 /api/compare（经模拟接口，每个增量 1 个字符，
+近似 1 个 token），统计服务进程消耗的 CPU 时间，换算为每转发 100 万个 token 的 CPU 秒数。
+
+- 原做法:   标准库 json 解析和生成帧，逐个增量转发
+- orjson:   只换用更快的 JSON 编解码（未安装 orjson 时与原做法相同）
+- 合并:     只合并 RELAY_COALESCE_WINDOW 内到达的增量
+- 两者:     当前默认配置
+
+服务、模拟接口和客户端分别运行在单独的进程中，只统计服务进程（读取上游、解析、
+生成帧、写给客户端）的 CPU 时间。
+
+用法:
+    python benchmarks/bench_relay.py [并发流数] [每路题目数]
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+from config import RELAY_COALESCE_WINDOW
+from bench_chunking import wait_for_port
+
+DEFAULT_STREAMS = 8
+DEFAULT_QUESTIONS = 300   # 每道题约 100 个字符
+MOCK_PORT = 9914
+SERVER_PORT = 9915
+CONFIGS = (('原做法', False, 0), ('orjson', True, 0),
+           ('合并', False, RELAY_COALESCE_WINDOW), ('两者', True, RELAY_COALESCE_WINDOW))
+
+
+def serve(fast_codec, window):
+    """服务进程：按配置修改转发方式，增加 /bench/cpu 接口返回本进程的 CPU 时间"""
+    import uvicorn
+    import ai_service
+    import app
+
+    if not fast_codec:
+        ai_service.loads = json.loads
+        ai_service.sse_frame = lambda obj: f"data: {json.dumps(obj, ensure_ascii=False)}\n\n"
+    ai_service.RELAY_COALESCE_WINDOW = window
+    app.app.add_api_route('/bench/cpu', lambda: time.process_time())
+    uvicorn.run(app.app, host='127.0.0.1', port=SERVER_PORT, log_level='warning')
+
+
+async def consume(client, source, counts):
+    body = {'apiUrl': f'http://127.0.0.1:{MOCK_PORT}/v1', 'apiKey': 'test-key', 'model': 'mock-model',
+            'fileA': source, 'fileB': source, 'noCache': True}
+    async with client.stream('POST', '/api/compare', json=body) as response:
+        async for line in response.aiter_lines():
+            if line.startswith('data: '):
+                counts['frames'] += 1
+                counts['tokens'] += len(json.loads(line[6:]).get('text', ''))
+
+
+async def measure(streams, source):
+    counts = {'frames': 0, 'tokens': 0}
+    async with httpx.AsyncClient(base_url=f'http://127.0.0.1:{SERVER_PORT}', timeout=None) as client:
+        await consume(client, '1. 预热', counts)
+        counts.update(frames=0, tokens=0)
+        cpu = (await client.get('/bench/cpu')).json()
+        wall = time.perf_counter()
+        await asyncio.gather(*(consume(client, source, counts) for _ in range(streams)))
+        wall = time.perf_counter() - wall
+        cpu = (await client.get('/bench/cpu')).json() - cpu
+    return cpu, wall, counts
+
+
+def main(streams, questions):
+    source = '\n'.join(f'{i + 1}. 关于第{i + 1}个知识点的说法中，正确的是？' for i in range(questions))
+    print(f'{streams} 路并发转发，合并窗口 {RELAY_COALESCE_WINDOW * 1000:.0f} ms')
+    print(f"{'方式':<10}{'token数':>10}{'帧数':>10}{'耗时(s)':>10}{'CPU(s)':>10}{'CPU(s)/百万token':>18}")
+    for label, fast_codec, window in CONFIGS:
+        server = subprocess.Popen([sys.executable, __file__, '--serve', str(int(fast_codec)), str(window)])
+        try:
+            wait_for_port(SERVER_PORT)
+            cpu, wall, counts = asyncio.run(measure(streams, source))
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"{label:<10}{counts['tokens']:>10}{counts['frames']:>10}{wall:>10.2f}{cpu:>10.2f}"
+              f"{cpu / counts['tokens'] * 1e6:>18.1f}")
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--serve']:
+        serve(sys.argv[2] == '1', float(sys.argv[3]))
+        sys.exit()
+    streams = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_STREAMS
+    questions = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_QUESTIONS
+    script = os.path.join(os.path.dirname(__file__), 'mock_openai.py')
+    mock = subprocess.Popen([sys.executable, script, '--port', str(MOCK_PORT), '--ttft', '0',
+                             '--delta-chars', '1', '--delta-delay', '0.002', '--max-output', str(10 ** 9)])
+    try:
+        wait_for_port(MOCK_PORT)
+        main(streams, questions)
+    finally:
+        mock.terminate()
+        mock.wait()
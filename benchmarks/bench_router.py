@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上游池的选择、对冲和切换：两个模拟接口（A 首包 0.2s，B 首包 0.5s），分多轮并发发出流式请求，
+第 2 轮开始 A 变慢（首包 6s），第 4 轮开始 A 恢复首包时间但全部返回 503、第 7 轮恢复正常。
+
+- 固定 A:  所有请求直接发往 A（原做法，请求中填写的单个上游地址）
+- 上游池:  通过 ProviderRouter 在 A、B 之间选择
+
+输出每轮的平均 / 最大首包时间和失败数，以及各上游收到的请求数。
+
+用法:
+    python benchmarks/bench_router.py [每轮请求数]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+import provider_router
+from ai_service import stream_chat_deltas
+from bench_chunking import wait_for_port
+from http_client import close_clients
+from provider_router import ProviderRouter
+
+DEFAULT_REQUESTS = 8
+PORTS = {'A': 9921, 'B': 9922}
+TTFT = {'A': 0.2, 'B': 0.5}
+HEDGE_DELAY = 1.0
+# 每轮开始前修改 A 的设置
+ROUNDS = [
+    {},
+    {'ttft': 6.0},
+    {},
+    {'ttft': TTFT['A'], 'fail_rate': 1.0},
+    {},
+    {},
+    {'fail_rate': 0.0},
+    {},
+    {},
+]
+
+
+def provider_config(name):
+    return {'name': name, 'api_url': f'http://127.0.0.1:{PORTS[name]}/v1', 'api_key': 'test-key', 'model': 'mock-model'}
+
+
+async def first_token(open_stream, messages):
+    """返回首包时间，失败返回 None"""
+    start = time.perf_counter()
+    ttft = None
+    try:
+        async for _ in open_stream(messages):
+            if ttft is None:
+                ttft = time.perf_counter() - start
+    except Exception:
+        return None
+    return ttft
+
+
+async def run(label, open_stream, requests):
+    async with httpx.AsyncClient() as control:
+        for name, port in PORTS.items():
+            await control.post(f'http://127.0.0.1:{port}/settings', json={'ttft': TTFT[name], 'fail_rate': 0.0})
+        before = {name: (await control.get(f'http://127.0.0.1:{port}/stats')).json()['requests']
+                  for name, port in PORTS.items()}
+        print(f'\n{label}')
+        print(f"{'轮次':<6}{'A 的设置':<24}{'平均首包(s)':>12}{'最大首包(s)':>12}{'失败':>6}")
+        wall = time.perf_counter()
+        for number, change in enumerate(ROUNDS, 1):
+            settings = (await control.post(f"http://127.0.0.1:{PORTS['A']}/settings", json=change)).json()
+            messages = [{'role': 'user', 'content': f'{number}. 第{number}轮 第{i}题'} for i in range(requests)]
+            results = await asyncio.gather(*(first_token(open_stream, [message]) for message in messages))
+            ok = [ttft for ttft in results if ttft is not None]
+            mean = sum(ok) / len(ok) if ok else float('nan')
+            describe = f"ttft={settings['ttft']} fail={settings['fail_rate']}"
+            print(f"{number:<6}{describe:<24}{mean:>12.2f}{max(ok, default=float('nan')):>12.2f}"
+                  f"{len(results) - len(ok):>6}")
+        wall = time.perf_counter() - wall
+        after = {name: (await control.get(f'http://127.0.0.1:{port}/stats')).json()['requests']
+                 for name, port in PORTS.items()}
+    counts = ', '.join(f'{name} {after[name] - before[name]}' for name in PORTS)
+    print(f'总耗时 {wall:.1f}s，上游收到的请求: {counts}')
+
+
+async def compare(requests, router):
+    a = provider_config('A')
+    try:
+        await run('固定 A', lambda messages: stream_chat_deltas(a['api_url'], a['api_key'], a['model'], messages),
+                  requests)
+        await run('上游池', lambda messages: router.stream('mock-model', messages, stream_chat_deltas), requests)
+    finally:
+        await close_clients()
+
+
+def main(requests):
+    provider_router.ROUTER_HEDGE_DELAY = HEDGE_DELAY
+    provider_router.ROUTER_COOLDOWN = 1.0
+    router = ProviderRouter([provider_config('A'), provider_config('B')])
+    print(f'每轮 {requests} 个并发请求，对冲延迟 {HEDGE_DELAY}s')
+    asyncio.run(compare(requests, router))
+    for provider in router.stats()['providers']:
+        print(f"{provider['name']}: 首包均值 {provider['ttft']}s，错误 {provider['errors']}，"
+              f"对冲 {provider['hedges']}（胜出 {provider['hedgeWins']}），切换 {provider['failovers']}")
+
+
+if __name__ == '__main__':
+    script = os.path.join(os.path.dirname(__file__), 'mock_openai.py')
+    mocks = [subprocess.Popen([sys.executable, script, '--port', str(port), '--ttft', str(TTFT[name])])
+             for name, port in PORTS.items()]
+    try:
+        for port in PORTS.values():
+            wait_for_port(port)
+        main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REQUESTS)
+    finally:
+        for mock in mocks:
+            mock.terminate()
+            mock.wait()
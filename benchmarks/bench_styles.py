@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+带样式 Excel 导出的样式检查与基准测试
+
+1. 对比逐个单元格新建 Font/Alignment/Border（旧写法）与命名样式两种写法的导出结果：
+   逐个单元格比较字体、填充、边框、对齐和数字格式，以及列宽、行高和去重后的样式表，
+   任何差异都会报错退出（同样的检查见 tests/test_styles.py）。
+2. 在独立子进程中测量两种写法在不同题目数下的耗时和导出增量内存。
+
+用法:
+    python benchmarks/bench_styles.py [题目数 ...]
+"""
+import io
+import json
+import subprocess
+import sys
+import time
+
+from common import make_questions, peak_rss_mb
+
+DEFAULT_SIZES = [10000, 50000]
+CHECK_SIZE = 200
+CHECK_FLAGGED = {3, 17, 150}
+
+
+def legacy_excel(questions, output, flagged=None):
+    """旧写法：每个单元格新建样式对象"""
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+    from openpyxl.worksheet.dimensions import SheetFormatProperties
+    from generate_excel import SHEET_TITLE, HEADER_ROW_HEIGHT, DATA_ROW_HEIGHT, adjust_column_width
+    from header_utils import HEADERS, HeaderResolver
+
+    def border():
+        thin = Side(style='thin')
+        return Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_TITLE)
+    ws.sheet_format = SheetFormatProperties(defaultRowHeight=DATA_ROW_HEIGHT, customHeight=True)
+    ws.row_dimensions[1].height = HEADER_ROW_HEIGHT
+    adjust_column_width(ws)
+
+    row = []
+    for header in HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(name='宋体', size=11, bold=True)
+        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        cell.border = border()
+        cell.fill = PatternFill(start_color="B4C7E7", end_color="B4C7E7", fill_type="solid")
+        row.append(cell)
+    ws.append(row)
+
+    resolver = HeaderResolver(HEADERS)
+    flagged = flagged or ()
+    for index, question in enumerate(questions):
+        row = []
+        for value in resolver.resolve(question):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = Font(name='宋体', size=11)
+            cell.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
+            cell.border = border()
+            if index in flagged:
+                cell.fill = PatternFill(start_color="F8CBAD", end_color="F8CBAD", fill_type="solid")
+            row.append(cell)
+        ws.append(row)
+    wb.save(output)
+
+
+def named_excel(questions, output, flagged=None):
+    from generate_excel import create_excel_from_questions
+    create_excel_from_questions(questions, output, flagged)
+
+
+def style_snapshot(data):
+    """读取导出结果中与显示相关的全部样式信息"""
+    from openpyxl import load_workbook
+    wb = load_workbook(io.BytesIO(data))
+    ws = wb.active
+    cells = [
+        (cell.coordinate, cell.value, repr(cell.font), repr(cell.fill), repr(cell.border),
+         repr(cell.alignment), cell.number_format, repr(cell.protection))
+        for row in ws.iter_rows() for cell in row
+    ]
+    dimensions = {
+        'columns': {key: dim.width for key, dim in ws.column_dimensions.items()},
+        'default_row_height': ws.sheet_format.defaultRowHeight,
+        'custom_height': ws.sheet_format.customHeight,
+        'header_height': ws.row_dimensions[1].height,
+    }
+    # 去重后的样式表：单元格实际引用到的字体、填充、边框、对齐组合
+    table = sorted({cell[2:] for cell in cells})
+    return cells, dimensions, table
+
+
+def check_styles():
+    questions = make_questions(CHECK_SIZE)
+    outputs = []
+    for build in (legacy_excel, named_excel):
+        buffer = io.BytesIO()
+        build(questions, buffer, CHECK_FLAGGED)
+        outputs.append(style_snapshot(buffer.getvalue()))
+    (legacy_cells, legacy_dims, legacy_table), (named_cells, named_dims, named_table) = outputs
+    for legacy, named in zip(legacy_cells, named_cells):
+        if legacy != named:
+            sys.exit(f'样式不一致: {legacy[0]}\n  旧: {legacy}\n  新: {named}')
+    if len(legacy_cells) != len(named_cells) or legacy_dims != named_dims or legacy_table != named_table:
+        sys.exit(f'样式表或尺寸不一致:\n  旧: {legacy_dims} {len(legacy_table)}\n  新: {named_dims} {len(named_table)}')
+    print(f'样式检查通过：{len(named_cells)} 个单元格、{len(named_table)} 种样式组合完全一致')
+
+
+def child(mode, count):
+    """子进程入口：生成数据、执行导出并输出 JSON 结果"""
+    questions = make_questions(count)
+    build = legacy_excel if mode == 'legacy' else named_excel
+    base_rss = peak_rss_mb()
+    buffer = io.BytesIO()
+    start = time.perf_counter()
+    build(questions, buffer)
+    elapsed = time.perf_counter() - start
+    print(json.dumps({'seconds': elapsed, 'peak_rss_mb': peak_rss_mb(), 'base_rss_mb': base_rss}))
+
+
+def main(sizes):
+    check_styles()
+    print(f"{'题目数':>8} {'写法':>8} {'耗时(s)':>10} {'导出增量(MB)':>12}")
+    for count in sizes:
+        for mode in ('legacy', 'named'):
+            output = subprocess.check_output([sys.executable, __file__, '--child', mode, str(count)])
+            result = json.loads(output.decode().strip().splitlines()[-1])
+            print(f"{count:>8} {mode:>8} {result['seconds']:>10.2f} {result['peak_rss_mb'] - result['base_rss_mb']:>12.1f}")
+
+
+if __name__ == '__main__':
+    if len(sys.argv) == 4 and sys.argv[1] == '--child':
+        child(sys.argv[2], int(sys.argv[3]))
+    else:
+        main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
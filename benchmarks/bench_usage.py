@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+按用量切分材料：模拟接口的单次输出上限为 MAX_OUTPUT 个字符（按字符计 token），
+每轮把同一份大段材料切分生成，统计被截断的段数和得到的题目数。
+
+- 固定预算:  每段按 CHUNK_MAX_TOKENS 切分（原做法）
+- 按用量:    按 usage_tracker.chunk_budget 切分，从上游返回的 usage 和 finish_reason
+             学习输出比例和输出上限（第 1 轮从默认值开始）
+
+被截断的段丢失后半部分题目，只能重新生成；每题 token 为本轮消耗的 token 数除以得到的题目数。
+
+用法:
+    python benchmarks/bench_usage.py [题目数] [轮数]
+"""
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+from common import ROOT_DIR  # noqa: F401  确保可以导入项目模块
+import ai_service
+from bench_chunking import wait_for_port
+from config import CHUNK_MAX_TOKENS
+from http_client import close_clients
+from scheduler import get_limiter
+from usage import Usage, UsageTracker
+
+DEFAULT_QUESTIONS = 600
+DEFAULT_ROUNDS = 3
+MOCK_PORT = 9923
+MAX_OUTPUT = 3000
+API_URL = f'http://127.0.0.1:{MOCK_PORT}/v1'
+SYSTEM_PROMPT = '请把材料中的每一行改写为一道单选题，按 JSON 输出。'
+
+
+async def run_round(source, questions):
+    usage = Usage('mock-model')
+    frames = ai_service.chunked_generation(API_URL, 'test-key', 'mock-model', SYSTEM_PROMPT, source,
+                                           get_limiter(API_URL), use_cache=False, usage=usage)
+    count = chunks = 0
+    start = time.perf_counter()
+    async for frame in frames:
+        if 'question' in frame:
+            count += 1
+        elif 'chunks' in frame:
+            chunks = frame['chunks']
+    return chunks, usage.truncated, count, usage.total_tokens, time.perf_counter() - start
+
+
+async def measure(label, source, questions, rounds):
+    print(f'\n{label}')
+    print(f"{'轮次':<6}{'段数':>6}{'截断':>6}{'题目数':>8}{'完整率':>8}{'token数':>10}{'每题token':>10}{'耗时(s)':>9}")
+    for number in range(1, rounds + 1):
+        chunks, truncated, count, tokens, elapsed = await run_round(source, questions)
+        print(f'{number:<6}{chunks:>6}{truncated:>6}{count:>8}{count / questions:>8.0%}{tokens:>10}'
+              f'{tokens / max(count, 1):>10.0f}{elapsed:>9.2f}')
+
+
+async def compare(questions, rounds):
+    source = '\n'.join(f'{i + 1}. 关于第{i + 1}个知识点的说法中，正确的是？' for i in range(questions))
+    try:
+        tracker = ai_service.usage_tracker = UsageTracker()
+        tracker.chunk_budget = lambda model, system_tokens: CHUNK_MAX_TOKENS
+        await measure('固定预算', source, questions, rounds)
+        tracker = ai_service.usage_tracker = UsageTracker()
+        await measure('按用量', source, questions, rounds)
+        limits = (await tracker.snapshot())['models']['mock-model']
+        print(f"学习到的输出比例 {limits['outputRatio']}，输出上限 {limits['maxOutput']}")
+    finally:
+        await close_clients()
+
+
+if __name__ == '__main__':
+    questions = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_QUESTIONS
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ROUNDS
+    script = os.path.join(os.path.dirname(__file__), 'mock_openai.py')
+    mock = subprocess.Popen([sys.executable, script, '--port', str(MOCK_PORT), '--ttft', '0.05',
+                             '--delta-chars', '200', '--delta-delay', '0', '--max-output', str(MAX_OUTPUT)])
+    try:
+        wait_for_port(MOCK_PORT)
+        print(f'{questions} 道题的材料，模拟的输出上限 {MAX_OUTPUT} token')
+        asyncio.run(compare(questions, rounds))
+    finally:
+        mock.terminate()
+        mock.wait()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""基准测试公共工具"""
+import json
+import os
+import resource
+import sys
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+def load_demo_questions():
+    """读取示例题目"""
+    with open(os.path.join(ROOT_DIR, 'demo_questions.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)['questions']
+
+
+def make_questions(count):
+    """以示例题目为模板生成 count 道互不相同的题目"""
+    demo = load_demo_questions()
+    questions = []
+    for i in range(count):
+        question = dict(demo[i % len(demo)])
+        for key in question:
+            if key.startswith('题干'):
+                question[key] = f"{question[key]}（第{i + 1}题）"
+        questions.append(question)
+    return questions
+
+
+def peak_rss_mb():
+    """当前进程的峰值内存（MB），仅支持类 Unix 系统"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS 单位为字节，Linux 为 KB
+    if sys.platform == 'darwin':
+        return peak / 1024 / 1024
+    return peak / 1024
@@ -0,0 +1,106 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地模拟的 OpenAI 兼容接口（/v1/chat/completions），供基准测试使用
+
+user prompt 中每一行 "N. 内容" 生成一道单选题，流式按固定间隔输出；
+首包延迟、每个增量的字符数和间隔、单次输出的字符上限（模拟 max_tokens 截断，finish_reason 为 length）
+和失败比例均可通过参数调整，
+运行中可以通过 POST /settings 修改（模拟上游变慢或出错）。
+
+用法:
+    python benchmarks/mock_openai.py --port 9911 --ttft 0.3 --delta-chars 16 --delta-delay 0.005
+"""
+import argparse
+import asyncio
+import json
+import random
+import re
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse, JSONResponse
+
+LINE = re.compile(r'^\s*(\d+)\s*[.、]\s*(.+)$', re.M)
+
+settings = {
+    'ttft': 0.3,            # 首个增量前的等待（秒）
+    'delta_chars': 16,      # 每个增量的字符数
+    'delta_delay': 0.005,   # 增量之间的间隔（秒）
+    'max_output': 16000,    # 单次输出字符上限，超出部分被截断
+    'fail_rate': 0.0,       # 返回 503 的请求比例
+}
+
+app = FastAPI()
+stats = {'requests': 0, 'failures': 0, 'output_chars': 0}
+
+
+def build_content(user_prompt):
+    questions = [
+        {'题干（必填）': f'{text.strip()}（第{number}题）', '题型 （必填）': '单选题',
+         '选项 A': '正确', '选项 B': '错误', '正确答案（必填）': 'A'}
+        for number, text in LINE.findall(user_prompt)
+    ]
+    content = f"```json\n{json.dumps({'questions': questions}, ensure_ascii=False, indent=2)}\n```"
+    return content[:settings['max_output']], len(content) > settings['max_output']
+
+
+@app.post('/v1/chat/completions')
+async def chat(request: Request):
+    body = await request.json()
+    content, truncated = build_content(body['messages'][-1]['content'])
+    finish_reason = 'length' if truncated else 'stop'
+    # 按字符数计 token
+    usage = {'prompt_tokens': sum(len(message['content']) for message in body['messages']),
+             'completion_tokens': len(content)}
+    stats['requests'] += 1
+    if random.random() < settings['fail_rate']:
+        stats['failures'] += 1
+        return JSONResponse({'error': {'message': 'mock overloaded'}}, status_code=503)
+    stats['output_chars'] += len(content)
+    if not body.get('stream'):
+        await asyncio.sleep(settings['ttft'] + settings['delta_delay'] * len(content) / settings['delta_chars'])
+        return {'choices': [{'message': {'content': content}, 'finish_reason': finish_reason}], 'usage': usage}
+
+    async def generate():
+        await asyncio.sleep(settings['ttft'])
+        step = settings['delta_chars']
+        for i in range(0, len(content), step):
+            yield 'data: ' + json.dumps({'choices': [{'delta': {'content': content[i:i + step]}}]}) + '\n\n'
+            await asyncio.sleep(settings['delta_delay'])
+        yield 'data: ' + json.dumps({'choices': [{'delta': {}, 'finish_reason': finish_reason}]}) + '\n\n'
+        if (body.get('stream_options') or {}).get('include_usage'):
+            yield 'data: ' + json.dumps({'choices': [], 'usage': usage}) + '\n\n'
+        yield 'data: [DONE]\n\n'
+
+    return StreamingResponse(generate(), media_type='text/event-stream')
+
+
+@app.get('/stats')
+async def get_stats():
+    return stats
+
+
+@app.post('/settings')
+async def update_settings(request: Request):
+    body = await request.json()
+    settings.update({key: value for key, value in body.items() if key in settings})
+    return settings
+
+
+def main():
+    import uvicorn
+    parser = argparse.ArgumentParser(description='模拟 OpenAI 流式接口')
+    parser.add_argument('--port', type=int, default=9911)
+    parser.add_argument('--ttft', type=float, default=settings['ttft'])
+    parser.add_argument('--delta-chars', type=int, default=settings['delta_chars'])
+    parser.add_argument('--delta-delay', type=float, default=settings['delta_delay'])
+    parser.add_argument('--max-output', type=int, default=settings['max_output'])
+    parser.add_argument('--fail-rate', type=float, default=settings['fail_rate'])
+    args = parser.parse_args()
+    settings.update(ttft=args.ttft, delta_chars=args.delta_chars, delta_delay=args.delta_delay, max_output=args.max_output,
+                    fail_rate=args.fail_rate)
+    uvicorn.run(app, host='127.0.0.1', port=args.port, log_level='warning')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+原始材料切分
+
+按题号（"1." "（2）" "第3题" "四、" 等）把材料切成题目块，再按 token 预算
+打包成若干段，每段单独生成，结果按原文顺序合并。
+"""
+import re
+from config import CHUNK_MAX_TOKENS
+from utils import estimate_tokens
+
+# 行首的题号
+QUESTION_START = re.compile(
+    r'^\s*(?:\d+\s*[.、．:：)）]|[（(]\s*\d+\s*[)）]|第\s*[\d一二三四五六七八九十百]+\s*题|[一二三四五六七八九十]+\s*、)'
+)
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+
+
+def split_blocks(text):
+    """切分为题目块；没有题号时按空行分段"""
+    blocks = []
+    current = []
+    for line in text.splitlines(keepends=True):
+        if current and QUESTION_START.match(line):
+            blocks.append(''.join(current))
+            current = []
+        current.append(line)
+    if current:
+        blocks.append(''.join(current))
+    if len(blocks) <= 1:
+        blocks = [p + '\n\n' for p in PARAGRAPH_BREAK.split(text) if p.strip()]
+    return blocks
+
+
+def split_oversized(block, max_tokens):
+    """把超过预算的单个块按行（必要时按字符）拆开"""
+    pieces = []
+    for line in block.splitlines(keepends=True):
+        while estimate_tokens(line) > max_tokens:
+            # 中文约 1 字 1 token，按字符数截断即可保证不超预算
+            pieces.append(line[:max_tokens])
+            line = line[max_tokens:]
+        pieces.append(line)
+    return pieces
+
+
+def split_source(text, max_tokens=CHUNK_MAX_TOKENS):
+    """
+    按题目边界切分原始材料，每段不超过 max_tokens（按 estimate_tokens 估算）
+
+    返回:
+        按原文顺序排列的文本段列表
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+    for block in split_blocks(text):
+        tokens = estimate_tokens(block)
+        parts = [block] if tokens <= max_tokens else split_oversized(block, max_tokens)
+        for part in parts:
+            part_tokens = tokens if len(parts) == 1 else estimate_tokens(part)
+            if current and current_tokens + part_tokens > max_tokens:
+                chunks.append(''.join(current).strip())
+                current = []
+                current_tokens = 0
+            current.append(part)
+            current_tokens += part_tokens
+    if current:
+        chunks.append(''.join(current).strip())
+    return [chunk for chunk in chunks if chunk]
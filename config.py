@@ -48,3 +48,136 @@ COMPARE_PROMPT = """你是一个专业的题库审核助手。请对比以下两
 2. 题目信息（包括题目题干，类型、选项、解析等）和原始需求完全一致
 
 请以清晰的结构化格式输出审核意见。"""
+
+# Excel 导出：超过该大小（字节）的导出结果才会从内存转存到临时文件
+EXPORT_SPOOL_MAX_SIZE = 16 * 1024 * 1024
+
+# Excel 导出：下载时每次发送的字节数
+EXPORT_CHUNK_SIZE = 64 * 1024
+
+# 上游 AI 接口连接池：每个上游地址共用一个客户端
+HTTP_MAX_CONNECTIONS = 100            # 单个上游的最大连接数
+HTTP_MAX_KEEPALIVE_CONNECTIONS = 20   # 保持空闲的最大连接数
+HTTP_KEEPALIVE_EXPIRY = 60.0          # 空闲连接保持时间（秒）
+HTTP2_ENABLED = True                  # 需要安装 h2，未安装时自动退回 HTTP/1.1
+
+# 批量生成调度：每个上游的默认并发数、每分钟请求数（RPM）和每分钟 token 数（TPM），0 表示不限制
+BATCH_MAX_CONCURRENCY = 8
+BATCH_RPM_LIMIT = 0
+BATCH_TPM_LIMIT = 0
+# 按上游地址（scheme://host:port）单独覆盖，例如 {"https://api.openai.com:443": {"concurrency": 16, "rpm": 500, "tpm": 200000}}
+PROVIDER_LIMITS = {}
+# 429/5xx 的重试次数和指数退避基准（秒）
+BATCH_MAX_RETRIES = 3
+BATCH_RETRY_BASE_DELAY = 1.0
+
+# AI 响应缓存：相同上游、模型和提示词的请求直接返回缓存结果
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 256            # 内存层最多缓存条数
+RESPONSE_CACHE_TTL = 24 * 60 * 60           # 过期时间（秒）
+RESPONSE_CACHE_DB = None                    # 磁盘层 SQLite 路径，例如 "cache/responses.sqlite3"，None 表示不启用
+RESPONSE_CACHE_DB_MAX_BYTES = 256 * 1024 * 1024  # 磁盘层总大小上限（字节）
+
+# 批量审核的结果记录（按模型和审核内容的哈希）：内容与上次审核相同的输入直接回放上次的结果，
+# 不受 RESPONSE_CACHE_ENABLED 影响，超出条数时淘汰最久未使用的
+AUDIT_RESULT_MAX_ENTRIES = 10000
+AUDIT_RESULT_TTL = 7 * 24 * 60 * 60
+
+# 请求日志：记录请求/响应体时最多捕获的字节数，超出部分不记录
+LOG_BODY_MAX_BYTES = 64 * 1024
+# 请求日志：记录请求/响应体的采样率（0~1），未采样的请求只记录方法、路径、状态码和耗时
+LOG_DEFAULT_SAMPLE_RATE = 1.0
+# 按路径前缀单独设置采样率，例如 {"/api/compare": 0.1}
+LOG_SAMPLE_RATES = {}
+
+# 流式生成时逐题解析输出，结构无法恢复时是否立即终止上游请求以节省 token
+STREAM_ABORT_ON_INVALID = True
+
+# 大段材料自动切分（默认关闭）：输入超过每段的 token 预算（估算，中文约每字一个 token）时按题目边界
+# 切分为多段并发生成。预算按模型的输出上限和实际输出比例计算（见 usage.py），在 CHUNK_MIN_TOKENS ~ CHUNK_MAX_TOKENS 之间。
+# 开启后切分的请求 /api/generate 的流格式不同：先是 {'chunks': 段数}、逐题的 {'question'} 和每段结束的 {'chunk'}，
+# 不再逐块输出文本，最后以一个 text 帧输出合并后的 ```json 代码块；共用材料或题干的题目可能被分到不同段
+CHUNK_ENABLED = False
+CHUNK_MAX_TOKENS = 1500
+CHUNK_MIN_TOKENS = 200
+CHUNK_MAX_CONCURRENCY = 8   # 单个请求同时生成的段数（同时受上游并发上限约束）
+
+# 导出前的近似重复题检测：题干和选项的字符二元组 Jaccard 相似度达到阈值视为重复
+DEDUP_THRESHOLD = 0.7
+EXPORT_DEDUP_MODE = 'flag'   # 'flag' 高亮重复题，'drop' 删除重复题，'off' 不检测
+
+# 导出任务在工作池中执行，不阻塞事件循环上的流式接口
+# EXPORT_WORKER_MODE: 'thread' 线程池（客户端断开或超时时可中止正在生成的文件），
+#                     'process' 进程池（不占用服务进程的 GIL，已开始的任务只能等待完成）
+EXPORT_WORKER_MODE = 'thread'
+EXPORT_WORKERS = 2              # 同时执行的导出任务数
+EXPORT_QUEUE_SIZE = 8           # 排队等待的导出任务数上限，超出时返回 503
+EXPORT_MAX_QUESTIONS = 200000   # 单次导出的题目数上限，超出时返回 413
+EXPORT_TIMEOUT = 300            # 导出任务（含排队时间）的超时秒数，超时返回 504
+
+# 后台导出任务（/api/export/jobs）：生成的文件保存在 exports 目录，
+# 完成后保留 EXPORT_JOB_TTL 秒，总大小或任务数超出上限时先删除最早完成的
+EXPORT_JOB_TTL = 3600
+EXPORT_JOB_TIMEOUT = 3600   # 后台任务的超时秒数（替代 EXPORT_TIMEOUT）
+EXPORT_JOB_MAX_BYTES = 2 * 1024 * 1024 * 1024
+EXPORT_JOB_MAX_JOBS = 100
+EXPORT_JOB_CLEANUP_INTERVAL = 60
+
+# /metrics 中每个指标最多保留的标签组合数（模型名、上游地址来自请求参数），超出的归入 other
+METRICS_MAX_SERIES = 500
+METRICS_PUBLISH_INTERVAL = 5.0   # 多个工作进程时各进程把指标写入共享状态的间隔（秒），/metrics 汇总所有进程
+
+# 转发上游流式输出时合并短时间内到达的增量：距上一帧不足 RELAY_COALESCE_WINDOW 秒的增量
+# 合并到同一帧，累计达到 RELAY_COALESCE_MAX_CHARS 个字符时立即发送；窗口为 0 时逐个增量转发
+RELAY_COALESCE_WINDOW = 0.02
+RELAY_COALESCE_MAX_CHARS = 1024
+
+# 服务启动参数（python app.py），命令行参数优先
+SERVER_HOST = None             # None 表示 HTTP/2 模式监听 0.0.0.0，否则只监听 127.0.0.1
+SERVER_PORT = 8111
+SERVER_WORKERS = 1             # 工作进程数，大于 1 时需要共享状态
+SERVER_GRACEFUL_TIMEOUT = 30   # 收到退出信号后等待进行中的请求（含流式输出）结束的秒数
+
+# 多个工作进程之间共享的状态（最近日志、限速额度、导出任务、响应缓存的磁盘层）：
+# 'memory' 只在当前进程内，'sqlite' 保存在 SHARED_STATE_DB 中；None 表示工作进程数大于 1 时使用 sqlite
+SHARED_STATE_BACKEND = None
+SHARED_STATE_DB = 'data/shared_state.sqlite3'
+# 请求处理中读写共享状态时等待其他进程释放写锁的秒数（后台写日志仍等待 30 秒）
+SHARED_STATE_BUSY_TIMEOUT = 2
+EXPORT_JOB_PUBLISH_INTERVAL = 1.0   # 共享状态下导出任务进度的同步间隔（秒）
+
+# 服务端上游池：请求的 apiUrl 为 PROVIDER_POOL_URL 时不使用请求中的地址和密钥，而是从下列上游中
+# 按首包延迟、错误率和剩余限速额度选择；请求的 model 与某些上游的 model 相同时只在这些上游中选择。
+# 每个上游: {"name": 名称, "api_url": 地址, "api_key": 密钥, "model": 模型,
+#            "weight": 权重（默认 1，越大越优先）, "hedge": 是否允许作为对冲请求的目标（默认 True）}
+# 并发和 RPM/TPM 限制沿用 PROVIDER_LIMITS
+PROVIDER_POOL = []
+PROVIDER_POOL_URL = 'pool'
+ROUTER_HEDGE_DELAY = 3.0        # 首个增量超过该秒数未到达时，同时向下一个上游发出对冲请求；0 表示不对冲
+ROUTER_MAX_FAILOVERS = 2        # 上游在输出前失败时，最多切换到其他上游的次数
+ROUTER_EWMA_ALPHA = 0.3         # 首包延迟和错误率的指数滑动平均系数
+ROUTER_ERROR_PENALTY = 4.0      # 错误率对评分的放大系数：评分 = 预计首包时间 × (1 + 系数 × 错误率) / 权重
+ROUTER_FAILURE_THRESHOLD = 3    # 连续失败达到该次数后暂停使用
+ROUTER_COOLDOWN = 30            # 暂停使用的秒数（429 带 Retry-After 时按其时间）
+
+# token 用量统计（/api/usage）和按用量调整请求大小
+USAGE_STREAM_INCLUDE_USAGE = True   # 流式请求附带 stream_options.include_usage，由上游在最后一帧返回用量；上游不支持该参数时关闭
+# 各模型的上下文长度和单次输出上限（token），未列出的模型使用 DEFAULT_MODEL_LIMITS；
+# 最近 USAGE_LIMIT_WINDOW 秒内有 USAGE_LIMIT_OBSERVATIONS 次输出被截断（finish_reason 为 length）时，
+# 按截断处的 token 数下调输出上限，之后没有新的截断时恢复
+MODEL_LIMITS = {}
+DEFAULT_MODEL_LIMITS = {"context": 32000, "max_output": 4096}
+# 各模型的价格（每百万 token），例如 {"gpt-4o": {"prompt": 2.5, "completion": 10}}，未列出的模型不计算费用
+MODEL_PRICES = {}
+USAGE_OUTPUT_RATIO = 2.0       # 生成题目时输出与材料 token 数之比的初始值，之后按实际输出更新
+USAGE_OUTPUT_HEADROOM = 0.8    # 每段材料的预计输出只占输出上限的这一比例，留出余量避免截断
+USAGE_LIMIT_OBSERVATIONS = 3
+USAGE_LIMIT_WINDOW = 60 * 60
+USAGE_FLUSH_INTERVAL = 1.0     # 多个工作进程时累计用量写入共享状态的间隔（秒）
+
+# 服务端题库（/api/questions）：题目以内容哈希为键保存在 QUESTION_STORE_DB 中，可按题型、章节、难度和关键词查询，
+# 并按导出游标增量导出；首次使用时才创建数据库文件
+QUESTION_STORE_DB = 'data/questions.sqlite3'
+QUESTION_STORE_SAVE_GENERATED = False   # 生成题目时自动把解析出的题目保存到题库
+QUESTION_STORE_PAGE_SIZE = 50           # 查询接口默认每页题目数
+QUESTION_STORE_MAX_PAGE_SIZE = 1000
@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+近似重复题目检测
+
+题目文本（题干 + 选项，去掉空白和标点）切成字符 shingle，计算 MinHash 签名
+（单次哈希分桶的变体，每个 shingle 只哈希一次），按 LSH 分段分桶，
+只对落入同一桶的候选做精确的 Jaccard 比较，题目数量增长时耗时接近线性。
+"""
+import hashlib
+from config import DEDUP_THRESHOLD
+from header_utils import HEADER_MAPPING, HeaderResolver
+from pre_audit import normalize_stem
+
+SHINGLE_SIZE = 2    # 中文题目较短，按两个字切分
+NUM_PERM = 32       # 签名长度（64 位哈希的高 5 位选桶，其余位为桶内的值）
+BANDS = 10          # LSH 分段数，每段 NUM_PERM // BANDS 个哈希（相似度 0.7 时约 98% 概率成为候选）
+DEDUP_MODES = ('flag', 'drop', 'off')
+
+_text_resolver = HeaderResolver([HEADER_MAPPING[key] for key in ['题干', 'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']])
+_VALUE_BITS = 64 - (NUM_PERM - 1).bit_length()
+_VALUE_MASK = (1 << _VALUE_BITS) - 1
+
+
+def question_text(question):
+    """用于比较的题目文本：题干和所有选项"""
+    if not isinstance(question, dict):
+        return normalize_stem(question)
+    return normalize_stem(''.join(str(value) for value in _text_resolver.resolve(question) if value is not None))
+
+
+def shingles(text, size=SHINGLE_SIZE):
+    if len(text) <= size:
+        return {text} if text else set()
+    return {text[i:i + size] for i in range(len(text) - size + 1)}
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class DuplicateIndex:
+    """
+    MinHash/LSH 索引
+
+    add() 加入一条文本并返回与之重复的已有条目 (id, 相似度)，没有重复时返回 None。
+    """
+
+    def __init__(self, threshold=DEDUP_THRESHOLD, bands=BANDS):
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = NUM_PERM // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._shingles = []
+        # 常用字组合会反复出现，缓存每个 shingle 的哈希
+        self._hashes = {}
+
+    def signature(self, grams):
+        """
+        MinHash 签名（单次哈希分桶：每个 shingle 只算一次哈希，按高位分到 NUM_PERM 个桶，
+        每个桶取最小值；空桶用右侧最近的非空桶补齐并加上偏移，避免空桶之间误判相同）
+        """
+        hashes = self._hashes
+        bins = [None] * NUM_PERM
+        for gram in grams:
+            h = hashes.get(gram)
+            if h is None:
+                h = hashes[gram] = int.from_bytes(hashlib.blake2b(gram.encode('utf-8'), digest_size=8).digest(), 'little')
+            slot = h >> _VALUE_BITS
+            value = h & _VALUE_MASK
+            current = bins[slot]
+            if current is None or value < current:
+                bins[slot] = value
+        if None not in bins:
+            return tuple(bins)
+        signature = list(bins)
+        for i in range(NUM_PERM):
+            if signature[i] is None:
+                j, offset = i, 0
+                while bins[j] is None:
+                    j = (j + 1) % NUM_PERM
+                    offset += 1
+                signature[i] = bins[j] + (offset << _VALUE_BITS)
+        return tuple(signature)
+
+    def query(self, grams, signature):
+        """返回相似度最高且不低于阈值的已有条目 (id, 相似度)"""
+        checked = set()
+        best = None
+        for band, buckets in enumerate(self._buckets):
+            start = band * self.rows
+            for candidate in buckets.get(signature[start:start + self.rows], ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                similarity = jaccard(grams, self._shingles[candidate])
+                if similarity >= self.threshold and (best is None or similarity > best[1]):
+                    best = (candidate, similarity)
+        return best
+
+    def add(self, text, keep_duplicate=False):
+        """
+        加入一条文本
+
+        参数:
+            keep_duplicate: 为 False 时重复条目不进入索引，之后的重复项都指向最早的原题
+
+        返回:
+            (本条 id, 重复的已有条目 (id, 相似度) 或 None)
+        """
+        grams = shingles(text)
+        item_id = len(self._shingles)
+        self._shingles.append(grams)
+        if not grams:
+            return item_id, None
+        signature = self.signature(grams)
+        match = self.query(grams, signature)
+        if match is None or keep_duplicate:
+            for band, buckets in enumerate(self._buckets):
+                start = band * self.rows
+                buckets.setdefault(signature[start:start + self.rows], []).append(item_id)
+        return item_id, match
+
+
+def find_duplicates(questions, threshold=DEDUP_THRESHOLD):
+    """
+    按顺序检查题目，后出现的近似重复题指向最早出现的原题
+
+    返回:
+        [{'index': 重复题序号, 'duplicateOf': 原题序号, 'similarity': 相似度}]，序号从 0 开始
+    """
+    index = DuplicateIndex(threshold)
+    duplicates = []
+    for i, question in enumerate(questions):
+        _, match = index.add(question_text(question))
+        if match is not None:
+            duplicates.append({'index': i, 'duplicateOf': match[0], 'similarity': round(match[1], 3)})
+    return duplicates
+
+
+def deduplicate(questions, mode='flag', threshold=DEDUP_THRESHOLD):
+    """
+    导出前去重
+
+    参数:
+        mode: 'flag' 标记重复题（导出时高亮），'drop' 删除重复题，'off' 不处理
+
+    返回:
+        (导出的题目列表, 需要高亮的行序号集合, 重复题列表)
+    """
+    if mode == 'off':
+        return questions, set(), []
+    if mode not in DEDUP_MODES:
+        raise ValueError(f'未知的去重模式: {mode}')
+    questions = list(questions)
+    duplicates = find_duplicates(questions, threshold)
+    if mode == 'drop':
+        dropped = {item['index'] for item in duplicates}
+        return [q for i, q in enumerate(questions) if i not in dropped], set(), duplicates
+    return questions, {item['index'] for item in duplicates}, duplicates
@@ -1,23 +1,53 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-import json
-import os
 import tempfile
-from generate_excel import create_excel_from_json
+from config import EXPORT_SPOOL_MAX_SIZE, EXPORT_CHUNK_SIZE
+from export_writers import WRITERS
 
 
-def export_to_excel(questions):
-    """导出题目到 Excel 文件"""
-    with tempfile.NamedTemporaryFile(mode='w', suffix='.json', delete=False, encoding='utf-8') as f:
-        json.dump({'questions': questions}, f, ensure_ascii=False, indent=2)
-        json_path = f.name
+def export_to_excel(questions, flagged=None, writer=WRITERS['xlsx']):
+    """
+    导出题目到 Excel（或 writer 指定的其他格式），返回已定位到开头的缓冲文件对象
 
-    excel_path = tempfile.mktemp(suffix='.xlsx')
+    flagged 为需要高亮的题目序号集合（近似重复题）。
 
+    小文件完全保存在内存中，超过 EXPORT_SPOOL_MAX_SIZE 时自动转存到
+    临时文件，关闭后即删除，不会留下残留文件。
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
     try:
-        create_excel_from_json(json_path, excel_path)
-        return excel_path, json_path
-    except Exception as e:
-        if os.path.exists(json_path):
-            os.unlink(json_path)
-        raise e
+        writer.write(questions, buffer, flagged)
+        buffer.seek(0)
+        return buffer
+    except Exception:
+        buffer.close()
+        raise
+
+
+def export_groups_to_excel(groups, writer=WRITERS['xlsx']):
+    """
+    每组题目导出为同一个 Excel 文件中的一个工作表，返回已定位到开头的缓冲文件对象
+
+    参数:
+        groups: [(工作表名称, 题目列表, 需要高亮的题目序号集合), ...]
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=EXPORT_SPOOL_MAX_SIZE, mode='w+b')
+    try:
+        writer.write_groups(groups, buffer)
+        buffer.seek(0)
+        return buffer
+    except Exception:
+        buffer.close()
+        raise
+
+
+def iter_export(buffer, chunk_size=EXPORT_CHUNK_SIZE):
+    """分块读取导出缓冲区，读取完毕后自动关闭"""
+    try:
+        while True:
+            chunk = buffer.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        buffer.close()
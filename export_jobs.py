@@ -0,0 +1,347 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+后台导出任务
+
+题目很多时同步的 /api/export 可能超过反向代理的超时时间。POST /api/export/jobs
+创建任务后立即返回任务 id，导出在导出任务池中执行并直接写入 EXPORT_DIR 下的文件；
+查询接口返回已写入的题目数和预计剩余时间，完成后通过下载接口获取（支持 Range 续传）。
+
+任务只保存在内存中，服务启动时清理 EXPORT_DIR 中上次运行残留的文件。多个工作进程时，
+任务信息和进度同步到共享状态中（在共享状态线程中读写，不阻塞事件循环），查询、下载和
+删除请求可以由任意一个进程处理；正在执行的任务由创建它的进程在下次同步时取消。
+"""
+import asyncio
+import os
+import sqlite3
+import time
+import uuid
+from pathlib import Path
+import metrics
+from config import (EXPORT_JOB_TTL, EXPORT_JOB_TIMEOUT, EXPORT_JOB_MAX_BYTES, EXPORT_JOB_MAX_JOBS,
+                    EXPORT_JOB_CLEANUP_INTERVAL, EXPORT_JOB_PUBLISH_INTERVAL)
+from export_pool import ExportRejected, prepare_export, until_cancelled, raise_if_cancelled
+from export_writers import WRITERS
+from grouped_export import sheet_groups, write_grouped_zip
+from shared_state import get_shared_state
+
+EXPORT_DIR = Path(__file__).parent / "exports"
+STALE_AFTER = 30 * EXPORT_JOB_PUBLISH_INTERVAL   # 未完成的任务超过这么久没有同步，视为所在进程已退出
+
+
+class Progress:
+    """导出进度，线程模式下由工作线程更新（进程模式下子进程中的更新不会传回，只在完成时更新）"""
+
+    def __init__(self):
+        self.total = None
+        self.written = 0
+        self.started = None          # 开始执行（去重）的时间
+        self.writing_started = None  # 开始写入文件的时间，用于估算剩余时间
+
+
+def write_export_file(path, writer_name, questions, dedup, group_by, layout, progress=None, cancel=None):
+    """
+    去重、分组并把导出文件写入 path（在导出任务池中执行），失败或取消时删除文件
+
+    返回:
+        (文件大小, 重复题数量, 写入的题目数)
+    """
+    if progress is not None:
+        progress.started = time.time()
+    questions, flagged, duplicate_count, groups = prepare_export(questions, dedup, group_by, cancel)
+    writer = WRITERS[writer_name]
+    if progress is not None:
+        progress.total = len(questions)
+        progress.writing_started = time.time()
+
+    def track(items):
+        for question in until_cancelled(items, cancel):
+            yield question
+            if progress is not None:
+                progress.written += 1
+
+    try:
+        with open(path, 'wb') as output:
+            if groups is None:
+                writer.write(track(questions), output, flagged)
+            elif layout == 'files':
+                write_grouped_zip([(name, track(items), marks) for name, items, marks in groups], writer, output)
+            else:
+                writer.write_groups([(name, track(items), marks) for name, items, marks in sheet_groups(groups)], output)
+        raise_if_cancelled(cancel)
+    except BaseException:
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+    return os.path.getsize(path), duplicate_count, len(questions)
+
+
+class ExportJob:
+    def __init__(self, job_id, writer, total, path, media_type, dedup):
+        self.id = job_id
+        self.writer = writer
+        self.total = total
+        self.path = path
+        self.filename = f'exam_questions{path.suffix}'
+        self.media_type = media_type
+        self.dedup = dedup
+        # queued / running 由进度推断，结束后为 done / failed / cancelled
+        self.status = None
+        self.progress = Progress()
+        self.created = time.time()
+        self.perf_start = time.perf_counter()
+        self.finished = None
+        self.size = None
+        self.duplicate_count = None
+        self.error = None
+        self.task = None
+
+    @property
+    def state(self):
+        if self.status is not None:
+            return self.status
+        return 'running' if self.progress.started is not None else 'queued'
+
+    def info(self, ttl=EXPORT_JOB_TTL):
+        total = self.progress.total if self.progress.total is not None else self.total
+        written = self.progress.written
+        eta = None
+        if self.state == 'running' and written and total:
+            elapsed = time.time() - self.progress.writing_started
+            eta = round(elapsed * (total - written) / written, 1)
+        return {
+            'id': self.id,
+            'status': self.state,
+            'format': self.writer.name,
+            'filename': self.filename,
+            'total': total,
+            'written': written,
+            'progress': round(written / total, 4) if total else (1.0 if self.status == 'done' else 0.0),
+            'eta': eta,
+            'size': self.size,
+            'duplicateCount': self.duplicate_count,
+            'dedup': self.dedup,
+            'error': self.error,
+            'createdAt': self.created,
+            'expiresAt': self.finished + ttl if self.finished is not None else None
+        }
+
+
+class SharedExportJob:
+    """其他工作进程中的任务，信息为该进程最近一次同步的快照"""
+
+    def __init__(self, row):
+        self.id = row['id']
+        self.path = Path(row['path'])
+        self.media_type = row['media_type']
+        self._info = row['info']
+        self.filename = self._info['filename']
+        self.duplicate_count = self._info['duplicateCount']
+
+    @property
+    def state(self):
+        return self._info['status']
+
+    def info(self, ttl=EXPORT_JOB_TTL):
+        return dict(self._info)
+
+
+class ExportJobStore:
+    """
+    导出任务及其文件
+
+    完成的任务保留 ttl 秒；文件总大小超过 max_bytes 或任务数达到 max_jobs 时先删除最早完成的任务。
+    """
+
+    def __init__(self, directory=EXPORT_DIR, ttl=EXPORT_JOB_TTL, max_bytes=EXPORT_JOB_MAX_BYTES,
+                 max_jobs=EXPORT_JOB_MAX_JOBS):
+        self.directory = Path(directory)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.max_jobs = max_jobs
+        self.jobs = {}
+        self.state = None
+        self._cleanup_task = None
+
+    async def create(self, pool, writer, questions, dedup, group_by, layout):
+        """
+        创建任务并在导出任务池中开始执行
+
+        异常:
+            ExportRejected: 题目过多（413）或任务数已满（503）
+        """
+        await self.cleanup(reserve=1)
+        if len(self.jobs) + 1 > self.max_jobs:
+            raise ExportRejected(503, '导出任务过多，请稍后重试')
+
+        job_id = uuid.uuid4().hex
+        if group_by and layout == 'files':
+            extension, media_type = 'zip', 'application/zip'
+        else:
+            extension, media_type = writer.extension, writer.media_type
+        self.directory.mkdir(parents=True, exist_ok=True)
+        job = ExportJob(job_id, writer, len(questions), self.directory / f'{job_id}.{extension}', media_type, dedup)
+        # 只在这里检查一次任务池上限，被拒绝时不创建任务
+        work = pool.submit(None, len(questions), write_export_file, str(job.path), writer.name, questions,
+                           dedup, group_by, layout, job.progress, timeout=EXPORT_JOB_TIMEOUT)
+        self.jobs[job_id] = job
+        job.task = asyncio.ensure_future(self._run(job, work))
+        # 任务在开始执行前就被取消时 _run 不会运行，同时取消导出
+        job.task.add_done_callback(lambda _: work.cancel())
+        await self._publish(job)
+        return job
+
+    async def _publish(self, job):
+        """把任务信息同步到共享状态，其他进程请求取消时取消任务；共享状态繁忙时跳过，下次再同步"""
+        if self.state is None or job.id not in self.jobs:
+            return
+        try:
+            cancel = await self.state.run(self.state.put_job, job.id, job.info(self.ttl), str(job.path), job.media_type)
+        except sqlite3.OperationalError:
+            return
+        if cancel:
+            await self.delete(job.id)
+
+    async def _sync_progress(self, job):
+        while True:
+            await asyncio.sleep(EXPORT_JOB_PUBLISH_INTERVAL)
+            await self._publish(job)
+
+    async def _run(self, job, work):
+        sync = asyncio.ensure_future(self._sync_progress(job)) if self.state is not None else None
+        try:
+            size, duplicate_count, written = await work
+        except asyncio.CancelledError:
+            job.status = 'cancelled'
+        except Exception as e:
+            job.status = 'failed'
+            job.error = str(e)
+        else:
+            job.size = size
+            job.duplicate_count = duplicate_count
+            job.progress.total = job.progress.written = written
+            job.status = 'done'
+            metrics.observe_export(job.writer.name, job.total, job.perf_start)
+        finally:
+            if sync is not None:
+                sync.cancel()
+            job.finished = time.time()
+            await self._publish(job)
+            await self.cleanup()
+
+    async def get(self, job_id):
+        """本进程的任务，或共享状态中其他进程的任务（已过期的返回 None）"""
+        job = self.jobs.get(job_id)
+        if self.state is None:
+            return job
+        row = await self.state.run(self.state.get_job, job_id)
+        if row is None:
+            # 已完成的任务被其他进程删除
+            self.jobs.pop(job_id, None)
+            return None
+        if job is not None:
+            return job
+        return None if self._expired(row, time.time()) else SharedExportJob(row)
+
+    async def delete(self, job_id):
+        """删除任务：未完成的先取消，已完成的删除文件"""
+        if self.state is not None and await self.get(job_id) is None:
+            return False
+        job = self.jobs.pop(job_id, None)
+        if job is None:
+            return await self._delete_shared(job_id)
+        # 任务自己收尾时（同步进度或清理）删除的不再取消
+        if job.task is not None and not job.task.done() and job.task is not asyncio.current_task():
+            job.task.cancel()
+        self._remove_file(job)
+        if self.state is not None:
+            await self.state.run(self.state.delete_job, job_id)
+        return True
+
+    async def _delete_shared(self, job_id):
+        """删除其他进程的任务：未完成的请求所在进程取消，已完成的直接删除文件"""
+        if self.state is None:
+            return False
+        row = await self.state.run(self.state.get_job, job_id)
+        if row is None:
+            return False
+        if row['info']['expiresAt'] is not None:
+            self._remove_file(SharedExportJob(row))
+            await self.state.run(self.state.delete_job, job_id)
+        else:
+            await self.state.run(self.state.cancel_job, job_id)
+        return True
+
+    def _expired(self, row, now):
+        expires = row['info']['expiresAt']
+        if expires is not None:
+            return now > expires
+        return now - row['updated'] > STALE_AFTER
+
+    @staticmethod
+    def _remove_file(job):
+        try:
+            os.remove(job.path)
+        except FileNotFoundError:
+            pass
+
+    async def cleanup(self, reserve=0):
+        """删除过期任务，文件总大小或任务数（加上 reserve 个待创建的任务）超出上限时删除最早完成的任务"""
+        now = time.time()
+        for job in list(self.jobs.values()):
+            if job.finished is not None and now - job.finished > self.ttl:
+                await self.delete(job.id)
+
+        finished = sorted((job for job in self.jobs.values() if job.finished is not None), key=lambda job: job.finished)
+        total_bytes = sum(job.size or 0 for job in finished)
+        for job in finished:
+            if total_bytes <= self.max_bytes and len(self.jobs) + reserve <= self.max_jobs:
+                break
+            total_bytes -= job.size or 0
+            await self.delete(job.id)
+
+        if self.state is not None:
+            # 其他进程的过期任务，以及所在进程已退出的未完成任务；共享状态繁忙时留到下次清理
+            try:
+                rows = await self.state.run(self.state.list_jobs)
+                for row in rows:
+                    if row['id'] not in self.jobs and self._expired(row, now):
+                        self._remove_file(SharedExportJob(row))
+                        await self.state.run(self.state.delete_job, row['id'])
+            except sqlite3.OperationalError:
+                pass
+
+    def clear_directory(self):
+        """删除上次运行残留的文件（任务信息只保存在内存中，这些文件已无法下载），保留共享状态中仍有记录的任务文件"""
+        if not self.directory.is_dir():
+            return
+        keep = {Path(row['path']).name for row in self.state.list_jobs()} if self.state is not None else set()
+        for path in self.directory.iterdir():
+            if path.is_file() and path.name not in keep:
+                path.unlink()
+
+    async def _cleanup_loop(self):
+        while True:
+            await asyncio.sleep(EXPORT_JOB_CLEANUP_INTERVAL)
+            await self.cleanup()
+
+    def start(self):
+        """清理残留文件并启动定期清理（在应用启动时调用）"""
+        self.state = get_shared_state()
+        self.clear_directory()
+        if self._cleanup_task is None or self._cleanup_task.done():
+            self._cleanup_task = asyncio.get_running_loop().create_task(self._cleanup_loop())
+
+    async def stop(self):
+        """停止定期清理，取消未完成的任务"""
+        if self._cleanup_task is not None:
+            self._cleanup_task.cancel()
+            self._cleanup_task = None
+        tasks = [job.task for job in self.jobs.values() if job.task is not None and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+
+export_jobs = ExportJobStore()
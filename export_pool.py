@@ -0,0 +1,336 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+导出任务池
+
+去重、分组和生成文件都是 CPU 密集的同步操作，放在事件循环上执行会卡住
+所有正在进行的流式接口。导出任务交给线程池或进程池（EXPORT_WORKER_MODE）执行：
+- 同时执行 EXPORT_WORKERS 个任务，最多再排队 EXPORT_QUEUE_SIZE 个，超出时返回 503
+- 单次导出超过 EXPORT_MAX_QUESTIONS 道题返回 413
+- 任务（含排队时间）超过 EXPORT_TIMEOUT 秒返回 504
+- 客户端断开时取消任务：排队中的直接移除，线程中正在生成的在下一批题目处中止
+
+分文件打包的 zip 每组是一个任务，在工作池中生成和压缩，先完成的组先发送（stream_grouped_zip）。
+"""
+import asyncio
+import io
+import multiprocessing
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from config import EXPORT_WORKER_MODE, EXPORT_WORKERS, EXPORT_QUEUE_SIZE, EXPORT_MAX_QUESTIONS, EXPORT_TIMEOUT
+from dedup import DEDUP_MODES, deduplicate
+from excel_service import export_to_excel, export_groups_to_excel
+from export_writers import WRITERS
+from grouped_export import (GROUP_FIELDS, FILE_NAME_INVALID, ZipStream, group_questions, sheet_groups, unique_names,
+                            zip_entry, append_entry)
+
+LAYOUTS = ('sheets', 'files')
+CANCEL_CHECK_INTERVAL = 500    # 每写入多少道题检查一次取消标记
+DISCONNECT_POLL_INTERVAL = 0.5
+
+
+class ExportRejected(Exception):
+    """导出任务被拒绝或超时，status_code 为返回给客户端的状态码"""
+
+    def __init__(self, status_code, message):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class ExportCancelled(Exception):
+    """客户端断开或超时，任务已中止"""
+
+
+def check_export_options(writer, dedup, group_by, layout):
+    """校验导出参数，不合法时抛出 ValueError"""
+    if dedup not in DEDUP_MODES:
+        raise ValueError(f"未知的去重模式: {dedup}，可选: {', '.join(DEDUP_MODES)}")
+    if not group_by:
+        return
+    if group_by not in GROUP_FIELDS:
+        raise ValueError(f"不支持的分组方式: {group_by}，可选: {', '.join(GROUP_FIELDS)}")
+    if layout not in LAYOUTS:
+        raise ValueError(f"不支持的分组导出方式: {layout}，可选: {', '.join(LAYOUTS)}")
+    if layout == 'sheets' and not writer.multi_sheet:
+        raise ValueError(f'{writer.name} 格式不支持多个工作表，请使用 layout=files')
+
+
+def until_cancelled(questions, cancel):
+    """
+    逐个产出题目，取消标记被设置后提前结束
+
+    不在写入中途抛出异常，让 openpyxl 正常收尾（只写入了部分题目），由调用方丢弃结果
+    """
+    for i, question in enumerate(questions):
+        if cancel is not None and i % CANCEL_CHECK_INTERVAL == 0 and cancel.is_set():
+            return
+        yield question
+
+
+def raise_if_cancelled(cancel):
+    if cancel is not None and cancel.is_set():
+        raise ExportCancelled('导出已取消')
+
+
+def prepare_export(questions, dedup, group_by, cancel=None):
+    """
+    去重并分组（在工作池中执行）
+
+    返回:
+        (题目列表, 需要高亮的题目序号集合, 重复题数量, 分组列表或 None)
+    """
+    questions, flagged, duplicates = deduplicate(questions, dedup)
+    raise_if_cancelled(cancel)
+    groups = group_questions(questions, group_by, flagged) if group_by else None
+    return questions, flagged, len(duplicates), groups
+
+
+def build_export(writer_name, questions, dedup, group_by, cancel=None):
+    """
+    去重、分组并生成导出文件（在工作池中执行）
+
+    返回:
+        (已定位到开头的缓冲文件对象, 重复题数量)
+    """
+    questions, flagged, duplicate_count, groups = prepare_export(questions, dedup, group_by, cancel)
+    writer = WRITERS[writer_name]
+    if groups is not None:
+        groups = [(name, until_cancelled(items, cancel), marks) for name, items, marks in sheet_groups(groups)]
+        buffer = export_groups_to_excel(groups, writer)
+    else:
+        buffer = export_to_excel(until_cancelled(questions, cancel), flagged, writer)
+    if cancel is not None and cancel.is_set():
+        buffer.close()
+        raise ExportCancelled('导出已取消')
+    return buffer, duplicate_count
+
+
+def build_group_entry(writer_name, filename, questions, flagged, cancel=None):
+    """
+    生成一个分组文件并压缩为单个 zip 条目（在工作池中执行）
+
+    返回:
+        (条目内容的缓冲文件, 题目数量)
+    """
+    writer = WRITERS[writer_name]
+    data = io.BytesIO()
+    count = writer.write(until_cancelled(questions, cancel), data, flagged)
+    raise_if_cancelled(cancel)
+    return io.BytesIO(zip_entry(filename, data.getvalue(), writer)), count
+
+
+def run_in_process(func, args):
+    """子进程入口：缓冲文件无法跨进程传递，读出为 bytes 返回"""
+    result = func(*args)
+    if hasattr(result[0], 'read'):
+        with result[0] as buffer:
+            return (buffer.read(),) + result[1:]
+    return result
+
+
+async def wait_disconnected(request):
+    """客户端断开时返回"""
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def discard_result(future):
+    """丢弃已放弃的任务的结果，及时关闭缓冲文件"""
+    if future.cancelled() or future.exception() is not None:
+        return
+    result = future.result()
+    if hasattr(result[0], 'close'):
+        result[0].close()
+
+
+class ExportPool:
+    """导出任务池，按 EXPORT_WORKER_MODE 使用线程池或进程池"""
+
+    def __init__(self, mode=EXPORT_WORKER_MODE, workers=EXPORT_WORKERS, queue_size=EXPORT_QUEUE_SIZE,
+                 max_questions=EXPORT_MAX_QUESTIONS, timeout=EXPORT_TIMEOUT):
+        if mode not in ('thread', 'process'):
+            raise ValueError(f'未知的导出任务池模式: {mode}')
+        self.mode = mode
+        self.workers = workers
+        self.queue_size = queue_size
+        self.max_questions = max_questions
+        self.timeout = timeout
+        self._executor = None
+        self._slots = None
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.rejected = 0
+        self.cancelled = 0
+        self.timeouts = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.mode == 'process':
+                # spawn 避免在多线程的服务进程中 fork
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='export')
+        return self._executor
+
+    def admit(self, count):
+        """检查题目数量和队列长度，不能接受新任务时抛出 ExportRejected"""
+        if count > self.max_questions:
+            self.rejected += 1
+            raise ExportRejected(413, f'单次最多导出 {self.max_questions} 道题，当前 {count} 道')
+        if self.pending >= self.workers + self.queue_size:
+            self.rejected += 1
+            raise ExportRejected(503, '导出任务过多，请稍后重试')
+
+    async def run(self, request, count, func, *args, timeout=None):
+        """
+        在工作池中执行 func(*args)，等待结果
+
+        参数:
+            request: 用于检测客户端断开，为 None 时不检测
+            count: 导出的题目数量，用于检查上限
+            timeout: 超时秒数，默认为 EXPORT_TIMEOUT
+
+        异常:
+            ExportRejected: 题目过多（413）、队列已满（503）或超时（504）
+            ExportCancelled: 客户端已断开
+            asyncio.CancelledError: 调用方被取消，任务也随之中止
+        """
+        return await self.submit(request, count, func, *args, timeout=timeout)
+
+    def submit(self, request, count, func, *args, timeout=None):
+        """
+        同 run，但立即检查上限并把任务放入队列（不能接受时同步抛出 ExportRejected），
+        返回等待结果的 asyncio.Task，供需要先确定能否接受、再等待结果的流式导出和后台导出任务使用
+        """
+        self.admit(count)
+        cancel = threading.Event() if self.mode == 'thread' else None
+        self.pending += 1
+        job = asyncio.ensure_future(self._execute(func, args, cancel))
+        job.add_done_callback(self._finish)
+        return asyncio.ensure_future(self._wait(request, job, cancel, timeout or self.timeout))
+
+    async def _wait(self, request, job, cancel, timeout):
+        watcher = asyncio.ensure_future(wait_disconnected(request)) if request is not None else None
+        try:
+            done, _ = await asyncio.wait([task for task in (job, watcher) if task is not None],
+                                         timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # 调用方被取消（如导出任务被删除）时一并中止任务
+            if cancel is not None:
+                cancel.set()
+            job.cancel()
+            self.cancelled += 1
+            raise
+        else:
+            if job in done:
+                return job.result()
+            if cancel is not None:
+                cancel.set()
+            job.cancel()
+            if watcher is not None and watcher in done:
+                self.cancelled += 1
+                raise ExportCancelled('客户端已断开')
+            self.timeouts += 1
+            raise ExportRejected(504, f'导出超过 {timeout} 秒未完成')
+        finally:
+            if watcher is not None:
+                watcher.cancel()
+
+    async def _execute(self, func, args, cancel):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.workers)
+        async with self._slots:
+            loop = asyncio.get_running_loop()
+            if self.mode == 'process':
+                future = loop.run_in_executor(self._get_executor(), run_in_process, func, args)
+            else:
+                future = loop.run_in_executor(self._get_executor(), lambda: func(*args, cancel=cancel))
+            self.running += 1
+            try:
+                result = await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # 已开始的任务无法强行终止，等它结束（或在取消检查点中止）后再释放名额
+                future.add_done_callback(discard_result)
+                await asyncio.wait([future])
+                raise
+            finally:
+                self.running -= 1
+        if self.mode == 'process' and isinstance(result[0], bytes):
+            result = (io.BytesIO(result[0]),) + result[1:]
+        return result
+
+    def _finish(self, job):
+        self.pending -= 1
+        if not job.cancelled() and job.exception() is None:
+            self.completed += 1
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'workers': self.workers,
+            'queueSize': self.queue_size,
+            'running': self.running,
+            'queued': self.pending - self.running,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'cancelled': self.cancelled,
+            'timeouts': self.timeouts
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+export_pool = ExportPool()
+
+
+def stream_grouped_zip(request, groups, writer, pool=export_pool):
+    """
+    每组一个文件打包为 zip，返回逐块产出 zip 内容的异步生成器
+
+    每组是导出任务池中的一个任务（生成并压缩），同时最多执行 pool.workers 组，先完成的组先追加到
+    zip 并发送。调用时即检查上限并提交第一批任务，不能接受时抛出 ExportRejected；之后的组在
+    发送过程中被拒绝、超时或客户端断开时抛出异常中止响应，客户端不会收到看似完整的 zip。
+    """
+    pool.admit(sum(len(items) for _, items, _ in groups))
+    names = unique_names([name for name, _, _ in groups], FILE_NAME_INVALID)
+    waiting = [(f'{name}.{writer.extension}', items, marks) for name, (_, items, marks) in zip(names, groups)]
+    running = set()
+
+    def submit():
+        filename, items, marks = waiting.pop(0)
+        running.add(pool.submit(request, len(items), build_group_entry, writer.name, filename, items, marks))
+
+    try:
+        while waiting and len(running) < pool.workers:
+            submit()
+    except ExportRejected:
+        for task in running:
+            task.cancel()
+        raise
+    return relay_groups(running, waiting, submit)
+
+
+async def relay_groups(running, waiting, submit):
+    stream = ZipStream()
+    try:
+        with zipfile.ZipFile(stream, 'w') as archive:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    running.discard(task)
+                    # ExportCancelled / ExportRejected 向上抛出，中止响应
+                    buffer, _ = task.result()
+                    with buffer:
+                        append_entry(archive, stream, buffer.getvalue())
+                    if waiting:
+                        submit()
+                yield stream.take()
+        yield stream.take()
+    finally:
+        for task in running:
+            task.cancel()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+题目导出格式
+
+每种格式一个 writer，按 HEADERS 的列顺序用 HeaderResolver 取值：
+- xlsx:      带样式的 Excel（generate_excel）
+- xlsx-fast: 不设置单元格样式的 Excel，只保留列宽和行高
+- csv:       UTF-8（带 BOM，Excel 可直接打开），逐行流式输出
+- jsonl:     每行一道题的 JSON，逐行流式输出
+- parquet:   列式存储，供数据分析使用（需要安装 pyarrow）
+
+可以流式输出的格式（StreamingWriter，streamable）不经过临时文件，直接边生成边发送。
+"""
+import csv
+import io
+import json
+from abc import ABC, abstractmethod
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.dimensions import SheetFormatProperties
+from config import EXPORT_CHUNK_SIZE
+from header_utils import HEADERS, HeaderResolver
+from generate_excel import (SHEET_TITLE, HEADER_ROW_HEIGHT, DATA_ROW_HEIGHT, DUPLICATE_FILL,
+                            create_excel_from_questions, create_excel_from_groups, adjust_column_width)
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+# 数据格式的列名：表头去掉换行，与题目 JSON 中常见的键一致
+FIELD_NAMES = [header.replace('\n', '') for header in HEADERS]
+PARQUET_BATCH_SIZE = 10000
+
+
+class ExportWriter(ABC):
+    """导出格式的基类，子类至少实现 write；缺少抽象方法的格式在注册（实例化）时即报错"""
+    name = ''
+    extension = ''
+    media_type = 'application/octet-stream'
+    streamable = False
+    # 是否支持把多组题目写入同一文件的多个工作表（write_groups）
+    multi_sheet = False
+
+    @abstractmethod
+    def write(self, questions, output, flagged=None):
+        """
+        写入可写的二进制文件对象
+
+        参数:
+            flagged: 需要标记的题目序号集合（近似重复题），不支持标记的格式忽略
+
+        返回:
+            写入的题目数量
+        """
+
+
+class StreamingWriter(ExportWriter):
+    """逐块生成的格式：子类实现 _chunks，可以边生成边发送"""
+    streamable = True
+
+    def write(self, questions, output, flagged=None):
+        count = 0
+        for chunk, rows in self._chunks(questions):
+            output.write(chunk)
+            count += rows
+        return count
+
+    def iter_bytes(self, questions):
+        """逐块产出导出内容"""
+        for chunk, _ in self._chunks(questions):
+            yield chunk
+
+    @abstractmethod
+    def _chunks(self, questions):
+        """逐块产出 (字节串, 该块包含的题目数)"""
+
+
+class StyledXlsxWriter(ExportWriter):
+    name = 'xlsx'
+    extension = 'xlsx'
+    media_type = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    multi_sheet = True
+
+    def write(self, questions, output, flagged=None):
+        return create_excel_from_questions(questions, output, flagged)
+
+    def write_groups(self, groups, output):
+        """groups: [(工作表名称, 题目列表, 需要高亮的题目序号集合或 None), ...]"""
+        return create_excel_from_groups(groups, output)
+
+
+class FastXlsxWriter(StyledXlsxWriter):
+    """只写值不设样式，重复题所在行仍以填充色标出"""
+    name = 'xlsx-fast'
+
+    def write(self, questions, output, flagged=None):
+        return self.write_groups([(SHEET_TITLE, questions, flagged)], output)
+
+    def write_groups(self, groups, output):
+        wb = Workbook(write_only=True)
+        count = 0
+        for title, questions, flagged in groups:
+            count += self._add_sheet(wb, title, questions, flagged)
+        wb.save(output)
+        return count
+
+    def _add_sheet(self, wb, title, questions, flagged):
+        ws = wb.create_sheet(title)
+        ws.sheet_format = SheetFormatProperties(defaultRowHeight=DATA_ROW_HEIGHT, customHeight=True)
+        ws.row_dimensions[1].height = HEADER_ROW_HEIGHT
+        adjust_column_width(ws)
+        ws.append(HEADERS)
+
+        resolver = HeaderResolver(HEADERS)
+        flagged = flagged or ()
+        count = 0
+        for question in questions:
+            row = resolver.resolve(question)
+            if count in flagged:
+                row = [self._flagged_cell(ws, value) for value in row]
+            ws.append(row)
+            count += 1
+        return count
+
+    @staticmethod
+    def _flagged_cell(ws, value):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.fill = DUPLICATE_FILL
+        return cell
+
+
+class CsvWriter(StreamingWriter):
+    name = 'csv'
+    extension = 'csv'
+    media_type = 'text/csv; charset=utf-8'
+
+    def _chunks(self, questions, chunk_size=EXPORT_CHUNK_SIZE):
+        resolver = HeaderResolver(HEADERS)
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        # BOM 让 Excel 按 UTF-8 打开
+        buffer.write('\ufeff')
+        writer.writerow(FIELD_NAMES)
+        rows = 0
+        for question in questions:
+            writer.writerow(resolver.resolve(question))
+            rows += 1
+            if buffer.tell() >= chunk_size:
+                yield buffer.getvalue().encode('utf-8'), rows
+                buffer.seek(0)
+                buffer.truncate()
+                rows = 0
+        yield buffer.getvalue().encode('utf-8'), rows
+
+
+class JsonLinesWriter(StreamingWriter):
+    name = 'jsonl'
+    extension = 'jsonl'
+    media_type = 'application/x-ndjson'
+
+    def _chunks(self, questions, chunk_size=EXPORT_CHUNK_SIZE):
+        resolver = HeaderResolver(HEADERS)
+        lines = []
+        size = 0
+        for question in questions:
+            line = json.dumps(dict(zip(FIELD_NAMES, resolver.resolve(question))), ensure_ascii=False) + '\n'
+            lines.append(line)
+            size += len(line)
+            if size >= chunk_size:
+                yield ''.join(lines).encode('utf-8'), len(lines)
+                lines = []
+                size = 0
+        if lines:
+            yield ''.join(lines).encode('utf-8'), len(lines)
+
+
+class ParquetWriter(ExportWriter):
+    """所有列按字符串存储，每 PARQUET_BATCH_SIZE 道题写一个行组"""
+    name = 'parquet'
+    extension = 'parquet'
+
+    def write(self, questions, output, flagged=None):
+        if not PYARROW_AVAILABLE:
+            raise RuntimeError('导出 Parquet 需要安装 pyarrow')
+        schema = pyarrow.schema([(name, pyarrow.string()) for name in FIELD_NAMES])
+        resolver = HeaderResolver(HEADERS)
+        count = 0
+        with pyarrow.parquet.ParquetWriter(output, schema) as writer:
+            batch = []
+            for question in questions:
+                batch.append([None if value is None else str(value) for value in resolver.resolve(question)])
+                if len(batch) >= PARQUET_BATCH_SIZE:
+                    count += self._write_batch(writer, schema, batch)
+                    batch = []
+            if batch:
+                count += self._write_batch(writer, schema, batch)
+        return count
+
+    @staticmethod
+    def _write_batch(writer, schema, batch):
+        columns = [pyarrow.array(column, type=pyarrow.string()) for column in zip(*batch)]
+        writer.write_table(pyarrow.Table.from_arrays(columns, schema=schema))
+        return len(batch)
+
+
+WRITERS = {writer.name: writer for writer in
+           (StyledXlsxWriter(), FastXlsxWriter(), CsvWriter(), JsonLinesWriter(), ParquetWriter())}
+
+
+def get_writer(name):
+    """按名称获取导出格式，未知格式抛出 ValueError"""
+    writer = WRITERS.get(name)
+    if writer is None:
+        raise ValueError(f"不支持的导出格式: {name}，可选: {', '.join(WRITERS)}")
+    if writer.name == 'parquet' and not PYARROW_AVAILABLE:
+        raise ValueError('导出 Parquet 需要安装 pyarrow')
+    return writer
@@ -6,9 +6,36 @@
 
 import json
 from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill, NamedStyle
 from openpyxl.utils import get_column_letter
-from header_utils import HEADERS, match_header
+from openpyxl.worksheet.dimensions import SheetFormatProperties
+from header_utils import HEADERS, HeaderResolver
+
+SHEET_TITLE = "题库（答案请直接导入）"
+HEADER_ROW_HEIGHT = 40
+DATA_ROW_HEIGHT = 30
+
+# 样式对象只创建一次，所有单元格共用
+THIN_BORDER = Border(
+    left=Side(style='thin'),
+    right=Side(style='thin'),
+    top=Side(style='thin'),
+    bottom=Side(style='thin')
+)
+HEADER_FONT = Font(name='宋体', size=11, bold=True)
+HEADER_ALIGNMENT = Alignment(horizontal='center', vertical='center', wrap_text=True)
+# 表头填充色（浅蓝色）
+HEADER_FILL = PatternFill(start_color="B4C7E7", end_color="B4C7E7", fill_type="solid")
+DATA_FONT = Font(name='宋体', size=11)
+DATA_ALIGNMENT = Alignment(horizontal='left', vertical='center', wrap_text=True)
+# 近似重复题的填充色（浅红色）
+DUPLICATE_FILL = PatternFill(start_color="F8CBAD", end_color="F8CBAD", fill_type="solid")
+
+# 命名样式：每个工作簿注册一次，单元格按名称引用，不再逐个设置字体、对齐和边框
+HEADER_STYLE = '题库表头'
+DATA_STYLE = '题库数据'
+DUPLICATE_STYLE = '题库重复题'
 
 
 def load_json_data(json_file):
@@ -30,73 +57,99 @@ def create_excel_from_json(json_file, output_file):
     data = load_json_data(json_file)
     questions = data.get('questions', [])
 
-    # 创建工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "题库（答案请直接导入）"
+    count = create_excel_from_questions(questions, output_file)
+    print(f"Excel文件已生成: {output_file}")
+    print(f"共导入 {count} 道题目")
+
+
+def create_excel_from_questions(questions, output, flagged=None):
+    """
+    直接从题目列表创建Excel文件（只写模式，逐行写出，内存占用低）
+
+    参数:
+        questions: 题目字典的可迭代对象
+        output: 输出的Excel文件路径，或可写的二进制文件对象
+        flagged: 需要高亮的题目序号集合（从 0 开始），用于标记近似重复题
+
+    返回:
+        写入的题目数量
+    """
+    return create_excel_from_groups([(SHEET_TITLE, questions, flagged)], output)
+
+
+def create_excel_from_groups(groups, output):
+    """
+    每组题目写入一个工作表
+
+    参数:
+        groups: [(工作表名称, 题目列表, 需要高亮的题目序号集合或 None), ...]
+        output: 输出的Excel文件路径，或可写的二进制文件对象
+
+    返回:
+        写入的题目总数
+    """
+    # 创建只写工作簿
+    wb = Workbook(write_only=True)
+    register_styles(wb)
+    count = 0
+    for title, questions, flagged in groups:
+        count += add_question_sheet(wb, title, questions, flagged)
+
+    # 保存文件
+    wb.save(output)
+    return count
+
+
+def add_question_sheet(wb, title, questions, flagged=None):
+    """在只写工作簿中添加一个题目工作表，返回写入的题目数量"""
+    ws = wb.create_sheet(title)
+
+    # 行高和列宽必须在写入数据之前设置
+    ws.sheet_format = SheetFormatProperties(defaultRowHeight=DATA_ROW_HEIGHT, customHeight=True)
+    ws.row_dimensions[1].height = HEADER_ROW_HEIGHT
+    adjust_column_width(ws)
 
     # 写入表头并设置样式
     setup_header(ws, HEADERS)
 
     # 写入数据
-    write_data(ws, questions, HEADERS)
+    return write_data(ws, questions, HEADERS, flagged)
 
-    # 调整列宽
-    adjust_column_width(ws)
 
-    # 保存文件
-    wb.save(output_file)
-    print(f"Excel文件已生成: {output_file}")
-    print(f"共导入 {len(questions)} 道题目")
+def register_styles(wb):
+    """在工作簿中注册表头、数据和重复题的命名样式（命名样式会绑定到工作簿，因此每次新建）"""
+    wb.add_named_style(NamedStyle(name=HEADER_STYLE, font=HEADER_FONT, alignment=HEADER_ALIGNMENT,
+                                  border=THIN_BORDER, fill=HEADER_FILL))
+    wb.add_named_style(NamedStyle(name=DATA_STYLE, font=DATA_FONT, alignment=DATA_ALIGNMENT, border=THIN_BORDER))
+    wb.add_named_style(NamedStyle(name=DUPLICATE_STYLE, font=DATA_FONT, alignment=DATA_ALIGNMENT,
+                                  border=THIN_BORDER, fill=DUPLICATE_FILL))
 
 
 def setup_header(ws, headers):
-    """设置表头样式"""
-    # 定义边框样式
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-
-    # 定义表头填充色（浅蓝色）
-    header_fill = PatternFill(start_color="B4C7E7", end_color="B4C7E7", fill_type="solid")
-
-    # 写入表头
-    for col_idx, header in enumerate(headers, 1):
-        cell = ws.cell(row=1, column=col_idx)
-        cell.value = header
-        cell.font = Font(name='宋体', size=11, bold=True)
-        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
-        cell.border = thin_border
-        cell.fill = header_fill
-
-    # 设置表头行高
-    ws.row_dimensions[1].height = 40
-
-
-def write_data(ws, questions, headers):
-    """写入题目数据"""
-    # 定义边框样式
-    thin_border = Border(
-        left=Side(style='thin'),
-        right=Side(style='thin'),
-        top=Side(style='thin'),
-        bottom=Side(style='thin')
-    )
-
-    # 从第2行开始写入数据
-    for row_idx, question in enumerate(questions, 2):
-        for col_idx, header in enumerate(headers, 1):
-            cell = ws.cell(row=row_idx, column=col_idx)
-            cell.value = match_header(header, question)
-            cell.font = Font(name='宋体', size=11)
-            cell.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
-            cell.border = thin_border
-
-        # 设置数据行高
-        ws.row_dimensions[row_idx].height = 30
+    """写入表头行并设置样式"""
+    row = []
+    for header in headers:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.style = HEADER_STYLE
+        row.append(cell)
+    ws.append(row)
+
+
+def write_data(ws, questions, headers, flagged=None):
+    """逐行写入题目数据，flagged 中的行使用高亮填充，返回写入的行数"""
+    resolver = HeaderResolver(headers)
+    flagged = flagged or ()
+    count = 0
+    for question in questions:
+        style = DUPLICATE_STYLE if count in flagged else DATA_STYLE
+        row = []
+        for value in resolver.resolve(question):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.style = style
+            row.append(cell)
+        ws.append(row)
+        count += 1
+    return count
 
 
 def adjust_column_width(ws):
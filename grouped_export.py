@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+分组导出：按章节或题型分组，每组一个工作表，或每组一个文件打包为 zip
+
+分文件导出时每组在导出任务池中单独生成并压缩为一个 zip 条目（zip_entry），先生成完的组
+先由事件循环原样追加到 zip 流（append_entry）并发送，见 export_pool.stream_grouped_zip；
+后台导出任务在一个任务中按顺序写入（write_grouped_zip）。
+"""
+import io
+import re
+import zipfile
+from header_utils import HEADER_MAPPING, HeaderResolver
+
+GROUP_FIELDS = {'chapter': '章节', 'type': '题型'}
+UNGROUPED = '未分组'
+SHEET_NAME_MAX = 31   # Excel 工作表名称的长度上限
+SHEET_NAME_INVALID = re.compile(r'[\[\]:*?/\\]')
+FILE_NAME_INVALID = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+
+def group_questions(questions, by, flagged=None):
+    """
+    按章节（by='chapter'）或题型（by='type'）分组，组的顺序为首次出现的顺序
+
+    返回:
+        [(组名, 题目列表, 组内需要高亮的题目序号集合), ...]
+    """
+    if by not in GROUP_FIELDS:
+        raise ValueError(f"不支持的分组方式: {by}，可选: {', '.join(GROUP_FIELDS)}")
+    resolver = HeaderResolver([HEADER_MAPPING[GROUP_FIELDS[by]]])
+    flagged = flagged or ()
+    groups = {}
+    for i, question in enumerate(questions):
+        value = resolver.resolve(question)[0] if isinstance(question, dict) else None
+        name = str(value).strip() if value is not None else ''
+        items, marks = groups.setdefault(name or UNGROUPED, ([], set()))
+        if i in flagged:
+            marks.add(len(items))
+        items.append(question)
+    return [(name, items, marks) for name, (items, marks) in groups.items()]
+
+
+def unique_names(names, invalid, max_length=None):
+    """替换非法字符并截断，重名时追加序号"""
+    used = set()
+    result = []
+    for name in names:
+        base = invalid.sub('_', name).strip() or UNGROUPED
+        if max_length:
+            base = base[:max_length]
+        candidate, n = base, 2
+        while candidate.lower() in used:
+            suffix = f'({n})'
+            candidate = (base[:max_length - len(suffix)] if max_length else base) + suffix
+            n += 1
+        used.add(candidate.lower())
+        result.append(candidate)
+    return result
+
+
+def sheet_groups(groups):
+    """把组名转换为合法且不重复的工作表名称"""
+    names = unique_names([name for name, _, _ in groups], SHEET_NAME_INVALID, SHEET_NAME_MAX)
+    return [(name, items, marks) for name, (_, items, marks) in zip(names, groups)]
+
+
+def zip_compression(writer):
+    """xlsx / parquet 本身已压缩，只压缩文本格式"""
+    return zipfile.ZIP_DEFLATED if writer.streamable else zipfile.ZIP_STORED
+
+
+class ZipStream:
+    """只能追加的输出：zipfile 写入后由 take() 取走，zipfile 因无法 seek 会使用数据描述符"""
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.offset = 0
+
+    def write(self, data):
+        self.buffer += data
+        self.offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.offset
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = bytes(self.buffer)
+        self.buffer.clear()
+        return data
+
+
+def zip_entry(filename, data, writer):
+    """把一个分组文件压缩为只有一个条目的 zip（在导出任务池中执行），由 append_entry 追加到 zip 流"""
+    output = io.BytesIO()
+    with zipfile.ZipFile(output, 'w') as archive:
+        archive.writestr(filename, data, compress_type=zip_compression(writer))
+    return output.getvalue()
+
+
+def append_entry(archive, stream, entry):
+    """
+    把 zip_entry 生成的条目原样追加到 archive（写入 stream），不再解压和压缩
+
+    条目记录在 archive 的文件列表中，关闭 archive 时由 zipfile 写出中央目录
+    """
+    with zipfile.ZipFile(io.BytesIO(entry)) as source:
+        info = source.infolist()[0]
+        end = source.start_dir
+    info.header_offset = stream.tell()
+    stream.write(entry[:end])
+    archive.filelist.append(info)
+    archive.NameToInfo[info.filename] = info
+    archive.start_dir = stream.tell()
+    archive._didModify = True
+
+
+def write_grouped_zip(groups, writer, output):
+    """
+    每组生成一个文件，按顺序压缩写入 zip（在导出任务池中执行，用于后台导出任务）
+
+    返回:
+        写入的题目总数
+    """
+    names = unique_names([name for name, _, _ in groups], FILE_NAME_INVALID)
+    count = 0
+    with zipfile.ZipFile(output, 'w') as archive:
+        for name, (_, items, marks) in zip(names, groups):
+            data = io.BytesIO()
+            count += writer.write(items, data, marks)
+            archive.writestr(f'{name}.{writer.extension}', data.getvalue(), compress_type=zip_compression(writer))
+    return count
@@ -1,5 +1,6 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+from functools import lru_cache
 
 # 表头映射表（统一管理所有字段）
 HEADER_MAPPING = {
@@ -48,16 +49,9 @@ def match_header(header, question):
     #     value = question.get(key)
     #     if value is not None:
     #         return value
-    # 去除表头中的换行符，便于后续匹配
-    target = header.replace('\n', '')
-    # 遍历 HEADER_MAPPING，检查映射表中的 key 是否出现在 target 中
-    # 若出现，则将 target 替换为对应的 key，并终止循环
-    for key, value in HEADER_MAPPING.items():
-        if key in target:
-            target = key
-            break
-    
-    # 再次遍历 question 字典，检查其 target 是否出现在 key 中
+    target = header_target(header)
+
+    # 遍历 question 字典，检查其 target 是否出现在 key 中
     # 若出现，则返回对应的 value
     for key, value in question.items():
         if target in key:
@@ -65,6 +59,59 @@ def match_header(header, question):
     return None
 
 
+@lru_cache(maxsize=256)
+def header_target(header):
+    """
+    将标准表头归一化为用于匹配题目键的目标文本（结果会被缓存）
+
+    例如 "选项H\n(勿删)" -> "H"，"正确答案\n（必填）" -> "正确答案"
+    """
+    # 去除表头中的换行符，便于后续匹配
+    target = header.replace('\n', '')
+    # 遍历 HEADER_MAPPING，检查映射表中的 key 是否出现在 target 中
+    # 若出现，则将 target 替换为对应的 key，并终止循环
+    for key in HEADER_MAPPING:
+        if key in target:
+            return key
+    return target
+
+
+class HeaderResolver:
+    """
+    预编译的表头解析器，与 match_header 的匹配规则完全一致
+
+    按题目字典的键序列（键的形状）缓存每个表头对应的键，同一批题目
+    通常只有少数几种键的写法，因此每行只需一次字典查找即可取出整行数据。
+    """
+
+    def __init__(self, headers=HEADERS, max_shapes=1024):
+        self.headers = list(headers)
+        self.targets = [header_target(header) for header in self.headers]
+        self.max_shapes = max_shapes
+        self._shapes = {}
+
+    def compile(self, shape):
+        """计算键序列 shape 中每个表头匹配到的键，未匹配的为 None"""
+        keys = []
+        for target in self.targets:
+            keys.append(next((key for key in shape if target in key), None))
+        return tuple(keys)
+
+    def keys_for(self, question):
+        """返回题目各列对应的键（带缓存）"""
+        shape = tuple(question)
+        keys = self._shapes.get(shape)
+        if keys is None:
+            if len(self._shapes) >= self.max_shapes:
+                self._shapes.clear()
+            keys = self._shapes[shape] = self.compile(shape)
+        return keys
+
+    def resolve(self, question):
+        """一次取出整行数据，顺序与 headers 一致"""
+        return [None if key is None else question[key] for key in self.keys_for(question)]
+
+
 def get_question_type(question):
     """获取题目类型"""
     return match_header(HEADER_MAPPING['题型'], question)
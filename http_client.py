@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+上游 AI 接口的共享连接池
+
+每个上游地址（scheme://host:port）在应用生命周期内只创建一个 httpx.AsyncClient，
+开启 keep-alive 和 HTTP/2，并统计连接复用情况。
+"""
+import httpx
+from config import HTTP_MAX_CONNECTIONS, HTTP_MAX_KEEPALIVE_CONNECTIONS, HTTP_KEEPALIVE_EXPIRY, HTTP2_ENABLED
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class UpstreamError(Exception):
+    """上游接口返回错误状态码"""
+
+    def __init__(self, status_code, body='', retry_after=None):
+        super().__init__(f"上游接口返回 {status_code}: {body[:200]}")
+        self.status_code = status_code
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self):
+        """429 和 5xx 可以重试"""
+        return self.status_code == 429 or self.status_code >= 500
+
+
+class PoolStats:
+    """单个上游的连接统计"""
+
+    def __init__(self):
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+        self.http2_requests = 0
+
+    async def trace(self, event_name, info):
+        """httpcore 的 trace 回调，只有新建连接时才会触发 connect_tcp"""
+        if event_name == 'connection.connect_tcp.complete':
+            self.connections_opened += 1
+        elif event_name == 'connection.start_tls.complete':
+            self.tls_handshakes += 1
+        elif event_name == 'http2.send_request_headers.started':
+            self.http2_requests += 1
+
+    def to_dict(self):
+        reused = max(self.requests - self.connections_opened, 0)
+        return {
+            "requests": self.requests,
+            "connections_opened": self.connections_opened,
+            "tls_handshakes": self.tls_handshakes,
+            "http2_requests": self.http2_requests,
+            "reused_requests": reused,
+            "reuse_rate": round(reused / self.requests, 4) if self.requests else None
+        }
+
+
+class TracingTransport(httpx.AsyncHTTPTransport):
+    """在每个请求上挂载 trace 回调，用于统计连接复用"""
+
+    def __init__(self, stats, **kwargs):
+        super().__init__(**kwargs)
+        self.stats = stats
+
+    async def handle_async_request(self, request):
+        self.stats.requests += 1
+        request.extensions['trace'] = self.stats.trace
+        return await super().handle_async_request(request)
+
+
+_clients = {}
+_stats = {}
+
+
+def pool_key(api_url):
+    """上游地址归一化为 scheme://host:port"""
+    url = httpx.URL(api_url)
+    port = url.port or (443 if url.scheme == 'https' else 80)
+    return f"{url.scheme}://{url.host}:{port}"
+
+
+def get_client(api_url):
+    """获取（必要时创建）上游地址对应的共享客户端"""
+    key = pool_key(api_url)
+    client = _clients.get(key)
+    if client is None or client.is_closed:
+        stats = _stats.setdefault(key, PoolStats())
+        transport = TracingTransport(
+            stats,
+            http2=HTTP2_ENABLED and HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY
+            )
+        )
+        client = _clients[key] = httpx.AsyncClient(transport=transport, timeout=60.0)
+    return client
+
+
+async def close_clients():
+    """关闭所有共享客户端（应用退出时调用）"""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
+
+
+def get_pool_stats():
+    """各上游的连接复用统计"""
+    return {
+        "http2": HTTP2_ENABLED and HTTP2_AVAILABLE,
+        "pools": {key: stats.to_dict() for key, stats in _stats.items()}
+    }
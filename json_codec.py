@@ -0,0 +1,31 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式转发使用的 JSON 编解码
+
+安装了 orjson 时使用 orjson（解析上游增量和生成 SSE 帧都快数倍），否则使用标准库 json。
+输出不转义非 ASCII 字符，与 json.dumps(..., ensure_ascii=False) 等价（分隔符不含空格）；
+两者解析失败时都抛出 ValueError 的子类。
+"""
+import json
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+if ORJSON_AVAILABLE:
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode('utf-8')
+else:
+    loads = json.loads
+    _encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+    dumps = _encoder.encode
+
+
+def sse_frame(obj):
+    """SSE 数据帧"""
+    return f"data: {dumps(obj)}\n\n"
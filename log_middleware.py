@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+请求日志中间件（纯 ASGI 实现）
+
+请求体和响应体在转发的同时旁路捕获，最多 LOG_BODY_MAX_BYTES 字节，
+只有被采样的请求才会解析 JSON；流式响应和超大响应直接透传，不做任何缓冲。
+"""
+import json
+import random
+import time
+from config import LOG_BODY_MAX_BYTES, LOG_DEFAULT_SAMPLE_RATE, LOG_SAMPLE_RATES
+from logger import log_api_call
+
+
+def sample_rate(path):
+    """按最长匹配的路径前缀取采样率"""
+    best = None
+    for prefix in LOG_SAMPLE_RATES:
+        if path.startswith(prefix) and (best is None or len(prefix) > len(best)):
+            best = prefix
+    return LOG_SAMPLE_RATES[best] if best is not None else LOG_DEFAULT_SAMPLE_RATE
+
+
+class BodyCapture:
+    """有上限的字节捕获"""
+
+    def __init__(self, limit=LOG_BODY_MAX_BYTES):
+        self.limit = limit
+        self.buffer = bytearray()
+        self.size = 0
+
+    def feed(self, chunk):
+        self.size += len(chunk)
+        room = self.limit - len(self.buffer)
+        if room > 0:
+            self.buffer += chunk[:room]
+
+    @property
+    def truncated(self):
+        return self.size > len(self.buffer)
+
+    def decode(self):
+        """完整捕获时解析为 JSON，否则返回截断说明"""
+        if not self.size:
+            return None
+        if self.truncated:
+            return f"<{self.size} bytes, 超过 {self.limit} 字节未记录>"
+        try:
+            return json.loads(self.buffer.decode())
+        except ValueError:
+            return None
+
+
+def hide_secrets(body):
+    """隐藏敏感信息"""
+    if isinstance(body, dict) and 'apiKey' in body:
+        return {**body, 'apiKey': '***'}
+    return body
+
+
+class RequestLogMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'].startswith('/static'):
+            await self.app(scope, receive, send)
+            return
+
+        start_time = time.time()
+        sampled = random.random() < sample_rate(scope['path'])
+        request_capture = BodyCapture() if sampled and scope['method'] in ('POST', 'PUT', 'PATCH') else None
+        response_capture = None
+        status_code = 500
+        logged = False
+
+        async def receive_wrapper():
+            message = await receive()
+            if request_capture is not None and message['type'] == 'http.request':
+                request_capture.feed(message.get('body', b''))
+            return message
+
+        def write_log():
+            nonlocal logged
+            logged = True
+            log_api_call(
+                method=scope['method'],
+                path=scope['path'],
+                status_code=status_code,
+                request_body=hide_secrets(request_capture.decode()) if request_capture else None,
+                response_body=response_capture.decode() if response_capture else None,
+                duration_ms=int((time.time() - start_time) * 1000)
+            )
+
+        async def send_wrapper(message):
+            nonlocal status_code, response_capture
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+                if sampled:
+                    headers = dict(message.get('headers', []))
+                    content_type = headers.get(b'content-type', b'')
+                    content_length = int(headers.get(b'content-length', 0) or 0)
+                    if content_type.startswith(b'application/json') and content_length <= LOG_BODY_MAX_BYTES:
+                        response_capture = BodyCapture()
+            elif message['type'] == 'http.response.body':
+                if response_capture is not None:
+                    response_capture.feed(message.get('body', b''))
+                if not message.get('more_body', False):
+                    await send(message)
+                    write_log()
+                    return
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            if not logged:
+                write_log()
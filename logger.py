@@ -1,17 +1,43 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
+"""
+API 调用日志
+
+log_api_call 只把日志放入队列并更新内存中的最近日志，由后台写入任务批量追加到
+JSON Lines 文件，文件超过大小上限时轮转，不在请求路径上做磁盘 I/O。
+多个工作进程时，最近日志保存在共享状态中，写文件和轮转在共享状态的写事务中进行，
+避免多个进程同时轮转。
+
+旧版本把最近 50 条日志写成一个 JSON 数组，启动时发现这种文件会先转换为 JSON Lines
+（见 migrate_legacy_log），不会在同一个文件中混用两种格式。
+"""
+import asyncio
 import json
 import os
+import sqlite3
+from collections import deque
 from datetime import datetime
 from pathlib import Path
+from shared_state import get_shared_state
 
 LOG_DIR = Path(__file__).parent / "log"
 LOG_FILE = LOG_DIR / "api.log"
 MAX_ENTRIES = 50
+LOG_MAX_BYTES = 10 * 1024 * 1024   # 单个日志文件大小上限
+LOG_BACKUP_COUNT = 3               # 保留的轮转文件数（api.log.1 ~ api.log.3）
+LOG_QUEUE_SIZE = 10000             # 待写入日志上限，写入跟不上时丢弃新日志
+
+_recent = deque(maxlen=MAX_ENTRIES)
+_pending = deque()
+_wakeup = None
+_writer_task = None
+_closing = False
+dropped_entries = 0
 
 
 def log_api_call(method, path, status_code, request_body=None, response_body=None, duration_ms=0):
     """记录 API 调用到日志文件和控制台"""
+    global dropped_entries
     timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
     # 准备日志条目
@@ -28,26 +54,140 @@ def log_api_call(method, path, status_code, request_body=None, response_body=Non
     # 控制台输出（截断到100字符）
     console_msg = f"[{timestamp}] {method} {path} {status_code} {duration_ms}ms"
     if request_body:
-        req_str = str(request_body)[:100]
-        console_msg += f" | Req: {req_str}{'...' if len(str(request_body)) > 100 else ''}"
+        req_str = str(request_body)
+        console_msg += f" | Req: {req_str[:100]}{'...' if len(req_str) > 100 else ''}"
     if response_body:
-        resp_str = str(response_body)[:100]
-        console_msg += f" | Resp: {resp_str}{'...' if len(str(response_body)) > 100 else ''}"
+        resp_str = str(response_body)
+        console_msg += f" | Resp: {resp_str[:100]}{'...' if len(resp_str) > 100 else ''}"
     print(console_msg)
 
-    # 读取现有日志
-    logs = []
-    if LOG_FILE.exists():
+    # 最近日志保存在内存中，写文件交给后台任务
+    _recent.appendleft(log_entry)
+    if len(_pending) >= LOG_QUEUE_SIZE:
+        dropped_entries += 1
+        return
+    _pending.append(log_entry)
+    if _wakeup is not None:
+        _wakeup.set()
+
+
+async def get_recent_logs():
+    """
+    最近 MAX_ENTRIES 条日志，最新的在前（多个工作进程时包含所有进程已写入的日志，
+    共享状态繁忙时只返回本进程的日志）
+    """
+    state = get_shared_state()
+    if state is not None:
         try:
-            with open(LOG_FILE, 'r', encoding='utf-8') as f:
-                logs = json.load(f)
-        except:
-            logs = []
-
-    # 添加新日志并保持最多50条
-    logs.insert(0, log_entry)
-    logs = logs[:MAX_ENTRIES]
-
-    # 写入日志文件
-    with open(LOG_FILE, 'w', encoding='utf-8') as f:
-        json.dump(logs, f, ensure_ascii=False, indent=2)
+            return await state.run(state.recent_logs, MAX_ENTRIES)
+        except sqlite3.OperationalError:
+            pass
+    return list(_recent)
+
+
+def _rotate():
+    """api.log -> api.log.1 -> ... -> api.log.N，最旧的被覆盖"""
+    for i in range(LOG_BACKUP_COUNT - 1, 0, -1):
+        src = LOG_FILE.with_name(f"{LOG_FILE.name}.{i}")
+        if src.exists():
+            os.replace(src, LOG_FILE.with_name(f"{LOG_FILE.name}.{i + 1}"))
+    if LOG_BACKUP_COUNT > 0:
+        os.replace(LOG_FILE, LOG_FILE.with_name(f"{LOG_FILE.name}.1"))
+    else:
+        LOG_FILE.unlink()
+
+
+def _append_lines(entries):
+    """把一批日志追加到文件（在线程池中执行）"""
+    state = get_shared_state()
+    if state is None:
+        _write_lines(entries)
+        return
+    with state.transaction():
+        state.add_logs(entries, MAX_ENTRIES)
+        _write_lines(entries)
+
+
+def _write_lines(entries):
+    LOG_DIR.mkdir(exist_ok=True)
+    data = ''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in entries)
+    if LOG_FILE.exists() and LOG_FILE.stat().st_size + len(data) > LOG_MAX_BYTES:
+        _rotate()
+    with open(LOG_FILE, 'a', encoding='utf-8') as f:
+        f.write(data)
+
+
+def _drain():
+    """取出队列中已有的全部日志"""
+    entries = []
+    while _pending:
+        entries.append(_pending.popleft())
+    return entries
+
+
+async def _writer():
+    loop = asyncio.get_running_loop()
+    while True:
+        await _wakeup.wait()
+        _wakeup.clear()
+        entries = _drain()
+        if entries:
+            try:
+                await loop.run_in_executor(None, _append_lines, entries)
+            except (OSError, sqlite3.Error) as e:
+                print(f"写入日志失败: {e}")
+        if _closing:
+            return
+
+
+def migrate_legacy_log():
+    """
+    把旧版本写入的 JSON 数组（最新的在前）转换为 JSON Lines（最旧的在前），并载入最近日志；
+    无法解析时改名为 api.log.legacy 保留
+    """
+    try:
+        with open(LOG_FILE, 'r', encoding='utf-8') as f:
+            if f.read(64).lstrip()[:1] != '[':
+                return
+            f.seek(0)
+            entries = json.load(f)
+    except FileNotFoundError:
+        return
+    except ValueError:
+        os.replace(LOG_FILE, LOG_FILE.with_name(f'{LOG_FILE.name}.legacy'))
+        return
+    entries = [entry for entry in entries if isinstance(entry, dict)]
+    # 多个工作进程可能同时转换，各自写临时文件后原子替换，结果相同
+    temp = LOG_FILE.with_name(f'{LOG_FILE.name}.{os.getpid()}.tmp')
+    with open(temp, 'w', encoding='utf-8') as f:
+        f.write(''.join(json.dumps(entry, ensure_ascii=False, default=str) + '\n' for entry in reversed(entries)))
+    os.replace(temp, LOG_FILE)
+    if not _recent:
+        _recent.extend(entries[:MAX_ENTRIES])
+
+
+def start_log_writer():
+    """转换旧格式的日志文件并启动后台写入任务（在应用启动时调用）"""
+    global _wakeup, _writer_task, _closing
+    migrate_legacy_log()
+    if _writer_task is None or _writer_task.done():
+        _closing = False
+        _wakeup = asyncio.Event()
+        _writer_task = asyncio.get_running_loop().create_task(_writer())
+        if _pending:
+            _wakeup.set()
+
+
+async def stop_log_writer():
+    """停止后台写入任务，并写出队列中剩余的日志"""
+    global _wakeup, _writer_task, _closing
+    if _writer_task is not None:
+        _closing = True
+        _wakeup.set()
+        await _writer_task
+        _writer_task = None
+        _wakeup = None
+    else:
+        entries = _drain()
+        if entries:
+            await asyncio.get_running_loop().run_in_executor(None, _append_lines, entries)
@@ -0,0 +1,327 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Prometheus 格式的运行指标（GET /metrics）
+
+只实现用到的 Counter / Gauge / Histogram，不依赖 prometheus_client。指标都在事件循环
+线程中更新，不加锁；直方图记录一次只是一次二分查找和几次整数加法。
+标签值来自请求参数（模型名、上游地址），每个指标最多 METRICS_MAX_SERIES 组标签，
+超出的归入 "other"，避免标签基数无限增长。
+
+多个工作进程时各进程每 METRICS_PUBLISH_INTERVAL 秒把自己的数据写入共享状态，/metrics 输出
+所有进程的数据并加上 worker 标签（进程号），由 Prometheus 按需 sum；退出的进程的数据会被移除。
+"""
+import asyncio
+import bisect
+import json
+import os
+import sqlite3
+import time
+import httpx
+from starlette.concurrency import iterate_in_threadpool
+from config import METRICS_MAX_SERIES, METRICS_PUBLISH_INTERVAL
+from http_client import UpstreamError
+from shared_state import get_shared_state
+from utils import estimate_tokens
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+STALE_AFTER = 3 * METRICS_PUBLISH_INTERVAL   # 超过这么久没有发布的进程视为已退出
+
+_registry = []
+_publisher = None
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Metric:
+    kind = ''
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._series = {}
+        self._other = ('other',) * len(self.labels)
+        _registry.append(self)
+
+    def _get(self, values):
+        series = self._series.get(values)
+        if series is None:
+            if len(self._series) >= METRICS_MAX_SERIES:
+                values = self._other
+                series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = self._new()
+        return series
+
+    def _new(self):
+        return [0]
+
+    def render(self, workers=None):
+        """workers 为 [(进程号, 各组标签的数据)] 时输出各进程的数据，并加上 worker 标签"""
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        for worker, series in workers if workers is not None else [(None, self._series)]:
+            extra = f'worker="{worker}"' if worker is not None else ''
+            for values, data in series.items():
+                lines.extend(self._lines(values, data, extra))
+        return lines
+
+    def _lines(self, values, series, extra):
+        return [f'{self.name}{format_labels(self.labels, values, extra)} {series[0]}']
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, *values, amount=1):
+        self._get(values)[0] += amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def inc(self, *values):
+        self._get(values)[0] += 1
+
+    def dec(self, *values):
+        self._get(values)[0] -= 1
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labels=(), buckets=()):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+
+    def _new(self):
+        # 各区间的计数（最后一个为 +Inf），总和，总数
+        return [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+    def observe(self, value, *values):
+        series = self._get(values)
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def _lines(self, values, series, extra):
+        counts, total, count = series
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+            cumulative += bucket_count
+            le = 'le="+Inf"' if bound == float('inf') else f'le="{float(bound)!r}"'
+            lines.append(f"{self.name}_bucket{format_labels(self.labels, values, ','.join(filter(None, (extra, le))))} {cumulative}")
+        lines.append(f'{self.name}_sum{format_labels(self.labels, values, extra)} {total}')
+        lines.append(f'{self.name}_count{format_labels(self.labels, values, extra)} {count}')
+        return lines
+
+
+UPSTREAM_LABELS = ('model', 'upstream')
+
+UPSTREAM_REQUESTS = Counter('qbank_upstream_requests_total', '上游请求数（mode: stream 流式 / call 非流式）',
+                            UPSTREAM_LABELS + ('mode',))
+UPSTREAM_ERRORS = Counter('qbank_upstream_errors_total', '上游错误数（code: HTTP 状态码，429 为限流；timeout / network / other）',
+                          UPSTREAM_LABELS + ('code',))
+UPSTREAM_MALFORMED = Counter('qbank_upstream_malformed_chunks_total', '流式响应中无法解析、已跳过的数据帧', UPSTREAM_LABELS)
+UPSTREAM_TTFT = Histogram('qbank_upstream_ttft_seconds', '从发出请求到收到第一个文本增量的时间', UPSTREAM_LABELS,
+                          (0.1, 0.25, 0.5, 1, 2, 3, 5, 8, 13, 20, 30, 60))
+UPSTREAM_TOKEN_GAP = Histogram('qbank_upstream_token_gap_seconds', '相邻两个文本增量之间的间隔', UPSTREAM_LABELS,
+                               (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5))
+UPSTREAM_DURATION = Histogram('qbank_upstream_generation_seconds', '完整生成一次回复的时间', UPSTREAM_LABELS + ('mode',),
+                              (0.5, 1, 2.5, 5, 10, 20, 30, 60, 120, 300))
+UPSTREAM_TOKEN_RATE = Histogram('qbank_upstream_tokens_per_second', '输出速度（估算 token 数 / 首个增量之后的生成时间）',
+                                UPSTREAM_LABELS, (5, 10, 20, 30, 50, 75, 100, 150, 200, 300, 500))
+UPSTREAM_OUTPUT_TOKENS = Counter('qbank_upstream_output_tokens_total', '上游输出的估算 token 数', UPSTREAM_LABELS)
+UPSTREAM_USAGE_TOKENS = Counter('qbank_upstream_usage_tokens_total',
+                                'token 用量（kind: prompt / completion；source: reported 上游返回 / estimated 估算）',
+                                UPSTREAM_LABELS + ('kind', 'source'))
+UPSTREAM_TRUNCATED = Counter('qbank_upstream_truncated_total', '因达到输出上限（finish_reason 为 length）被截断的回复数',
+                             UPSTREAM_LABELS)
+UPSTREAM_STREAMS = Gauge('qbank_upstream_streams_inflight', '正在进行的上游流式请求数', ('upstream',))
+SSE_STREAMS = Gauge('qbank_sse_streams_inflight', '正在向客户端输出的 SSE 流数', ('endpoint',))
+ROUTER_EVENTS = Counter('qbank_router_events_total', '上游池的对冲和切换（event: hedge 发出对冲 / hedge_won 对冲胜出 / failover 输出前失败后切换）',
+                        ('provider', 'event'))
+EXPORT_DURATION = Histogram('qbank_export_duration_seconds', '导出耗时（含排队），按格式和题目数分档', ('format', 'rows'),
+                            (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600))
+
+ROW_BANDS = ((1000, '<1k'), (10000, '1k-10k'), (100000, '10k-100k'))
+
+
+def upstream_label(api_url):
+    return api_url.rstrip('/')
+
+
+def error_code(error):
+    if isinstance(error, UpstreamError):
+        return str(error.status_code)
+    if isinstance(error, httpx.TimeoutException):
+        return 'timeout'
+    if isinstance(error, httpx.TransportError):
+        return 'network'
+    return 'other'
+
+
+def record_error(model, api_url, error):
+    UPSTREAM_ERRORS.inc(model, upstream_label(api_url), error if isinstance(error, str) else error_code(error))
+
+
+class StreamTimer:
+    """一次上游流式调用的计时：首包时间、增量间隔、总耗时和输出速度"""
+    __slots__ = ('labels', 'start', 'first', 'last', 'parts')
+
+    def __init__(self, model, api_url):
+        self.labels = (model, upstream_label(api_url))
+        self.start = time.perf_counter()
+        self.first = None
+        self.last = None
+        self.parts = []
+        UPSTREAM_REQUESTS.inc(*self.labels, 'stream')
+        UPSTREAM_STREAMS.inc(self.labels[1])
+
+    def delta(self, text):
+        now = time.perf_counter()
+        if self.first is None:
+            self.first = now
+            UPSTREAM_TTFT.observe(now - self.start, *self.labels)
+        else:
+            UPSTREAM_TOKEN_GAP.observe(now - self.last, *self.labels)
+        self.last = now
+        if text:
+            self.parts.append(text)
+
+    def error(self, error):
+        UPSTREAM_ERRORS.inc(*self.labels, error_code(error))
+
+    def malformed(self):
+        UPSTREAM_MALFORMED.inc(*self.labels)
+
+    def finish(self, completed):
+        """completed 为 False（出错或客户端提前断开）时只更新进行中的流数"""
+        UPSTREAM_STREAMS.dec(self.labels[1])
+        if not completed:
+            return
+        UPSTREAM_DURATION.observe(time.perf_counter() - self.start, *self.labels, 'stream')
+        tokens = estimate_tokens(''.join(self.parts))
+        UPSTREAM_OUTPUT_TOKENS.inc(*self.labels, amount=tokens)
+        if tokens and self.last is not None and self.last > self.first:
+            UPSTREAM_TOKEN_RATE.observe(tokens / (self.last - self.first), *self.labels)
+
+
+def begin_call(model, api_url):
+    """开始一次非流式调用，返回开始时间"""
+    UPSTREAM_REQUESTS.inc(model, upstream_label(api_url), 'call')
+    return time.perf_counter()
+
+
+def record_call(model, api_url, start, text):
+    """记录一次成功的非流式调用"""
+    labels = (model, upstream_label(api_url))
+    elapsed = time.perf_counter() - start
+    UPSTREAM_DURATION.observe(elapsed, *labels, 'call')
+    tokens = estimate_tokens(text or '')
+    UPSTREAM_OUTPUT_TOKENS.inc(*labels, amount=tokens)
+    if tokens and elapsed > 0:
+        UPSTREAM_TOKEN_RATE.observe(tokens / elapsed, *labels)
+
+
+async def track_sse(endpoint, frames):
+    """包装 SSE 输出，统计正在进行的流数"""
+    SSE_STREAMS.inc(endpoint)
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        SSE_STREAMS.dec(endpoint)
+        await frames.aclose()
+
+
+def rows_band(rows):
+    for limit, label in ROW_BANDS:
+        if rows < limit:
+            return label
+    return '>=100k'
+
+
+def observe_export(format, rows, start):
+    EXPORT_DURATION.observe(time.perf_counter() - start, format, rows_band(rows))
+
+
+async def track_export_body(body, format, rows, start):
+    """包装边生成边发送的导出内容，发送完毕时记录导出耗时（同步迭代器在线程池中执行）"""
+    if not hasattr(body, '__aiter__'):
+        body = iterate_in_threadpool(body)
+    async for chunk in body:
+        yield chunk
+    observe_export(format, rows, start)
+
+
+def snapshot():
+    """本进程各指标的数据，{指标名: [[标签值, 数据], ...]}"""
+    return {metric.name: [[list(values), series] for values, series in metric._series.items()] for metric in _registry}
+
+
+def render(workers=None):
+    """workers 为 [(进程号, snapshot())] 时输出各进程的数据，并加上 worker 标签"""
+    lines = []
+    for metric in _registry:
+        if workers is None:
+            lines.extend(metric.render())
+        else:
+            lines.extend(metric.render([(worker, {tuple(values): series for values, series in data.get(metric.name, [])})
+                                        for worker, data in workers]))
+    return '\n'.join(lines) + '\n'
+
+
+async def render_all():
+    """/metrics 的内容：多个工作进程时包含共享状态中其他进程最近发布的数据（共享状态繁忙时只有本进程）"""
+    state = get_shared_state()
+    if state is None:
+        return render()
+    pid = os.getpid()
+    try:
+        rows = await state.run(state.worker_metrics, STALE_AFTER)
+    except sqlite3.OperationalError:
+        rows = []
+    workers = [(pid, snapshot())] + [(worker, json.loads(data)) for worker, data in rows if worker != pid]
+    return render(sorted(workers, key=lambda item: item[0]))
+
+
+async def _publish_loop(state):
+    while True:
+        await asyncio.sleep(METRICS_PUBLISH_INTERVAL)
+        try:
+            await state.run(state.put_metrics, json.dumps(snapshot()), STALE_AFTER)
+        except sqlite3.OperationalError:
+            pass
+
+
+def start_publisher():
+    """多个工作进程时启动定期发布指标的后台任务（在应用启动时调用）"""
+    global _publisher
+    state = get_shared_state()
+    if state is not None and (_publisher is None or _publisher.done()):
+        _publisher = asyncio.get_running_loop().create_task(_publish_loop(state))
+
+
+async def stop_publisher():
+    """停止发布，并移除本进程的数据"""
+    global _publisher
+    if _publisher is None:
+        return
+    _publisher.cancel()
+    _publisher = None
+    state = get_shared_state()
+    try:
+        await state.run(state.delete_metrics)
+    except sqlite3.OperationalError:
+        pass
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+本地预审
+
+不调用 AI，机械地检查生成结果中可以确定的问题：题目数量、必填字段、
+答案对应的选项是否存在、重复题干、题干是否出自原文。结果为 pass 的
+输入可以跳过 AI 对比审核，fail / uncertain 的再交给 compare_files_stream。
+"""
+import re
+from collections import defaultdict
+from header_utils import HEADER_MAPPING, HeaderResolver
+from stream_parser import extract_questions
+
+# 原文中的一级题号（"1." "2、" "3）"），小题和大题标题不计数
+NUMBERED_LINE = re.compile(r'^\s*\d+\s*[.、．:：)）]', re.M)
+ANSWER_LETTERS = re.compile(r'^[A-H]+$')
+ANSWER_SEPARATORS = re.compile(r'[\s,，、;；]')
+# 比较题干时忽略的字符：空白、标点、括号中的占位空格等
+STEM_NOISE = re.compile(r'[\s\W_]+')
+
+OPTION_LETTERS = 'ABCDEFGH'
+AUDIT_HEADERS = ['题干', '题型', '正确答案'] + list(OPTION_LETTERS)
+
+DUPLICATE_THRESHOLD = 0.8   # 题干二元组 Jaccard 相似度达到该值视为重复
+COVERAGE_THRESHOLD = 0.5    # 题干二元组出现在原文中的比例低于该值视为可能不是出自原文
+
+_resolver = HeaderResolver([HEADER_MAPPING[key] for key in AUDIT_HEADERS])
+
+
+def normalize_stem(stem):
+    """去掉空白和标点，用于比较题干"""
+    return STEM_NOISE.sub('', str(stem or ''))
+
+
+def bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} or ({text} if text else set())
+
+
+def expected_count(source):
+    """原文中带题号的题目数，没有题号时返回 None"""
+    return len(NUMBERED_LINE.findall(source)) or None
+
+
+def find_duplicates(stems, threshold=DUPLICATE_THRESHOLD):
+    """
+    查找相似题干
+
+    用二元组倒排索引找出至少共享一个二元组的候选对，只对候选对计算相似度。
+
+    返回:
+        [(i, j, 相似度)]，i < j
+    """
+    index = defaultdict(list)
+    shingles = []
+    for i, stem in enumerate(stems):
+        grams = bigrams(stem)
+        shingles.append(grams)
+        for gram in grams:
+            index[gram].append(i)
+
+    pairs = []
+    for i, grams in enumerate(shingles):
+        if not grams:
+            continue
+        shared = defaultdict(int)
+        for gram in grams:
+            for j in index[gram]:
+                if j > i:
+                    shared[j] += 1
+        for j, count in shared.items():
+            similarity = count / (len(grams) + len(shingles[j]) - count)
+            if similarity >= threshold:
+                pairs.append((i, j, round(similarity, 3)))
+    return pairs
+
+
+def audit_questions(questions, source):
+    """
+    检查题目列表
+
+    返回:
+        问题列表 [{'level': 'error'|'warning', 'code', 'index', 'message'}]，index 从 0 开始
+    """
+    issues = []
+
+    def add(level, code, index, message):
+        issues.append({'level': level, 'code': code, 'index': index, 'message': message})
+
+    expected = expected_count(source)
+    if expected is not None and len(questions) < expected:
+        add('error', 'count_mismatch', None, f'原文有 {expected} 道题，只生成了 {len(questions)} 道')
+    elif expected is not None and len(questions) > expected:
+        # 共用题干拆分等情况可能导致题目变多，交给 AI 判断
+        add('warning', 'count_mismatch', None, f'原文有 {expected} 道题，生成了 {len(questions)} 道')
+
+    source_grams = bigrams(normalize_stem(source))
+    stems = []
+    for i, question in enumerate(questions):
+        if not isinstance(question, dict):
+            add('error', 'invalid_question', i, f'第 {i + 1} 道题不是对象')
+            stems.append('')
+            continue
+        stem, question_type, answer, *options = _resolver.resolve(question)
+        stem = normalize_stem(stem)
+        stems.append(stem)
+        options = dict(zip(OPTION_LETTERS, options))
+
+        if not stem:
+            add('error', 'empty_field', i, f'第 {i + 1} 道题缺少题干')
+        if not question_type:
+            add('error', 'empty_field', i, f'第 {i + 1} 道题缺少题型')
+        # 填空题的答案写在选项中
+        if '填空' in str(question_type or ''):
+            if not options['A']:
+                add('error', 'empty_field', i, f'第 {i + 1} 道题（填空题）缺少答案')
+        elif answer is None or str(answer).strip() == '':
+            add('error', 'empty_field', i, f'第 {i + 1} 道题缺少正确答案')
+
+        letters = ANSWER_SEPARATORS.sub('', str(answer or '')).upper()
+        if ANSWER_LETTERS.match(letters):
+            missing = [letter for letter in letters if options[letter] in (None, '')]
+            if missing:
+                add('error', 'missing_option', i, f'第 {i + 1} 道题答案为 {letters}，但缺少选项 {"、".join(missing)}')
+
+        if stem and source_grams:
+            grams = bigrams(stem)
+            coverage = len(grams & source_grams) / len(grams)
+            if coverage < COVERAGE_THRESHOLD:
+                add('warning', 'stem_not_in_source', i, f'第 {i + 1} 道题的题干在原文中只找到 {coverage:.0%}')
+
+    for i, j, similarity in find_duplicates(stems):
+        add('warning', 'duplicate_stem', j, f'第 {j + 1} 道题与第 {i + 1} 道题题干相似（{similarity:.0%}）')
+
+    return issues
+
+
+def audit_pair(generated, source):
+    """
+    对比生成结果（JSON 文本）与原文
+
+    返回:
+        {'status': 'pass'|'fail'|'uncertain', 'questionCount', 'expectedCount', 'issues'}
+        有 error 为 fail；只有 warning 或原文没有题号无法核对数量时为 uncertain
+    """
+    questions = extract_questions(generated)
+    expected = expected_count(source)
+    if not isinstance(questions, list):
+        issue = {'level': 'error', 'code': 'parse_failed', 'index': None, 'message': '无法从生成结果中解析出题目'}
+        return {'status': 'fail', 'questionCount': 0, 'expectedCount': expected, 'issues': [issue]}
+
+    issues = audit_questions(questions, source)
+    if any(issue['level'] == 'error' for issue in issues):
+        status = 'fail'
+    elif issues or expected is None:
+        status = 'uncertain'
+    else:
+        status = 'pass'
+    return {'status': status, 'questionCount': len(questions), 'expectedCount': expected, 'issues': issues}
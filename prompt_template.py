@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+系统提示词模板
+
+模板按 {{name}} 占位符预先切分为片段，渲染结果按
+(模板文本, 题型, 目录, 示例题库) 缓存，同一批次的请求只渲染一次。
+"""
+import re
+from collections import OrderedDict
+from sample_bank import get_sample_bank
+from utils import load_system_prompt, estimate_tokens
+from usage import usage_tracker, cost_of
+
+PLACEHOLDER_PATTERN = re.compile(r'\{\{(\w+)\}\}')
+MAX_TEMPLATES = 32
+MAX_RENDERED = 256
+
+
+class PromptTemplate:
+    """切分后的模板：偶数位置为原文，奇数位置为占位符名"""
+
+    def __init__(self, text):
+        self.text = text
+        self.segments = PLACEHOLDER_PATTERN.split(text)
+        self.placeholders = set(self.segments[1::2])
+
+    def render(self, values):
+        """填入占位符，未提供值的占位符保持原样"""
+        parts = []
+        for i, segment in enumerate(self.segments):
+            if i % 2 == 0:
+                parts.append(segment)
+            elif segment in values:
+                parts.append(values[segment])
+            else:
+                parts.append('{{' + segment + '}}')
+        return ''.join(parts)
+
+
+class LRUCache(OrderedDict):
+    """简单的 LRU 字典"""
+
+    def __init__(self, max_size):
+        super().__init__()
+        self.max_size = max_size
+
+    def lookup(self, key):
+        value = self.get(key)
+        if value is not None:
+            self.move_to_end(key)
+        return value
+
+    def store(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.max_size:
+            self.popitem(last=False)
+        return value
+
+
+_templates = LRUCache(MAX_TEMPLATES)
+_rendered = LRUCache(MAX_RENDERED)
+
+
+def get_template(text):
+    """获取（必要时编译）模板"""
+    return _templates.lookup(text) or _templates.store(text, PromptTemplate(text))
+
+
+def render_system_prompt(question_types, system_prompt_override='', directory=''):
+    """
+    渲染生成题目的 system prompt
+
+    参数:
+        question_types: 题型列表，决定填入哪些示例
+        system_prompt_override: 自定义模板，为空时使用 system_prompt.txt 或默认模板
+        directory: 目录结构，为空时填入"无"
+    """
+    text = system_prompt_override if system_prompt_override else load_system_prompt()
+    bank = get_sample_bank()
+    key = (text, tuple(question_types), directory, bank)
+    rendered = _rendered.lookup(key)
+    if rendered is None:
+        rendered = _rendered.store(key, get_template(text).render({
+            'json_example': bank.examples_text(question_types),
+            'TOP': directory if directory else '无'
+        }))
+    return rendered
+
+
+def build_user_prompt(user_input):
+    """构建生成题目的 user prompt"""
+    return f"用户需求：\n{user_input}\n\n请按照system prompt中的格式要求生成题目。"
+
+
+def estimate_prompt_tokens(question_types, user_inputs, system_prompt_override='', directory='', model=''):
+    """
+    估算一批生成请求的 prompt token 数，供调用方按上游 TPM 限制规划批次
+
+    指定 model 时还按该模型当前的输出比例估算输出 token 数、每段材料的切分预算和费用
+    （输入超过预算时会切分为多段，每段都会重复发送 system prompt，prompt 部分这里按一次请求估算）
+    """
+    system_tokens = estimate_tokens(render_system_prompt(question_types, system_prompt_override, directory))
+    per_input = [system_tokens + estimate_tokens(build_user_prompt(text)) for text in user_inputs]
+    result = {
+        "systemPromptTokens": system_tokens,
+        "perInputTokens": per_input,
+        "totalTokens": sum(per_input)
+    }
+    if model:
+        ratio = usage_tracker.output_ratio(model)
+        output = [int(estimate_tokens(text) * ratio) for text in user_inputs]
+        result.update({
+            "expectedOutputTokens": sum(output),
+            "chunkBudget": usage_tracker.chunk_budget(model, system_tokens),
+            "estimatedCost": cost_of(model, sum(per_input), sum(output))
+        })
+    return result
@@ -0,0 +1,380 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务端上游池（PROVIDER_POOL）
+
+请求的 apiUrl 为 PROVIDER_POOL_URL（默认 "pool"）时，由服务端在多个 OpenAI 兼容接口之间选择：
+- 评分 = (首包延迟的滑动平均 + 预计排队时间) × (1 + ROUTER_ERROR_PENALTY × 错误率) / 权重，取最小者；
+  排队时间来自本地限速器（并发、RPM/TPM）和上游返回的 x-ratelimit-* 响应头。还没有数据、或超过
+  ROUTER_COOLDOWN 秒没有新数据的上游优先试用，变慢后恢复的上游因此能重新被选中
+- 首个增量超过 ROUTER_HEDGE_DELAY 秒未到达时，向下一个上游发出对冲请求，先输出的一方胜出，另一方立即关闭
+- 上游在输出任何内容之前失败时切换到下一个上游；连续失败的上游暂停使用 ROUTER_COOLDOWN 秒。
+  已经开始输出后失败不切换，避免向客户端重复输出
+
+批量请求中的每一项单独选择上游，某个上游变慢或出错后，后续的项会转到其他上游。
+"""
+import asyncio
+import math
+import re
+import time
+import metrics
+from config import (PROVIDER_POOL, PROVIDER_POOL_URL, ROUTER_HEDGE_DELAY, ROUTER_MAX_FAILOVERS, ROUTER_EWMA_ALPHA,
+                    ROUTER_ERROR_PENALTY, ROUTER_FAILURE_THRESHOLD, ROUTER_COOLDOWN)
+from http_client import UpstreamError
+from scheduler import ProviderLimiter, get_limiter
+from utils import estimate_tokens
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|s|m|h)')
+DURATION_UNITS = {'ms': 0.001, 's': 1, 'm': 60, 'h': 3600}
+
+
+def is_pool(api_url):
+    return api_url.rstrip('/') == PROVIDER_POOL_URL
+
+
+def parse_duration(value):
+    """解析 x-ratelimit-reset-* 的时长（如 "1s"、"6m0s"、"120ms" 或秒数），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+
+
+def parse_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def ewma(current, value):
+    return value if current is None else current + ROUTER_EWMA_ALPHA * (value - current)
+
+
+class Provider:
+    """上游池中的一个上游及其统计"""
+
+    def __init__(self, name, api_url, api_key, model, weight=1.0, hedge=True):
+        self.name = name
+        self.api_url = api_url.rstrip('/')
+        self.api_key = api_key
+        self.model = model
+        self.weight = weight
+        self.hedge = hedge
+        self.ttft = None           # 首包延迟（秒）的滑动平均
+        self.ttft_updated = None
+        self.duration = None       # 完整请求耗时的滑动平均
+        self.error_rate = 0.0      # 错误率的滑动平均，随时间衰减（半衰期 ROUTER_COOLDOWN）
+        self.error_updated = time.monotonic()
+        self.failures = 0          # 连续失败次数
+        self.cooldown_until = 0.0
+        self.inflight = 0
+        self.remaining_requests = None
+        self.remaining_tokens = None
+        self.requests_reset_at = 0.0
+        self.tokens_reset_at = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failovers = 0
+
+    @property
+    def limiter(self):
+        # 与直接请求同一上游地址的请求共用并发和 RPM/TPM 额度
+        return get_limiter(self.api_url)
+
+    def current_error_rate(self, now):
+        return self.error_rate * 0.5 ** ((now - self.error_updated) / ROUTER_COOLDOWN)
+
+    def _observe_error(self, value, now):
+        current = self.current_error_rate(now)
+        self.error_rate = current + ROUTER_EWMA_ALPHA * (value - current)
+        self.error_updated = now
+
+    def record_headers(self, headers):
+        """读取 OpenAI 风格的 x-ratelimit-* 响应头"""
+        now = time.monotonic()
+        requests = parse_int(headers.get('x-ratelimit-remaining-requests'))
+        if requests is not None:
+            self.remaining_requests = requests
+            self.requests_reset_at = now + (parse_duration(headers.get('x-ratelimit-reset-requests')) or 0)
+        tokens = parse_int(headers.get('x-ratelimit-remaining-tokens'))
+        if tokens is not None:
+            self.remaining_tokens = tokens
+            self.tokens_reset_at = now + (parse_duration(headers.get('x-ratelimit-reset-tokens')) or 0)
+
+    def record_first_token(self, elapsed):
+        self.ttft = ewma(self.ttft, elapsed)
+        self.ttft_updated = time.monotonic()
+
+    def record_abandoned(self, elapsed):
+        """对冲中落败、首包还没到达的请求：已等待的时间是首包延迟的下限"""
+        self.ttft = max(self.ttft or 0.0, elapsed)
+        self.ttft_updated = time.monotonic()
+
+    def record_success(self, elapsed):
+        self.failures = 0
+        self.duration = ewma(self.duration, elapsed)
+        self._observe_error(0.0, time.monotonic())
+
+    def record_failure(self, error):
+        now = time.monotonic()
+        self.errors += 1
+        self.failures += 1
+        self._observe_error(1.0, now)
+        if isinstance(error, UpstreamError) and error.status_code == 429:
+            self.cooldown_until = now + (parse_duration(error.retry_after) or ROUTER_COOLDOWN)
+        elif self.failures >= ROUTER_FAILURE_THRESHOLD:
+            self.cooldown_until = now + ROUTER_COOLDOWN
+
+    def expected_wait(self, tokens, now):
+        """按本地限速器和上游剩余额度估计的排队时间（秒）"""
+        limiter = self.limiter
+        wait = 0.0
+        if limiter.rpm:
+            wait = limiter.rpm.wait_time(1)
+        if limiter.tpm and tokens:
+            wait = max(wait, limiter.tpm.wait_time(tokens))
+        if self.remaining_requests is not None and self.remaining_requests < 1 and now < self.requests_reset_at:
+            wait = max(wait, self.requests_reset_at - now)
+        if self.remaining_tokens is not None and self.remaining_tokens < tokens and now < self.tokens_reset_at:
+            wait = max(wait, self.tokens_reset_at - now)
+        if self.inflight >= limiter.concurrency:
+            # 并发已满，需要等前面的请求结束
+            busy = self.inflight - limiter.concurrency + 1
+            wait += (self.duration or self.ttft or 1.0) * busy / limiter.concurrency
+        return wait
+
+    def score(self, tokens, now):
+        """评分越小越优先，暂停使用时为无穷大"""
+        if now < self.cooldown_until:
+            return math.inf
+        stale = self.ttft_updated is None or now - self.ttft_updated > ROUTER_COOLDOWN
+        ttft = 0.0 if stale else self.ttft
+        penalty = 1 + ROUTER_ERROR_PENALTY * self.current_error_rate(now)
+        return (ttft + self.expected_wait(tokens, now)) * penalty / self.weight
+
+    def to_dict(self, now):
+        score = self.score(0, now)
+        return {
+            'name': self.name,
+            'apiUrl': self.api_url,
+            'model': self.model,
+            'weight': self.weight,
+            'hedge': self.hedge,
+            'ttft': round(self.ttft, 3) if self.ttft is not None else None,
+            'duration': round(self.duration, 3) if self.duration is not None else None,
+            'errorRate': round(self.current_error_rate(now), 4),
+            'inflight': self.inflight,
+            'cooldown': round(max(0.0, self.cooldown_until - now), 1),
+            'remainingRequests': self.remaining_requests,
+            'remainingTokens': self.remaining_tokens,
+            'score': round(score, 3) if math.isfinite(score) else None,
+            'requests': self.requests,
+            'errors': self.errors,
+            'hedges': self.hedges,
+            'hedgeWins': self.hedge_wins,
+            'failovers': self.failovers
+        }
+
+
+class Attempt:
+    """向一个上游发出的一次流式请求，在后台任务中读取，文本增量放入队列"""
+
+    def __init__(self, provider, messages, tokens, open_stream, usage):
+        self.provider = provider
+        self.queue = asyncio.Queue()
+        # 同时进行的对冲请求各自记录，按各自的用量修正限速额度
+        usage = usage.child() if usage is not None else None
+        self.task = asyncio.ensure_future(self._run(messages, tokens, open_stream, usage))
+
+    async def _run(self, messages, tokens, open_stream, usage):
+        provider = self.provider
+        provider.requests += 1
+        provider.inflight += 1
+        stream = None
+        sent = None
+        first = False
+        try:
+            async with provider.limiter.slot(tokens, usage):
+                sent = time.perf_counter()
+                stream = open_stream(provider.api_url, provider.api_key, provider.model, messages, provider.record_headers,
+                                     usage)
+                async for text in stream:
+                    if not first:
+                        first = True
+                        provider.record_first_token(time.perf_counter() - sent)
+                    self.queue.put_nowait(('text', text))
+            provider.record_success(time.perf_counter() - sent)
+            self.queue.put_nowait(('done', None))
+        except asyncio.CancelledError:
+            if sent is not None and not first:
+                provider.record_abandoned(time.perf_counter() - sent)
+            raise
+        except Exception as e:
+            provider.record_failure(e)
+            self.queue.put_nowait(('error', e))
+        finally:
+            provider.inflight -= 1
+            if stream is not None:
+                await stream.aclose()
+
+
+class ProviderRouter:
+    def __init__(self, configs=PROVIDER_POOL):
+        self.providers = [Provider(**config) for config in configs]
+        self._limiter = None
+
+    @property
+    def limiter(self):
+        """批量请求使用的总并发上限（各上游的并发上限之和），各上游自己的限速在选择上游后生效"""
+        if self._limiter is None:
+            concurrency = sum(provider.limiter.concurrency for provider in self.providers)
+            self._limiter = ProviderLimiter(concurrency=max(1, concurrency), rpm=0, tpm=0)
+        return self._limiter
+
+    def candidates(self, model, tokens):
+        """按评分排序的上游；model 与某些上游的模型相同时只在这些上游中选择"""
+        providers = [provider for provider in self.providers if provider.model == model] or self.providers
+        if not providers:
+            raise UpstreamError(503, '上游池为空，请在 config.py 的 PROVIDER_POOL 中配置上游')
+        now = time.monotonic()
+        scores = {provider: provider.score(tokens, now) for provider in providers}
+        ranked = sorted(providers, key=scores.get)
+        available = [provider for provider in ranked if math.isfinite(scores[provider])]
+        # 全部在暂停期时，按暂停结束时间依次尝试
+        return available or sorted(providers, key=lambda provider: provider.cooldown_until)
+
+    async def stream(self, model, messages, open_stream, usage=None):
+        """
+        流式请求上游池，逐个产出文本增量
+
+        参数:
+            open_stream: 流式请求单个上游的函数，签名同 ai_service.stream_chat_deltas
+            usage: 用量记录（usage.Usage），对冲和切换产生的调用也计入
+        """
+        tokens = sum(estimate_tokens(message['content']) for message in messages)
+        pending = self.candidates(model, tokens)
+        attempts = []
+        racing = []
+
+        def launch(provider):
+            pending.remove(provider)
+            attempt = Attempt(provider, messages, tokens, open_stream, usage)
+            attempts.append(attempt)
+            racing.append(attempt)
+            return attempt
+
+        launch(pending[0])
+        hedge = None
+        failovers = 0
+        error = failed = None
+        winner = None
+        getters = {}
+        try:
+            while winner is None:
+                targets = [provider for provider in pending if provider.hedge]
+                can_hedge = ROUTER_HEDGE_DELAY > 0 and hedge is None and len(racing) == 1 and targets
+                getters = {asyncio.ensure_future(attempt.queue.get()): attempt for attempt in racing}
+                done, waiting = await asyncio.wait(getters, timeout=ROUTER_HEDGE_DELAY if can_hedge else None,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                for getter in waiting:
+                    getter.cancel()
+                if not done:
+                    # 首个增量迟迟未到，向下一个上游发出对冲请求
+                    racing[0].provider.hedges += 1
+                    metrics.ROUTER_EVENTS.inc(racing[0].provider.name, 'hedge')
+                    hedge = launch(targets[0])
+                    continue
+                for getter in done:
+                    attempt = getters[getter]
+                    kind, payload = getter.result()
+                    if kind == 'error':
+                        racing.remove(attempt)
+                        error, failed = payload, attempt.provider
+                    elif winner is None:
+                        winner, event = attempt, (kind, payload)
+                if winner is None and not racing:
+                    if not pending or failovers >= ROUTER_MAX_FAILOVERS:
+                        raise error
+                    # 输出之前失败，切换到下一个上游
+                    failovers += 1
+                    failed.failovers += 1
+                    metrics.ROUTER_EVENTS.inc(failed.name, 'failover')
+                    launch(pending[0])
+
+            for attempt in racing:
+                if attempt is not winner:
+                    attempt.task.cancel()
+            if winner is hedge:
+                winner.provider.hedge_wins += 1
+                metrics.ROUTER_EVENTS.inc(winner.provider.name, 'hedge_won')
+            kind, payload = event
+            while kind == 'text':
+                yield payload
+                kind, payload = await winner.queue.get()
+            if kind == 'error':
+                raise payload
+        finally:
+            # 提前结束或出错时关闭所有仍在进行的上游请求
+            for getter in getters:
+                getter.cancel()
+            running = [attempt.task for attempt in attempts if not attempt.task.done()]
+            for task in running:
+                task.cancel()
+            if running:
+                await asyncio.wait(running)
+
+    async def call(self, model, messages, request, usage=None):
+        """
+        非流式请求上游池，失败时切换到下一个上游
+
+        参数:
+            request: 请求单个上游的函数，签名同 ai_service.request_completion
+            usage: 同 stream
+        """
+        tokens = sum(estimate_tokens(message['content']) for message in messages)
+        error = failed = None
+        for provider in self.candidates(model, tokens)[:ROUTER_MAX_FAILOVERS + 1]:
+            if failed is not None:
+                failed.failovers += 1
+                metrics.ROUTER_EVENTS.inc(failed.name, 'failover')
+            provider.requests += 1
+            provider.inflight += 1
+            start = time.perf_counter()
+            try:
+                async with provider.limiter.slot(tokens, usage):
+                    result = await request(provider.api_url, provider.api_key, provider.model, messages,
+                                           provider.record_headers, usage)
+            except Exception as e:
+                provider.record_failure(e)
+                error, failed = e, provider
+                continue
+            finally:
+                provider.inflight -= 1
+            provider.record_success(time.perf_counter() - start)
+            return result
+        raise error
+
+    def stats(self):
+        now = time.monotonic()
+        return {
+            'url': PROVIDER_POOL_URL,
+            'hedgeDelay': ROUTER_HEDGE_DELAY,
+            'providers': [provider.to_dict(now) for provider in self.providers]
+        }
+
+
+router = ProviderRouter()
+
+
+def limiter_for(api_url):
+    """批量请求使用的限速器：上游池使用总并发上限，否则为该上游地址的限速器"""
+    return router.limiter if is_pool(api_url) else get_limiter(api_url)
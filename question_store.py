@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务端题库
+
+题目保存在 QUESTION_STORE_DB（SQLite，WAL 模式，多个工作进程可以同时读写）：
+- 以内容哈希（题型 + 去掉空白和标点的题干和选项）为键，同一道题再次保存时更新答案、解析、
+  章节和难度，内容相同的不重复写入
+- 题型、章节、难度分别建索引；题干和选项建 FTS5 全文索引（trigram 分词，中文按三个字切分），
+  少于三个字的关键词或 SQLite 不支持 trigram 时退化为 LIKE 查询
+- 每次写入（保存或删除）使用一个递增的版本号，增量导出只取版本号大于上次导出的题目；
+  导出游标按名称保存在库中，删除的题目留下记录，供客户端同步
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from config import QUESTION_STORE_DB, QUESTION_STORE_PAGE_SIZE, QUESTION_STORE_MAX_PAGE_SIZE
+from dedup import question_text
+from header_utils import HEADER_MAPPING, HeaderResolver
+
+BUSY_TIMEOUT = 30
+FTS_MIN_CHARS = 3   # trigram 分词无法匹配更短的关键词
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS questions (
+    id INTEGER PRIMARY KEY, hash TEXT NOT NULL UNIQUE, type TEXT NOT NULL, chapter TEXT NOT NULL,
+    difficulty TEXT NOT NULL, text TEXT NOT NULL, data TEXT NOT NULL, version INTEGER NOT NULL,
+    created REAL NOT NULL, updated REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS questions_type ON questions (type);
+CREATE INDEX IF NOT EXISTS questions_chapter ON questions (chapter);
+CREATE INDEX IF NOT EXISTS questions_difficulty ON questions (difficulty);
+CREATE INDEX IF NOT EXISTS questions_version ON questions (version);
+CREATE TABLE IF NOT EXISTS deleted (
+    hash TEXT PRIMARY KEY, version INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS deleted_version ON deleted (version);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+CREATE TABLE IF NOT EXISTS export_cursors (
+    name TEXT PRIMARY KEY, version INTEGER NOT NULL, updated REAL NOT NULL);
+"""
+
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS questions_fts USING fts5(
+    text, content='questions', content_rowid='id', tokenize='trigram');
+CREATE TRIGGER IF NOT EXISTS questions_fts_insert AFTER INSERT ON questions BEGIN
+    INSERT INTO questions_fts (rowid, text) VALUES (new.id, new.text);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_fts_delete AFTER DELETE ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+END;
+CREATE TRIGGER IF NOT EXISTS questions_fts_update AFTER UPDATE OF text ON questions BEGIN
+    INSERT INTO questions_fts (questions_fts, rowid, text) VALUES ('delete', old.id, old.text);
+    INSERT INTO questions_fts (rowid, text) VALUES (new.id, new.text);
+END;
+"""
+
+FILTERS = ('type', 'chapter', 'difficulty')
+_field_resolver = HeaderResolver([HEADER_MAPPING[key] for key in ['题型', '章节', '难度']])
+_text_resolver = HeaderResolver([HEADER_MAPPING[key] for key in ['题干', 'A', 'B', 'C', 'D', 'E', 'F', 'G', 'H']])
+
+
+def field_text(value):
+    return '' if value is None else str(value).strip()
+
+
+def content_hash(question_type, question):
+    """题目的内容哈希：题型和去掉空白、标点后的题干和选项"""
+    raw = f'{question_type}\n{question_text(question)}'
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def question_row(question):
+    """
+    题目在库中的各列
+
+    返回:
+        (哈希, 题型, 章节, 难度, 检索文本, JSON)
+    """
+    if not isinstance(question, dict):
+        raise ValueError('题目必须是对象')
+    question_type, chapter, difficulty = (field_text(value) for value in _field_resolver.resolve(question))
+    text = ' '.join(field_text(value) for value in _text_resolver.resolve(question) if field_text(value))
+    if not text:
+        raise ValueError('题目缺少题干')
+    return (content_hash(question_type, question), question_type, chapter, difficulty, text,
+            json.dumps(question, ensure_ascii=False))
+
+
+def like_pattern(keyword):
+    escaped = keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+    return f'%{escaped}%'
+
+
+class QuestionStore:
+    """保存在 SQLite 中的题库，每个线程使用单独的连接"""
+
+    def __init__(self, path=QUESTION_STORE_DB):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        db = self._connection()
+        db.executescript(SCHEMA)
+        try:
+            db.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError:
+            # SQLite 早于 3.34 或未编译 FTS5
+            self.fts = False
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """写事务，一开始就取得写锁"""
+        db = self._connection()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+        except BaseException:
+            db.execute('ROLLBACK')
+            raise
+        db.execute('COMMIT')
+
+    @staticmethod
+    def _version(db):
+        row = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _set_version(db, version):
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('version', ?)", (version,))
+
+    def version(self):
+        """当前版本号（最近一次写入的版本）"""
+        return self._version(self._connection())
+
+    def upsert(self, questions, skip_invalid=False):
+        """
+        保存一批题目，同一批共用一个新版本号
+
+        参数:
+            skip_invalid: 跳过格式不正确的题目（计入 invalid），否则整批不写入
+
+        返回:
+            {'inserted', 'updated', 'unchanged', 'invalid', 'version',
+             'hashes': 与输入顺序一致的哈希列表（跳过的题目为 None）}
+
+        异常:
+            ValueError: 题目格式不正确且 skip_invalid 为 False
+        """
+        rows = []
+        for question in questions:
+            try:
+                rows.append(question_row(question))
+            except ValueError:
+                if not skip_invalid:
+                    raise
+                rows.append(None)
+        inserted = updated = unchanged = 0
+        now = time.time()
+        with self.transaction() as db:
+            version = self._version(db) + 1
+            for question_hash, question_type, chapter, difficulty, text, data in filter(None, rows):
+                existing = db.execute('SELECT data FROM questions WHERE hash = ?', (question_hash,)).fetchone()
+                if existing is None:
+                    db.execute(
+                        'INSERT INTO questions (hash, type, chapter, difficulty, text, data, version, created, updated) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                        (question_hash, question_type, chapter, difficulty, text, data, version, now, now))
+                    db.execute('DELETE FROM deleted WHERE hash = ?', (question_hash,))
+                    inserted += 1
+                elif existing[0] != data:
+                    db.execute(
+                        'UPDATE questions SET type = ?, chapter = ?, difficulty = ?, text = ?, data = ?, version = ?, '
+                        'updated = ? WHERE hash = ?',
+                        (question_type, chapter, difficulty, text, data, version, now, question_hash))
+                    updated += 1
+                else:
+                    unchanged += 1
+            if inserted or updated:
+                self._set_version(db, version)
+            else:
+                version -= 1
+        return {'inserted': inserted, 'updated': updated, 'unchanged': unchanged, 'invalid': rows.count(None),
+                'version': version, 'hashes': [row and row[0] for row in rows]}
+
+    def delete(self, hashes):
+        """删除题目并留下删除记录，返回实际删除的数量"""
+        with self.transaction() as db:
+            version = self._version(db) + 1
+            deleted = 0
+            for question_hash in set(hashes):
+                if db.execute('DELETE FROM questions WHERE hash = ?', (question_hash,)).rowcount:
+                    db.execute('INSERT OR REPLACE INTO deleted (hash, version) VALUES (?, ?)', (question_hash, version))
+                    deleted += 1
+            if deleted:
+                self._set_version(db, version)
+        return deleted
+
+    def _where(self, keyword, filters, since):
+        clauses, params = [], []
+        if keyword:
+            if self.fts and len(keyword) >= FTS_MIN_CHARS:
+                clauses.append('id IN (SELECT rowid FROM questions_fts WHERE questions_fts MATCH ?)')
+                params.append('"' + keyword.replace('"', '""') + '"')
+            else:
+                clauses.append("text LIKE ? ESCAPE '\\'")
+                params.append(like_pattern(keyword))
+        for name in FILTERS:
+            value = filters.get(name)
+            if value is not None:
+                clauses.append(f'{name} = ?')
+                params.append(value)
+        if since:
+            clauses.append('version > ?')
+            params.append(since)
+        return (' WHERE ' + ' AND '.join(clauses) if clauses else ''), params
+
+    def query(self, keyword='', since=0, limit=None, offset=0, **filters):
+        """
+        按关键词（题干和选项）、题型、章节、难度和版本号筛选，按保存顺序分页
+
+        返回:
+            {'total', 'version', 'items': [{'hash', 'version', 'question'}, ...]}，
+            指定 since 时附带 'deleted'：版本号大于 since 的删除记录（哈希列表）
+        """
+        limit = max(1, min(limit or QUESTION_STORE_PAGE_SIZE, QUESTION_STORE_MAX_PAGE_SIZE))
+        where, params = self._where(keyword.strip(), filters, since)
+        db = self._connection()
+        # 读事务保证总数、题目和版本号来自同一个快照
+        db.execute('BEGIN')
+        try:
+            total = db.execute(f'SELECT COUNT(*) FROM questions{where}', params).fetchone()[0]
+            rows = db.execute(f'SELECT hash, version, data FROM questions{where} ORDER BY id LIMIT ? OFFSET ?',
+                              params + [limit, max(0, offset)]).fetchall()
+            version = self._version(db)
+            deleted = self._deleted(db, since) if since else None
+        finally:
+            db.execute('COMMIT')
+        result = {'total': total, 'version': version,
+                  'items': [{'hash': question_hash, 'version': row_version, 'question': json.loads(data)}
+                            for question_hash, row_version, data in rows]}
+        if deleted is not None:
+            result['deleted'] = deleted
+        return result
+
+    @staticmethod
+    def _deleted(db, since):
+        return [question_hash for question_hash, in
+                db.execute('SELECT hash FROM deleted WHERE version > ? ORDER BY version', (since,))]
+
+    def changes(self, since=0, keyword='', **filters):
+        """
+        版本号大于 since 的全部题目（按保存顺序）和删除记录，用于增量导出
+
+        返回:
+            (题目列表, 删除的哈希列表, 当前版本号)
+        """
+        where, params = self._where(keyword.strip(), filters, since)
+        db = self._connection()
+        db.execute('BEGIN')
+        try:
+            questions = [json.loads(data) for data, in
+                         db.execute(f'SELECT data FROM questions{where} ORDER BY id', params)]
+            deleted = self._deleted(db, since)
+            version = self._version(db)
+        finally:
+            db.execute('COMMIT')
+        return questions, deleted, version
+
+    def cursor(self, name):
+        """导出游标 name 上次导出到的版本号，没有导出过时为 0"""
+        row = self._connection().execute('SELECT version FROM export_cursors WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def move_cursor(self, name, version):
+        with self.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO export_cursors (name, version, updated) VALUES (?, ?, ?)',
+                       (name, version, time.time()))
+
+    def stats(self):
+        """题目总数、当前版本号和各题型、章节、难度的题目数"""
+        db = self._connection()
+        counts = {name: dict(db.execute(f'SELECT {name}, COUNT(*) FROM questions GROUP BY {name} ORDER BY {name}'))
+                  for name in FILTERS}
+        cursors = {name: version for name, version in db.execute('SELECT name, version FROM export_cursors')}
+        return {'total': db.execute('SELECT COUNT(*) FROM questions').fetchone()[0], 'version': self.version(),
+                'fullTextSearch': self.fts, 'byType': counts['type'], 'byChapter': counts['chapter'],
+                'byDifficulty': counts['difficulty'], 'exportCursors': cursors}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_question_store():
+    """题库实例，首次使用时才创建数据库文件"""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = QuestionStore()
+    return _store
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+AI 响应缓存：以 (上游地址, 模型, 完整 system prompt, user prompt) 的哈希为键
+
+不同上游的同名模型各自缓存；请求上游池（PROVIDER_POOL_URL）时以池地址为键，池中各上游的回答共用。
+
+内存层为 LRU，可选的磁盘层使用 SQLite，按总大小淘汰并支持过期时间。
+磁盘层的总大小在打开时统计一次，之后随写入和删除增减，每 DB_RESYNC_WRITES 次写入清理过期条目
+并重新统计（校正其他工作进程写入造成的偏差）；异步接口 aget / aset 在线程中读写磁盘层，不阻塞事件循环。
+磁盘层等待写锁最多 SHARED_STATE_BUSY_TIMEOUT 秒，超时按未命中处理或跳过写入。
+多个工作进程时，未单独配置 RESPONSE_CACHE_DB 也启用磁盘层（保存在共享状态数据库中），
+各进程的内存层各自独立。
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from config import (RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+                    RESPONSE_CACHE_DB, RESPONSE_CACHE_DB_MAX_BYTES, SHARED_STATE_DB,
+                    AUDIT_RESULT_MAX_ENTRIES, AUDIT_RESULT_TTL, SHARED_STATE_BUSY_TIMEOUT)
+from shared_state import backend_name
+
+DB_RESYNC_WRITES = 100
+DB_EVICT_BATCH = 64
+
+
+def cache_key(api_url, model, messages):
+    """根据上游地址、模型和完整消息列表计算缓存键"""
+    raw = json.dumps([api_url.rstrip('/'), model, messages], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class ResponseCache:
+    """两级响应缓存"""
+
+    def __init__(self, max_entries=RESPONSE_CACHE_MAX_ENTRIES, ttl=RESPONSE_CACHE_TTL,
+                 db_path=RESPONSE_CACHE_DB, max_db_bytes=RESPONSE_CACHE_DB_MAX_BYTES, enabled=RESPONSE_CACHE_ENABLED):
+        self.enabled = enabled
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_db_bytes = max_db_bytes
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()      # 内存层和计数
+        self._db_lock = threading.Lock()   # 磁盘层连接，读写磁盘时不占用内存层的锁
+        self._db = None
+        self._db_bytes = 0
+        self._db_writes = 0
+        self.hits = 0
+        self.misses = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, timeout=SHARED_STATE_BUSY_TIMEOUT, check_same_thread=False)
+            # WAL 模式下其他工作进程写入时仍可读取
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created REAL NOT NULL, accessed REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses(created)")
+            self._db.commit()
+            self._db_bytes = self._db_total()
+
+    def get(self, key):
+        """读取缓存，未命中或已过期返回 None"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = self._get_disk(key, now)
+        return self._count(value)
+
+    async def aget(self, key):
+        """同 get，磁盘层在线程中读取"""
+        now = time.time()
+        value = self._get_memory(key, now)
+        if value is None and self._db is not None:
+            value = await asyncio.get_running_loop().run_in_executor(None, self._get_disk, key, now)
+        return self._count(value)
+
+    def set(self, key, value):
+        """写入缓存"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._db is not None:
+            self._put_disk(key, value, now)
+
+    async def aset(self, key, value):
+        """同 set，磁盘层在线程中写入"""
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+        if self._db is not None:
+            await asyncio.get_running_loop().run_in_executor(None, self._put_disk, key, value, now)
+
+    def _get_memory(self, key, now):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, created = entry
+            if now - created <= self.ttl:
+                self._memory.move_to_end(key)
+                return value
+            del self._memory[key]
+            return None
+
+    def _get_disk(self, key, now):
+        """读取磁盘层，数据库被其他进程锁住超时按未命中处理"""
+        with self._db_lock:
+            try:
+                row = self._db.execute("SELECT value, size, created FROM responses WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                value, size, created = row
+                if now - created > self.ttl:
+                    self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    self._db.commit()
+                    self._db_bytes -= size
+                    return None
+                self._db.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+                self._db.commit()
+            except sqlite3.OperationalError:
+                self._db.rollback()
+                return None
+        with self._lock:
+            self._remember(key, value, created)
+        return value
+
+    def _count(self, value):
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def _put_disk(self, key, value, now):
+        """写入磁盘层，数据库被其他进程锁住超时跳过（内存层已写入）"""
+        size = len(value.encode('utf-8'))
+        with self._db_lock:
+            db_bytes, db_writes = self._db_bytes, self._db_writes
+            try:
+                row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                    (key, value, size, now, now)
+                )
+                self._db_bytes += size - (row[0] if row else 0)
+                self._db_writes += 1
+                self._evict_db(now)
+                self._db.commit()
+            except sqlite3.OperationalError:
+                self._db.rollback()
+                self._db_bytes, self._db_writes = db_bytes, db_writes
+
+    def _remember(self, key, value, created):
+        self._memory[key] = (value, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _db_total(self):
+        return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def _evict_db(self, now):
+        """
+        按最近访问时间淘汰直到总大小不超过上限；每 DB_RESYNC_WRITES 次写入删除过期条目并重新统计总大小
+        """
+        if self._db_writes % DB_RESYNC_WRITES == 0:
+            self._db.execute("DELETE FROM responses WHERE created < ?", (now - self.ttl,))
+            self._db_bytes = self._db_total()
+        while self._db_bytes > self.max_db_bytes:
+            rows = self._db.execute("SELECT key, size FROM responses ORDER BY accessed LIMIT ?",
+                                    (DB_EVICT_BATCH,)).fetchall()
+            if not rows:
+                self._db_bytes = 0
+                return
+            for key, size in rows:
+                self._db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._db_bytes -= size
+                if self._db_bytes <= self.max_db_bytes:
+                    return
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "disk": self._db is not None,
+                "disk_bytes": self._db_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+def default_db_path():
+    if RESPONSE_CACHE_DB is None and backend_name() == 'sqlite':
+        return SHARED_STATE_DB
+    return RESPONSE_CACHE_DB
+
+
+response_cache = ResponseCache(db_path=default_db_path())
+# 批量审核的结果记录，只在内存中，与响应缓存的开关和容量无关
+audit_results = ResponseCache(max_entries=AUDIT_RESULT_MAX_ENTRIES, ttl=AUDIT_RESULT_TTL, db_path=None, enabled=True)
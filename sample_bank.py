@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+示例题库索引
+
+demo_questions.json 只在文件修改后才重新解析，解析时预先计算题型列表、
+重复题型以及每种题型第一道示例的 JSON 文本。
+"""
+import json
+import os
+from collections import Counter
+from header_utils import get_question_type
+
+SAMPLE_FILE = 'demo_questions.json'
+
+
+class SampleBank:
+    """解析后的示例题库"""
+
+    def __init__(self, data):
+        self.data = data
+        self.types = []
+        self.examples = {}
+        for question in data.get('questions', []):
+            question_type = get_question_type(question)
+            if question_type:
+                self.types.append(question_type)
+                if question_type not in self.examples:
+                    # 每种题型只取第一道题作为示例
+                    self.examples[question_type] = json.dumps(question, ensure_ascii=False, indent=2)
+        counts = Counter(self.types)
+        self.duplicate_types = [t for t in self.types if counts[t] > 1]
+        self.unique_types = list(self.examples)
+
+    def examples_text(self, question_types):
+        """拼接所选题型的示例文本"""
+        examples_text = ""
+        for qtype in question_types:
+            example = self.examples.get(qtype)
+            if example:
+                examples_text += f"\n{qtype}示例：\n{example}\n"
+        return examples_text
+
+
+_cache = {}
+
+
+def get_sample_bank(path=SAMPLE_FILE):
+    """获取示例题库索引，文件修改时间或大小变化时自动重新加载"""
+    stat = os.stat(path)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    cached = _cache.get(path)
+    if cached is not None and cached[0] == signature:
+        return cached[1]
+    with open(path, 'r', encoding='utf-8') as f:
+        bank = SampleBank(json.load(f))
+    _cache[path] = (signature, bank)
+    return bank
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+批量请求调度：按上游限制并发、RPM/TPM 限速、429/5xx 重试，并把多路流合并为一路；
+转发时合并短时间内到达的文本增量
+"""
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+import httpx
+from config import (BATCH_MAX_CONCURRENCY, BATCH_RPM_LIMIT, BATCH_TPM_LIMIT, PROVIDER_LIMITS,
+                    BATCH_MAX_RETRIES, BATCH_RETRY_BASE_DELAY, RELAY_COALESCE_WINDOW, RELAY_COALESCE_MAX_CHARS)
+from http_client import pool_key, UpstreamError
+from shared_state import get_shared_state, worker_count
+
+
+class TokenBucket:
+    """令牌桶，按每分钟速率匀速补充，容量为一分钟的额度"""
+
+    def __init__(self, rate_per_minute):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self.tokens = float(rate_per_minute)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """取出 amount 个令牌，不足时等待；超过容量的请求按容量计算"""
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def wait_time(self, amount=1):
+        """不取出令牌，估计取出 amount 个令牌需要等待的秒数"""
+        self._refill()
+        return max(0.0, min(amount, self.capacity) - self.tokens) / self.rate
+
+    def adjust(self, amount):
+        """按实际用量修正：amount 为正时补扣（可以扣成负数，之后的请求相应等待），为负时退回"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class SharedTokenBucket:
+    """多个工作进程共用的令牌桶，额度保存在共享状态中"""
+
+    def __init__(self, state, key, rate_per_minute):
+        self.state = state
+        self.key = key
+        self.rate = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+
+    async def acquire(self, amount=1):
+        """取出 amount 个令牌，不足时等待；超过容量的请求按容量计算"""
+        amount = min(amount, self.capacity)
+        while True:
+            wait = await self.state.run(self.state.take_tokens, self.key, amount, self.rate, self.capacity)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def wait_time(self, amount=1):
+        """额度保存在共享状态中，不查询，按无需等待估计"""
+        return 0.0
+
+    def adjust(self, amount):
+        """在共享状态线程中修正，不等待（只影响之后请求的额度估计）"""
+        self.state.run_later(self.state.adjust_tokens, self.key, amount, self.rate, self.capacity)
+
+
+class ProviderLimiter:
+    """
+    单个上游的并发上限和 RPM/TPM 限速
+
+    指定 shared_key 且有多个工作进程时，RPM/TPM 额度由所有进程共用，并发上限按进程数平分。
+    """
+
+    def __init__(self, concurrency=BATCH_MAX_CONCURRENCY, rpm=BATCH_RPM_LIMIT, tpm=BATCH_TPM_LIMIT, shared_key=None):
+        state = get_shared_state() if shared_key else None
+        if state is not None:
+            concurrency = max(1, concurrency // worker_count())
+        self.concurrency = concurrency
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.rpm = make_bucket(rpm, state, f'{shared_key}:rpm')
+        self.tpm = make_bucket(tpm, state, f'{shared_key}:tpm')
+
+    @asynccontextmanager
+    async def slot(self, tokens=0, usage=None):
+        """
+        占用一个并发名额，并扣除一次请求和 tokens 个 token 的额度
+
+        tokens 为预计用量；指定 usage（usage.Usage）时，结束后按期间实际记录的用量修正 TPM 额度
+        """
+        async with self.semaphore:
+            if self.rpm:
+                await self.rpm.acquire(1)
+            if self.tpm and tokens:
+                await self.tpm.acquire(tokens)
+            before = usage.total_tokens if usage is not None else 0
+            try:
+                yield
+            finally:
+                if self.tpm and usage is not None and usage.total_tokens > before:
+                    self.tpm.adjust(usage.total_tokens - before - min(tokens, self.tpm.capacity))
+
+
+def make_bucket(rate_per_minute, state, key):
+    if not rate_per_minute:
+        return None
+    if state is not None:
+        return SharedTokenBucket(state, key, rate_per_minute)
+    return TokenBucket(rate_per_minute)
+
+
+_limiters = {}
+
+
+def get_limiter(api_url):
+    """获取上游地址对应的限速器（同一上游的所有批量请求共用）"""
+    key = pool_key(api_url)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        limiter = _limiters[key] = ProviderLimiter(**PROVIDER_LIMITS.get(key, {}), shared_key=key)
+    return limiter
+
+
+def is_retryable(error):
+    """429/5xx 和网络错误可以重试"""
+    if isinstance(error, UpstreamError):
+        return error.retryable
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_delay(attempt, error, base_delay=BATCH_RETRY_BASE_DELAY):
+    """优先使用 Retry-After，否则指数退避并加入随机抖动"""
+    retry_after = getattr(error, 'retry_after', None)
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return base_delay * (2 ** attempt) * (0.5 + random.random())
+
+
+async def stream_with_retry(make_stream, limiter, tokens=0, max_retries=BATCH_MAX_RETRIES, usage=None):
+    """
+    在限速器下执行流式请求，失败时按退避策略重试
+
+    只有在尚未产出任何内容时才重试，避免向客户端重复输出；
+    退避等待期间不占用并发名额。usage 同 ProviderLimiter.slot。
+    """
+    attempt = 0
+    while True:
+        started = False
+        stream = make_stream()
+        try:
+            async with limiter.slot(tokens, usage):
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+            return
+        except Exception as e:
+            if started or attempt >= max_retries or not is_retryable(e):
+                raise
+            error = e
+        finally:
+            await stream.aclose()
+        await asyncio.sleep(retry_delay(attempt, error))
+        attempt += 1
+
+
+async def multiplex(jobs):
+    """
+    并发运行多个异步生成器并合并输出
+
+    参数:
+        jobs: {job_id: 异步生成器}
+
+    产出:
+        (job_id, 'chunk', 内容) / (job_id, 'error', 异常) / (job_id, 'done', None)
+    """
+    queue = asyncio.Queue()
+
+    async def run(job_id, stream):
+        try:
+            async for chunk in stream:
+                await queue.put((job_id, 'chunk', chunk))
+            await queue.put((job_id, 'done', None))
+        except Exception as e:
+            await queue.put((job_id, 'error', e))
+        finally:
+            await stream.aclose()
+
+    tasks = [asyncio.create_task(run(job_id, stream)) for job_id, stream in jobs.items()]
+    try:
+        remaining = len(tasks)
+        while remaining:
+            event = await queue.get()
+            if event[1] != 'chunk':
+                remaining -= 1
+            yield event
+    finally:
+        # 客户端断开时取消尚未完成的任务
+        for task in tasks:
+            task.cancel()
+
+
+async def coalesce(deltas, window=RELAY_COALESCE_WINDOW, max_chars=RELAY_COALESCE_MAX_CHARS):
+    """
+    合并短时间内到达的文本增量，减少转发的帧数
+
+    距上一次输出已超过 window 秒时立即输出（首个增量和稀疏的流不增加延迟），否则等到
+    window 结束或累计达到 max_chars 个字符再合并输出。上游在后台任务中持续读取，
+    上游出错时先输出已收到的内容再抛出异常。
+    """
+    buffer = []
+    size = 0
+    finished = False
+    error = None
+    arrived = asyncio.Event()
+    full = asyncio.Event()
+
+    async def pump():
+        nonlocal size, finished, error
+        try:
+            async for text in deltas:
+                if not text:
+                    continue
+                buffer.append(text)
+                size += len(text)
+                arrived.set()
+                if size >= max_chars:
+                    full.set()
+        except Exception as e:
+            error = e
+        finally:
+            finished = True
+            arrived.set()
+            full.set()
+            await deltas.aclose()
+
+    loop = asyncio.get_running_loop()
+    task = loop.create_task(pump())
+    last = None
+    try:
+        while True:
+            if not finished:
+                await arrived.wait()
+            if last is not None and not finished and not full.is_set():
+                delay = last + window - loop.time()
+                if delay > 0:
+                    try:
+                        await asyncio.wait_for(full.wait(), delay)
+                    except asyncio.TimeoutError:
+                        pass
+            arrived.clear()
+            full.clear()
+            if buffer:
+                text = ''.join(buffer)
+                buffer.clear()
+                size = 0
+                last = loop.time()
+                yield text
+            elif finished:
+                if error is not None:
+                    raise error
+                return
+    finally:
+        # 提前结束时停止读取并关闭上游连接
+        if not task.done():
+            task.cancel()
+            await asyncio.wait([task])
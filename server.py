@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+服务启动入口（python app.py 或 python server.py）
+
+- 默认使用 uvicorn（HTTP/1.1）；--http2 使用 hypercorn（需要 pip install hypercorn，
+  浏览器只在 HTTPS 下使用 HTTP/2，需同时指定 --certfile / --keyfile）
+- --workers 大于 1 时启动多个工作进程，共享状态默认保存在 SQLite 中
+  （SHARED_STATE_BACKEND，见 shared_state.py）；
+  --workers 0 表示每个 CPU 核心一个工作进程
+- 收到 Ctrl+C / SIGTERM 后不再接受新连接，进行中的请求（含流式输出）最多再等待
+  --graceful-timeout 秒，然后执行应用的关闭流程（关闭上游连接、取消导出任务、写出剩余日志）
+"""
+import argparse
+import os
+from config import SERVER_HOST, SERVER_PORT, SERVER_WORKERS, SERVER_GRACEFUL_TIMEOUT
+from shared_state import WORKERS_ENV, backend_name
+
+APP = 'app:app'
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='AI 题库生成器服务')
+    parser.add_argument('--host', default=SERVER_HOST,
+                        help='监听地址，默认 HTTP/2 模式为 0.0.0.0，否则为 127.0.0.1')
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help='工作进程数，0 表示 CPU 核心数')
+    parser.add_argument('--http2', action='store_true', help='使用 hypercorn 启动，支持 HTTP/2')
+    parser.add_argument('--certfile', help='TLS 证书文件')
+    parser.add_argument('--keyfile', help='TLS 私钥文件')
+    parser.add_argument('--graceful-timeout', type=float, default=SERVER_GRACEFUL_TIMEOUT,
+                        help='退出时等待进行中的请求结束的秒数')
+    args = parser.parse_args(argv)
+    if args.workers < 0:
+        parser.error('--workers 不能为负数')
+    if bool(args.certfile) != bool(args.keyfile):
+        parser.error('--certfile 和 --keyfile 需要同时指定')
+    args.workers = args.workers or os.cpu_count() or 1
+    args.host = args.host or ('0.0.0.0' if args.http2 else '127.0.0.1')
+    return args
+
+
+def run_uvicorn(args):
+    import uvicorn
+    uvicorn.run(APP, host=args.host, port=args.port, workers=args.workers,
+                timeout_graceful_shutdown=args.graceful_timeout,
+                ssl_certfile=args.certfile, ssl_keyfile=args.keyfile)
+
+
+def run_hypercorn(args):
+    try:
+        from hypercorn.config import Config
+        from hypercorn.run import run
+    except ImportError:
+        raise SystemExit('HTTP/2 模式需要安装 hypercorn: pip install hypercorn')
+    config = Config()
+    config.application_path = APP
+    config.bind = [f'{args.host}:{args.port}']
+    config.workers = args.workers
+    config.graceful_timeout = args.graceful_timeout
+    if args.certfile:
+        config.certfile = args.certfile
+        config.keyfile = args.keyfile
+    run(config)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # 工作进程会重新导入应用，工作进程数通过环境变量传递
+    os.environ[WORKERS_ENV] = str(args.workers)
+    backend = backend_name()
+    scheme = 'https' if args.certfile else 'http'
+    print(f"启动 {'HTTP/2' if args.http2 else 'HTTP/1.1'} 服务器: {scheme}://{args.host}:{args.port}，"
+          f"{args.workers} 个工作进程，共享状态: {backend}")
+    if args.workers > 1 and backend == 'memory':
+        print("警告：SHARED_STATE_BACKEND 为 memory 时，日志、限速额度和导出任务只在各自进程内有效")
+    if args.http2:
+        run_hypercorn(args)
+    else:
+        print("提示：使用 'python app.py --http2' 启用 HTTP/2 支持")
+        run_uvicorn(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+多个工作进程之间共享的状态
+
+单进程运行（默认）时 get_shared_state() 返回 None，各模块使用进程内的实现；
+多个工作进程（python app.py --workers N）时返回 SQLiteState，最近日志、限速额度、
+导出任务信息、累计 token 用量和各进程的运行指标保存在 SHARED_STATE_DB 中（WAL 模式，多个进程可以同时读写）。
+
+工作进程由服务器启动，通过环境变量得知工作进程数（见 server.py）。
+事件循环上的调用方通过 SQLiteState.run / run_later 在专用线程中读写，该线程的连接
+等待写锁最多 SHARED_STATE_BUSY_TIMEOUT 秒，超时抛出 sqlite3.OperationalError。
+"""
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from config import SHARED_STATE_BACKEND, SHARED_STATE_DB, SHARED_STATE_BUSY_TIMEOUT
+
+WORKERS_ENV = 'QBANK_WORKERS'
+BACKENDS = ('memory', 'sqlite')
+BUSY_TIMEOUT = 30   # 等待其他进程释放写锁的秒数
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS logs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT, entry TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS export_jobs (
+    id TEXT PRIMARY KEY, owner INTEGER NOT NULL, info TEXT NOT NULL, path TEXT NOT NULL,
+    media_type TEXT NOT NULL, cancel INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS usage (
+    model TEXT NOT NULL, upstream TEXT NOT NULL, calls INTEGER NOT NULL, prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL, estimated INTEGER NOT NULL, truncated INTEGER NOT NULL,
+    PRIMARY KEY (model, upstream));
+CREATE TABLE IF NOT EXISTS metrics (
+    worker INTEGER PRIMARY KEY, data TEXT NOT NULL, updated REAL NOT NULL);
+"""
+
+
+def worker_count():
+    return max(1, int(os.environ.get(WORKERS_ENV) or 1))
+
+
+def backend_name():
+    """当前使用的共享状态后端：SHARED_STATE_BACKEND，未设置时按工作进程数选择"""
+    name = SHARED_STATE_BACKEND
+    if name is None:
+        name = 'sqlite' if worker_count() > 1 else 'memory'
+    if name not in BACKENDS:
+        raise ValueError(f"未知的共享状态后端: {name}，可选: {', '.join(BACKENDS)}")
+    return name
+
+
+class SQLiteState:
+    """保存在 SQLite 中的共享状态，每个线程使用单独的连接"""
+
+    def __init__(self, path=SHARED_STATE_DB):
+        self.path = path
+        self._local = threading.local()
+        # 事件循环上的读写交给这个线程依次执行，连接使用较短的等待时间
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix='shared-state', initializer=self._init_worker)
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection().executescript(SCHEMA)
+
+    def _init_worker(self):
+        self._local.busy_timeout = SHARED_STATE_BUSY_TIMEOUT
+
+    async def run(self, func, *args):
+        """在专用线程中执行 func(*args) 并等待结果，func 为本对象的方法"""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def run_later(self, func, *args):
+        """在专用线程中执行 func(*args)，不等待结果，失败时忽略"""
+        self._executor.submit(func, *args)
+
+    def _connection(self):
+        db = getattr(self._local, 'db', None)
+        if db is None:
+            # isolation_level=None 自行管理事务，写事务用 BEGIN IMMEDIATE 一开始就取得写锁
+            timeout = getattr(self._local, 'busy_timeout', BUSY_TIMEOUT)
+            db = sqlite3.connect(self.path, timeout=timeout, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.depth = 0
+        return db
+
+    @contextmanager
+    def transaction(self):
+        """写事务，同一时间只有一个进程能进入，可嵌套（只有最外层提交）"""
+        db = self._connection()
+        if self._local.depth == 0:
+            db.execute('BEGIN IMMEDIATE')
+        self._local.depth += 1
+        try:
+            yield db
+        except BaseException:
+            self._local.depth -= 1
+            if self._local.depth == 0:
+                db.execute('ROLLBACK')
+            raise
+        self._local.depth -= 1
+        if self._local.depth == 0:
+            db.execute('COMMIT')
+
+    def take_tokens(self, key, amount, rate, capacity):
+        """
+        从令牌桶 key 中取出 amount 个令牌（rate 为每秒补充的数量）
+
+        返回:
+            0 表示已取出，否则为令牌不足时建议等待的秒数（未扣除）
+        """
+        now = time.time()
+        with self.transaction() as db:
+            tokens = self._bucket_tokens(db, key, rate, capacity, now)
+            wait = 0.0
+            if tokens >= amount:
+                tokens -= amount
+            else:
+                wait = (amount - tokens) / rate
+            db.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+        return wait
+
+    def adjust_tokens(self, key, amount, rate, capacity):
+        """按实际用量修正令牌桶 key：amount 为正时补扣（可以扣成负数），为负时退回"""
+        now = time.time()
+        with self.transaction() as db:
+            tokens = min(capacity, self._bucket_tokens(db, key, rate, capacity, now) - amount)
+            db.execute('INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)', (key, tokens, now))
+
+    @staticmethod
+    def _bucket_tokens(db, key, rate, capacity, now):
+        row = db.execute('SELECT tokens, updated FROM buckets WHERE key = ?', (key,)).fetchone()
+        return capacity if row is None else min(capacity, row[0] + max(0.0, now - row[1]) * rate)
+
+    def add_logs(self, entries, limit):
+        """追加日志，只保留最近 limit 条"""
+        with self.transaction() as db:
+            db.executemany('INSERT INTO logs (entry) VALUES (?)',
+                           [(json.dumps(entry, ensure_ascii=False, default=str),) for entry in entries])
+            db.execute('DELETE FROM logs WHERE id <= (SELECT MAX(id) FROM logs) - ?', (limit,))
+
+    def recent_logs(self, limit):
+        """最近 limit 条日志，最新的在前"""
+        rows = self._connection().execute('SELECT entry FROM logs ORDER BY id DESC LIMIT ?', (limit,)).fetchall()
+        return [json.loads(entry) for entry, in rows]
+
+    def add_usage(self, rows):
+        """累加 token 用量，rows 为 (model, upstream, 调用数, prompt, completion, 估算数, 截断数) 列表"""
+        with self.transaction() as db:
+            db.executemany(
+                'INSERT INTO usage (model, upstream, calls, prompt_tokens, completion_tokens, estimated, truncated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT(model, upstream) DO UPDATE SET calls = calls + excluded.calls, '
+                'prompt_tokens = prompt_tokens + excluded.prompt_tokens, '
+                'completion_tokens = completion_tokens + excluded.completion_tokens, '
+                'estimated = estimated + excluded.estimated, truncated = truncated + excluded.truncated',
+                rows)
+
+    def usage_totals(self):
+        rows = self._connection().execute(
+            'SELECT model, upstream, calls, prompt_tokens, completion_tokens, estimated, truncated FROM usage').fetchall()
+        return [{'model': model, 'upstream': upstream, 'calls': calls, 'promptTokens': prompt,
+                 'completionTokens': completion, 'totalTokens': prompt + completion, 'estimated': estimated,
+                 'truncated': truncated}
+                for model, upstream, calls, prompt, completion, estimated, truncated in rows]
+
+    def put_metrics(self, data, max_age):
+        """发布本进程的指标数据（JSON），同时删除 max_age 秒未更新的进程（已退出）的数据"""
+        now = time.time()
+        with self.transaction() as db:
+            db.execute('INSERT OR REPLACE INTO metrics (worker, data, updated) VALUES (?, ?, ?)', (os.getpid(), data, now))
+            db.execute('DELETE FROM metrics WHERE updated < ?', (now - max_age,))
+
+    def worker_metrics(self, max_age):
+        """各进程最近 max_age 秒内发布的指标数据，[(进程号, JSON)]"""
+        return self._connection().execute(
+            'SELECT worker, data FROM metrics WHERE updated >= ?', (time.time() - max_age,)).fetchall()
+
+    def delete_metrics(self):
+        with self.transaction() as db:
+            db.execute('DELETE FROM metrics WHERE worker = ?', (os.getpid(),))
+
+    def put_job(self, job_id, info, path, media_type):
+        """
+        写入导出任务的最新信息
+
+        返回:
+            其他进程是否已请求取消该任务
+        """
+        with self.transaction() as db:
+            db.execute(
+                'INSERT INTO export_jobs (id, owner, info, path, media_type, updated) VALUES (?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(id) DO UPDATE SET info = excluded.info, updated = excluded.updated',
+                (job_id, os.getpid(), json.dumps(info, ensure_ascii=False), path, media_type, time.time()))
+            row = db.execute('SELECT cancel FROM export_jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row[0])
+
+    def get_job(self, job_id):
+        row = self._connection().execute(
+            'SELECT id, owner, info, path, media_type, cancel, updated FROM export_jobs WHERE id = ?',
+            (job_id,)).fetchone()
+        return self._job_row(row) if row is not None else None
+
+    def list_jobs(self):
+        rows = self._connection().execute(
+            'SELECT id, owner, info, path, media_type, cancel, updated FROM export_jobs').fetchall()
+        return [self._job_row(row) for row in rows]
+
+    @staticmethod
+    def _job_row(row):
+        job_id, owner, info, path, media_type, cancel, updated = row
+        return {'id': job_id, 'owner': owner, 'info': json.loads(info), 'path': path,
+                'media_type': media_type, 'cancel': bool(cancel), 'updated': updated}
+
+    def cancel_job(self, job_id):
+        """请求取消其他进程中的任务，由该进程在下次同步进度时取消"""
+        with self.transaction() as db:
+            db.execute('UPDATE export_jobs SET cancel = 1 WHERE id = ?', (job_id,))
+
+    def delete_job(self, job_id):
+        with self.transaction() as db:
+            db.execute('DELETE FROM export_jobs WHERE id = ?', (job_id,))
+
+
+_state = None
+_state_lock = threading.Lock()
+
+
+def get_shared_state():
+    """共享状态，单进程时返回 None"""
+    global _state
+    if _state is None and backend_name() == 'sqlite':
+        with _state_lock:
+            if _state is None:
+                _state = SQLiteState()
+    return _state
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+流式题目解析
+
+在生成过程中增量扫描模型输出：定位 ```json 代码块（或裸 JSON），
+questions 数组中的每道题一闭合就解析出来，结构无法恢复时立即报错。
+"""
+import json
+
+FENCE = '```json'
+# 超过这么多字符仍未找到 JSON 开头时放弃增量解析（交给前端在结束后提取）
+SEEK_LIMIT = 4000
+
+
+class StreamParseError(Exception):
+    """输出结构已损坏，无法继续解析"""
+
+
+class QuestionStreamParser:
+    """
+    增量解析器
+
+    feed() 传入文本增量，返回本次新解析出的 (index, question) 列表；
+    结构无法恢复时 error 被设置为错误说明，之后不再解析。
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self.pos = 0
+        self.started = False
+        self.gave_up = False
+        self.finished = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.string_start = None
+        self.last_key = None
+        self.in_questions = False
+        self.element_start = None
+        self.count = 0
+        self.error = None
+
+    def feed(self, text):
+        if self.finished or self.gave_up or self.error or not text:
+            return []
+        self.buffer += text
+        results = []
+        try:
+            if self.started or self._seek():
+                self._scan(results)
+        except StreamParseError as e:
+            self.error = str(e)
+        return results
+
+    def _seek(self):
+        """寻找 JSON 的起点：```json 代码块之后，或者以 { 开头的裸 JSON"""
+        fence = self.buffer.find(FENCE)
+        if fence != -1:
+            start = self.buffer.find('{', fence + len(FENCE))
+            if start == -1:
+                return False
+            if self.buffer[fence + len(FENCE):start].strip():
+                raise StreamParseError('```json 代码块没有以 { 开头')
+        else:
+            stripped = self.buffer.lstrip()
+            if not stripped.startswith('{'):
+                if len(self.buffer) > SEEK_LIMIT:
+                    self.gave_up = True
+                return False
+            start = len(self.buffer) - len(stripped)
+        self.buffer = self.buffer[start:]
+        self.pos = 0
+        self.started = True
+        return True
+
+    def _scan(self, results):
+        buffer = self.buffer
+        i = self.pos
+        length = len(buffer)
+        while i < length:
+            ch = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_key = buffer[self.string_start + 1:i]
+            elif ch == '"':
+                self.in_string = True
+                self.string_start = i
+            elif ch in '{[':
+                if self.in_questions and self.depth == 2:
+                    if ch != '{':
+                        raise StreamParseError(f'第 {self.count + 1} 道题不是 JSON 对象')
+                    self.element_start = i
+                elif ch == '[' and self.depth == 1 and self.last_key == 'questions':
+                    self.in_questions = True
+                self.depth += 1
+            elif ch in '}]':
+                self.depth -= 1
+                if self.depth < 0:
+                    raise StreamParseError('括号不匹配')
+                if self.in_questions and self.depth == 2 and self.element_start is not None:
+                    results.append(self._parse_element(buffer[self.element_start:i + 1]))
+                    self.element_start = None
+                elif self.in_questions and self.depth == 1:
+                    self.in_questions = False
+                elif self.depth == 0:
+                    self.finished = True
+                    break
+            elif ch == '`':
+                raise StreamParseError('JSON 未闭合时代码块已结束，输出可能被截断')
+            elif self.in_questions and self.depth == 2 and ch not in ' \t\r\n,':
+                raise StreamParseError(f'第 {self.count + 1} 道题之前出现非法字符 {ch!r}')
+            i += 1
+
+        # 丢弃已经解析完的部分，只保留当前未闭合的题目
+        keep = self.element_start if self.element_start is not None else i
+        if self.in_string and self.string_start is not None:
+            keep = min(keep, self.string_start)
+        self.buffer = buffer[keep:]
+        self.pos = i - keep
+        if self.element_start is not None:
+            self.element_start -= keep
+        if self.string_start is not None:
+            self.string_start -= keep
+
+    def _parse_element(self, raw):
+        try:
+            question = json.loads(raw)
+        except ValueError as e:
+            raise StreamParseError(f'第 {self.count + 1} 道题 JSON 格式错误: {e}')
+        index = self.count
+        self.count += 1
+        return index, question
+
+
+def extract_questions(text):
+    """从完整输出中提取 questions 列表，规则与前端 extractJSON 一致；失败时返回 None"""
+    parser = QuestionStreamParser()
+    questions = [question for _, question in parser.feed(text)]
+    if parser.finished:
+        return questions
+    start, end = text.find('{'), text.rfind('}')
+    if start != -1 and end > start:
+        try:
+            return json.loads(text[start:end + 1]).get('questions')
+        except (ValueError, AttributeError):
+            pass
+    return questions if parser.count else None
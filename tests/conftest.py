@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""测试公共配置：项目根目录加入导入路径，提供以示例题目为模板生成题目的 fixture"""
+import json
+import os
+import sys
+
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+@pytest.fixture(scope='session')
+def demo_questions():
+    with open(os.path.join(ROOT_DIR, 'demo_questions.json'), 'r', encoding='utf-8') as f:
+        return json.load(f)['questions']
+
+
+@pytest.fixture
+def make_questions(demo_questions):
+    """返回生成 count 道互不相同的题目的函数"""
+    def make(count):
+        questions = []
+        for i in range(count):
+            question = dict(demo_questions[i % len(demo_questions)])
+            for key in question:
+                if key.startswith('题干'):
+                    question[key] = f"{question[key]}（第{i + 1}题）"
+            questions.append(question)
+        return questions
+    return make
@@ -0,0 +1,44 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""原始材料切分"""
+from chunker import split_blocks, split_source
+from utils import estimate_tokens
+
+
+def numbered(count, body='题目内容'):
+    return ''.join(f'{i + 1}. 第{i + 1}题{body}\n' for i in range(count))
+
+
+def test_blocks_start_at_question_numbers():
+    text = '1. 甲\n补充说明\n（2）乙\n第3题 丙\n四、丁\n'
+    assert split_blocks(text) == ['1. 甲\n补充说明\n', '（2）乙\n', '第3题 丙\n', '四、丁\n']
+
+
+def test_paragraphs_when_there_are_no_question_numbers():
+    assert split_blocks('第一段\n\n\n第二段\n') == ['第一段\n\n', '第二段\n\n\n']
+
+
+def test_chunks_stay_within_budget_and_keep_order():
+    text = numbered(50)
+    chunks = split_source(text, max_tokens=40)
+    assert len(chunks) > 1
+    assert all(estimate_tokens(chunk) <= 40 for chunk in chunks)
+    assert [line for chunk in chunks for line in chunk.splitlines()] == text.splitlines()
+
+
+def test_questions_are_not_split_when_they_fit():
+    chunks = split_source(numbered(6, '内容' * 5), max_tokens=40)
+    for chunk in chunks:
+        assert all(line.split('.')[0].isdigit() for line in chunk.splitlines())
+
+
+def test_oversized_block_is_split_by_line_and_character():
+    text = '1. ' + '很长的题干' * 30 + '\n第二行\n2. 短题\n'
+    chunks = split_source(text, max_tokens=20)
+    assert all(estimate_tokens(chunk) <= 20 for chunk in chunks)
+    assert ''.join(chunks).replace('\n', '') == text.replace('\n', '')
+
+
+def test_short_text_is_a_single_chunk():
+    assert split_source('1. 甲\n2. 乙\n', max_tokens=100) == ['1. 甲\n2. 乙']
+    assert split_source('   \n', max_tokens=100) == []
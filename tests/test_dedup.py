@@ -0,0 +1,48 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""导出前去重"""
+import pytest
+
+from dedup import deduplicate, find_duplicates
+
+
+def question(stem, options=('酸', '甜', '苦', '辣')):
+    return {'题干': stem, '选项 A': options[0], '选项 B': options[1], '选项 C': options[2], '选项 D': options[3]}
+
+
+ORIGINAL = question('食醋是什么味道的？请选择最符合的一项')
+QUESTIONS = [
+    ORIGINAL,
+    question('一年中有几个季节？请选择正确的数量', ('一', '二', '三', '四')),
+    question('食醋是什么味道的? 请选择最符合的一项。'),
+    question('食醋是什么味道的？请选择最符合的一项'),
+]
+
+
+def test_later_duplicates_point_to_the_earliest_original():
+    duplicates = find_duplicates(QUESTIONS)
+    assert [(item['index'], item['duplicateOf']) for item in duplicates] == [(2, 0), (3, 0)]
+    assert all(0 < item['similarity'] <= 1 for item in duplicates)
+
+
+def test_flag_mode_keeps_questions_and_marks_duplicates():
+    questions, flagged, duplicates = deduplicate(QUESTIONS, 'flag')
+    assert questions == QUESTIONS
+    assert flagged == {2, 3}
+    assert len(duplicates) == 2
+
+
+def test_drop_mode_removes_duplicates():
+    questions, flagged, duplicates = deduplicate(iter(QUESTIONS), 'drop')
+    assert questions == QUESTIONS[:2]
+    assert flagged == set()
+    assert len(duplicates) == 2
+
+
+def test_off_mode_returns_questions_unchanged():
+    assert deduplicate(QUESTIONS, 'off') == (QUESTIONS, set(), [])
+
+
+def test_unknown_mode_is_rejected():
+    with pytest.raises(ValueError):
+        deduplicate(QUESTIONS, 'merge')
@@ -0,0 +1,151 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""导出任务池、分文件 zip 和后台导出任务"""
+import asyncio
+import io
+import time
+import zipfile
+
+import pytest
+
+import export_pool
+from export_jobs import ExportJobStore
+from export_pool import ExportCancelled, ExportPool, ExportRejected, stream_grouped_zip
+from export_writers import WRITERS
+from grouped_export import group_questions
+
+CHAPTERS = ['第一单元', '第二单元', '第三单元', '第一单元', '第四单元', '第二单元']
+
+
+@pytest.fixture
+def pool():
+    pool = ExportPool(mode='thread', workers=2, queue_size=4, max_questions=100, timeout=5)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def questions(make_questions):
+    questions = make_questions(len(CHAPTERS))
+    for question, chapter in zip(questions, CHAPTERS):
+        question['章节（勿删）'] = chapter
+    return questions
+
+
+class Disconnected:
+    async def is_disconnected(self):
+        return True
+
+
+def slow_entry(*args, cancel=None):
+    # 等到被取消（超时或客户端断开时任务池设置取消标记）
+    cancel.wait(5)
+    raise ExportCancelled('导出已取消')
+
+
+async def read_zip(request, groups, pool):
+    body = b''.join([chunk async for chunk in stream_grouped_zip(request, groups, WRITERS['csv'], pool)])
+    return zipfile.ZipFile(io.BytesIO(body))
+
+
+def test_grouped_zip_contains_every_group(pool, questions):
+    groups = group_questions(questions, 'chapter')
+    archive = asyncio.run(read_zip(None, groups, pool))
+    assert archive.testzip() is None
+    assert sorted(archive.namelist()) == sorted(f'{name}.csv' for name, _, _ in groups)
+    first = archive.read('第一单元.csv').decode('utf-8-sig')
+    assert '（第1题）' in first and '（第4题）' in first and '（第2题）' not in first
+    assert pool.pending == 0 and pool.completed == len(groups)
+
+
+def test_too_many_questions_are_rejected_before_streaming(pool, questions):
+    pool.max_questions = len(questions) - 1
+    with pytest.raises(ExportRejected) as error:
+        stream_grouped_zip(None, group_questions(questions, 'chapter'), WRITERS['csv'], pool)
+    assert error.value.status_code == 413
+    assert pool.pending == 0
+
+
+def test_timeout_aborts_the_stream(pool, questions, monkeypatch):
+    monkeypatch.setattr(export_pool, 'build_group_entry', slow_entry)
+    pool.timeout = 0.05
+    with pytest.raises(ExportRejected) as error:
+        asyncio.run(read_zip(None, group_questions(questions, 'chapter'), pool))
+    assert error.value.status_code == 504
+    assert pool.pending == 0
+
+
+def test_disconnect_cancels_the_stream(pool, questions, monkeypatch):
+    monkeypatch.setattr(export_pool, 'build_group_entry', slow_entry)
+    with pytest.raises(ExportCancelled):
+        asyncio.run(read_zip(Disconnected(), group_questions(questions, 'chapter'), pool))
+    assert pool.pending == 0
+
+
+def test_export_job_is_admitted_once(tmp_path, questions):
+    pool = ExportPool(mode='thread', workers=1, queue_size=0)
+    store = ExportJobStore(directory=tmp_path)
+
+    async def main():
+        job = await store.create(pool, WRITERS['csv'], questions, 'off', None, 'sheets')
+        assert pool.pending == 1
+        with pytest.raises(ExportRejected) as error:
+            await store.create(pool, WRITERS['csv'], questions, 'off', None, 'sheets')
+        assert error.value.status_code == 503
+        assert list(store.jobs) == [job.id]
+        await job.task
+        return job
+
+    try:
+        job = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert job.state == 'done' and job.info()['written'] == len(questions)
+    assert job.path.stat().st_size == job.size
+    assert pool.pending == 0
+
+
+def test_grouped_export_job_writes_a_zip(tmp_path, questions):
+    pool = ExportPool(mode='thread', workers=1, queue_size=0)
+    store = ExportJobStore(directory=tmp_path)
+
+    async def main():
+        job = await store.create(pool, WRITERS['csv'], questions, 'off', 'chapter', 'files')
+        await job.task
+        return job
+
+    try:
+        job = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert job.state == 'done'
+    with zipfile.ZipFile(job.path) as archive:
+        assert len(archive.namelist()) == len(set(CHAPTERS))
+
+
+def test_deleting_a_queued_job_cancels_it(tmp_path, questions, monkeypatch):
+    pool = ExportPool(mode='thread', workers=1, queue_size=1)
+    store = ExportJobStore(directory=tmp_path)
+    calls = []
+
+    def write_export_file(*args, cancel=None):
+        calls.append(args)
+        time.sleep(0.2)
+        return 0, 0, 0
+
+    monkeypatch.setattr('export_jobs.write_export_file', write_export_file)
+
+    async def main():
+        running = await store.create(pool, WRITERS['csv'], questions, 'off', None, 'sheets')
+        queued = await store.create(pool, WRITERS['csv'], questions, 'off', None, 'sheets')
+        assert await store.delete(queued.id)
+        await asyncio.gather(running.task, queued.task, return_exceptions=True)
+        return running, queued
+
+    try:
+        running, queued = asyncio.run(main())
+    finally:
+        pool.shutdown()
+    assert running.state == 'done' and queued.task.cancelled()
+    assert len(calls) == 1 and queued.id not in store.jobs
+    assert pool.pending == 0
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""服务端题库"""
+import pytest
+
+from question_store import QuestionStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return QuestionStore(str(tmp_path / 'questions.sqlite3'))
+
+
+def question(stem, question_type='单选题', chapter='第一单元', answer='A'):
+    return {'题干': stem, '题型': question_type, '章节': chapter, '难度': '易', '选项 A': '酸', '答案': answer}
+
+
+def test_upsert_counts_inserted_updated_and_unchanged(store):
+    result = store.upsert([question('食醋是什么味道的？'), question('一年有几个季节？')])
+    assert (result['inserted'], result['updated'], result['unchanged'], result['version']) == (2, 0, 0, 1)
+    # 只有标点和空白不同的题干是同一道题
+    result = store.upsert([question('食醋是什么味道的?', answer='B'), question('一年有几个季节？')])
+    assert (result['inserted'], result['updated'], result['unchanged'], result['version']) == (0, 1, 1, 2)
+    result = store.upsert([question('一年有几个季节？')])
+    assert (result['unchanged'], result['version']) == (1, 2)
+    assert store.version() == 2
+
+
+def test_invalid_questions(store):
+    with pytest.raises(ValueError):
+        store.upsert([question('甲'), {'题型': '单选题'}])
+    assert store.query()['total'] == 0
+    result = store.upsert([question('甲'), {'题型': '单选题'}, 'x'], skip_invalid=True)
+    assert (result['inserted'], result['invalid']) == (1, 2)
+    assert result['hashes'][1:] == [None, None]
+
+
+def test_query_filters_keywords_and_pages(store):
+    store.upsert([question('食醋是什么味道的？'), question('食盐是什么味道的？', '多选题'),
+                  question('100% 的把握', chapter='第二单元')])
+    assert store.query(keyword='什么味道')['total'] == 2
+    assert store.query(keyword='醋')['total'] == 1          # 少于三个字时使用 LIKE
+    assert store.query(keyword='%')['total'] == 1           # 通配符按原字符匹配
+    assert store.query(type='多选题')['items'][0]['question']['题干'] == '食盐是什么味道的？'
+    assert store.query(chapter='第二单元', keyword='什么味道')['total'] == 0
+    page = store.query(limit=2, offset=2)
+    assert (page['total'], len(page['items'])) == (3, 1)
+
+
+def test_changes_since_version_include_deletions(store):
+    first = store.upsert([question('甲题'), question('乙题')])
+    store.upsert([question('丙题')])
+    assert store.delete([first['hashes'][0], 'missing']) == 1
+    questions, deleted, version = store.changes(since=first['version'])
+    assert [item['题干'] for item in questions] == ['丙题']
+    assert deleted == [first['hashes'][0]]
+    assert version == 3
+    assert store.query(since=1)['deleted'] == deleted
+    # 再次保存删除过的题目时移除删除记录
+    store.upsert([question('甲题')])
+    assert store.changes(since=first['version'])[1] == []
+
+
+def test_export_cursors(store):
+    assert store.cursor('lms') == 0
+    store.upsert([question('甲题')])
+    store.move_cursor('lms', store.version())
+    assert store.cursor('lms') == 1
+    assert store.stats()['exportCursors'] == {'lms': 1}
@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""AI 响应缓存"""
+import asyncio
+import sqlite3
+
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, cache_key
+
+MESSAGES = [{'role': 'system', 'content': '出题'}, {'role': 'user', 'content': '材料'}]
+
+
+@pytest.fixture
+def db_path(tmp_path, monkeypatch):
+    # 等待写锁的时间缩短，锁住数据库的用例不必等满 SHARED_STATE_BUSY_TIMEOUT
+    monkeypatch.setattr(response_cache, 'SHARED_STATE_BUSY_TIMEOUT', 0.1)
+    return str(tmp_path / 'cache.sqlite3')
+
+
+def test_cache_key_depends_on_upstream_model_and_messages():
+    key = cache_key('https://a.example/v1', 'm', MESSAGES)
+    assert key == cache_key('https://a.example/v1/', 'm', MESSAGES)
+    assert key != cache_key('https://b.example/v1', 'm', MESSAGES)
+    assert key != cache_key('https://a.example/v1', 'n', MESSAGES)
+    assert key != cache_key('https://a.example/v1', 'm', MESSAGES[:1])
+
+
+def test_memory_layer_evicts_least_recently_used():
+    cache = ResponseCache(max_entries=2, db_path=None)
+    cache.set('a', '1')
+    cache.set('b', '2')
+    assert cache.get('a') == '1'
+    cache.set('c', '3')
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == ('1', '3')
+    assert cache.stats()['hits'] == 3 and cache.stats()['misses'] == 1
+
+
+def test_expired_entries_are_misses(monkeypatch):
+    cache = ResponseCache(ttl=10, db_path=None)
+    cache.set('a', '1')
+    now = response_cache.time.time()
+    monkeypatch.setattr(response_cache.time, 'time', lambda: now + 11)
+    assert cache.get('a') is None
+    assert cache.stats()['memory_entries'] == 0
+
+
+def test_disk_layer_survives_a_new_instance(db_path):
+    cache = ResponseCache(db_path=db_path)
+    asyncio.run(cache.aset('a', '回答'))
+    reopened = ResponseCache(db_path=db_path)
+    assert reopened.stats()['disk_bytes'] == len('回答'.encode('utf-8'))
+    assert asyncio.run(reopened.aget('a')) == '回答'
+    # 从磁盘读到后放入内存层
+    assert reopened.stats()['memory_entries'] == 1
+
+
+def test_disk_size_is_tracked_through_replacement_and_eviction(db_path):
+    cache = ResponseCache(max_entries=1, db_path=db_path, max_db_bytes=100)
+    for i in range(10):
+        cache.set(f'k{i}', 'x' * 30)
+    cache.set('k9', 'x' * 10)
+    total = cache._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+    assert cache.stats()['disk_bytes'] == total <= 100
+    assert cache.get('k0') is None
+    assert cache.get('k9') == 'x' * 10
+
+
+def test_locked_database_is_a_miss_and_skips_the_write(db_path):
+    cache = ResponseCache(max_entries=1, db_path=db_path)
+    cache.set('a', '1')
+    cache.set('b', '2')   # 'a' 只在磁盘层
+    before = cache.stats()['disk_bytes']
+    other = sqlite3.connect(db_path, isolation_level=None)
+    other.execute('BEGIN EXCLUSIVE')
+    try:
+        assert cache.get('a') is None
+        cache.set('c', '3')
+        assert cache.get('c') == '3'
+        assert cache.stats()['disk_bytes'] == before
+    finally:
+        other.execute('ROLLBACK')
+        other.close()
+    assert cache.get('a') == '1'
+    assert cache._db.execute("SELECT COUNT(*) FROM responses WHERE key = 'c'").fetchone()[0] == 0
@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""批量请求调度和上游池选择"""
+import asyncio
+
+import pytest
+
+import provider_router
+import scheduler
+from http_client import UpstreamError
+from provider_router import ProviderRouter
+from scheduler import ProviderLimiter, TokenBucket, stream_with_retry
+from usage import Usage
+
+
+@pytest.fixture(autouse=True)
+def fresh_limiters(monkeypatch):
+    # 限速器按上游地址全局共用，每个用例使用新的（asyncio.run 每次创建新的事件循环）
+    monkeypatch.setattr(scheduler, '_limiters', {})
+    monkeypatch.setattr(scheduler, 'retry_delay', lambda attempt, error: 0)
+
+
+def test_token_bucket_takes_and_refunds_tokens():
+    bucket = TokenBucket(60)
+    asyncio.run(bucket.acquire(1000))   # 超过容量的请求按容量计算，桶满时不等待
+    assert bucket.wait_time(1) == pytest.approx(1, abs=0.05)
+    bucket.adjust(-30)
+    assert bucket.wait_time(30) == pytest.approx(0, abs=0.05)
+    bucket.adjust(40)   # 补扣可以扣成负数
+    assert bucket.tokens < 0
+
+
+def test_limiter_caps_concurrency():
+    limiter = ProviderLimiter(concurrency=2, rpm=0, tpm=0)
+    active = peak = 0
+
+    async def job():
+        nonlocal active, peak
+        async with limiter.slot():
+            active += 1
+            peak = max(peak, active)
+            await asyncio.sleep(0.01)
+            active -= 1
+
+    async def main():
+        await asyncio.gather(*(job() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2
+
+
+def test_limiter_corrects_tpm_with_actual_usage():
+    limiter = ProviderLimiter(concurrency=1, rpm=0, tpm=1000)
+    usage = Usage('m')
+
+    async def main():
+        async with limiter.slot(100, usage):
+            usage.add(50, 150, True, False)
+
+    asyncio.run(main())
+    assert limiter.tpm.tokens == pytest.approx(800, abs=1)
+
+
+def failing_stream(outputs):
+    """依次产出 outputs 中的文本，遇到异常时抛出"""
+    async def stream():
+        for item in outputs:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    return stream()
+
+
+def collect(make_stream, **kwargs):
+    async def main():
+        return [chunk async for chunk in stream_with_retry(make_stream, ProviderLimiter(rpm=0, tpm=0), **kwargs)]
+    return asyncio.run(main())
+
+
+def test_retries_before_any_output():
+    attempts = iter([[UpstreamError(503)], [UpstreamError(429, retry_after='0')], ['a', 'b']])
+    assert collect(lambda: failing_stream(next(attempts))) == ['a', 'b']
+
+
+def test_does_not_retry_after_output_or_client_errors():
+    attempts = iter([['a', UpstreamError(503)], ['a', 'b']])
+    with pytest.raises(UpstreamError):
+        collect(lambda: failing_stream(next(attempts)))
+    attempts = iter([[UpstreamError(400)], ['a']])
+    with pytest.raises(UpstreamError):
+        collect(lambda: failing_stream(next(attempts)))
+
+
+def test_gives_up_after_max_retries():
+    count = 0
+
+    def make_stream():
+        nonlocal count
+        count += 1
+        return failing_stream([UpstreamError(500)])
+
+    with pytest.raises(UpstreamError):
+        collect(make_stream, max_retries=2)
+    assert count == 3
+
+
+def make_router(*names, model='m'):
+    return ProviderRouter([{'name': name, 'api_url': f'https://{name}.example/v1', 'api_key': 'k', 'model': model,
+                            'hedge': False} for name in names])
+
+
+def test_candidates_prefer_faster_and_skip_cooling_down():
+    router = make_router('a', 'b', 'c')
+    a, b, c = router.providers
+    a.record_first_token(2.0)
+    b.record_first_token(0.5)
+    c.record_first_token(1.0)
+    assert router.candidates('m', 0) == [b, c, a]
+    b.record_failure(UpstreamError(429, retry_after='60'))
+    assert router.candidates('m', 0) == [c, a]
+
+
+def test_all_cooling_down_are_tried_by_cooldown_end():
+    router = make_router('a', 'b')
+    a, b = router.providers
+    a.record_failure(UpstreamError(429, retry_after='60'))
+    b.record_failure(UpstreamError(429, retry_after='30'))
+    assert router.candidates('m', 0) == [b, a]
+
+
+def test_candidates_filter_by_model():
+    router = ProviderRouter([
+        {'name': 'a', 'api_url': 'https://a.example/v1', 'api_key': 'k', 'model': 'x'},
+        {'name': 'b', 'api_url': 'https://b.example/v1', 'api_key': 'k', 'model': 'y'}])
+    assert [provider.name for provider in router.candidates('y', 0)] == ['b']
+    assert len(router.candidates('other', 0)) == 2
+    with pytest.raises(UpstreamError):
+        ProviderRouter([]).candidates('m', 0)
+
+
+def test_stream_fails_over_before_output(monkeypatch):
+    monkeypatch.setattr(provider_router, 'ROUTER_HEDGE_DELAY', 0)
+    router = make_router('a', 'b')
+    a, b = router.providers
+    a.record_first_token(0.1)
+    b.record_first_token(0.2)
+
+    def open_stream(api_url, api_key, model, messages, on_headers, usage):
+        return failing_stream([UpstreamError(502)] if api_url == a.api_url else ['题', '目'])
+
+    async def main():
+        return [text async for text in router.stream('m', [{'role': 'user', 'content': '材料'}], open_stream)]
+
+    assert asyncio.run(main()) == ['题', '目']
+    assert (a.errors, a.failovers, b.requests) == (1, 1, 1)
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""流式题目解析"""
+import json
+
+from stream_parser import QuestionStreamParser, SEEK_LIMIT, extract_questions
+
+QUESTIONS = [{'题干': '食醋是什么味道的？', '答案': 'A'},
+             {'题干': '含有 "引号" 和 } 括号的题干', '答案': 'B'},
+             {'题干': '第三题', '选项': ['[', ']']}]
+
+
+def fenced(questions):
+    return '下面是生成的题目：\n```json\n' + json.dumps({'questions': questions}, ensure_ascii=False) + '\n```\n'
+
+
+def feed_all(parser, text, size):
+    results = []
+    for i in range(0, len(text), size):
+        results.extend(parser.feed(text[i:i + size]))
+    return results
+
+
+def test_questions_are_parsed_as_they_close_across_any_split():
+    text = fenced(QUESTIONS)
+    for size in (1, 2, 7, len(text)):
+        parser = QuestionStreamParser()
+        assert feed_all(parser, text, size) == list(enumerate(QUESTIONS))
+        assert parser.finished and parser.error is None
+
+
+def test_each_question_is_returned_once_it_closes():
+    parser = QuestionStreamParser()
+    head = '```json\n{"questions": [' + json.dumps(QUESTIONS[0], ensure_ascii=False)
+    assert parser.feed(head[:-1]) == []
+    assert parser.feed(head[-1]) == [(0, QUESTIONS[0])]
+    assert not parser.finished
+
+
+def test_bare_json_without_fence():
+    parser = QuestionStreamParser()
+    assert parser.feed(json.dumps({'questions': QUESTIONS[:1]})) == [(0, QUESTIONS[0])]
+    assert parser.finished
+
+
+def test_fence_not_followed_by_object_is_an_error():
+    parser = QuestionStreamParser()
+    parser.feed('```json\n[1, 2] {"questions": []}')
+    assert parser.error == '```json 代码块没有以 { 开头'
+    assert parser.feed('{}') == []
+
+
+def test_fence_closed_before_json_is_reported_as_truncated():
+    parser = QuestionStreamParser()
+    results = parser.feed('```json\n{"questions": [{"题干": "a"}, {"题干": "b"\n```')
+    assert results == [(0, {'题干': 'a'})]
+    assert '截断' in parser.error
+
+
+def test_non_object_question_is_an_error():
+    parser = QuestionStreamParser()
+    parser.feed('{"questions": [{"题干": "a"}, ["b"]]}')
+    assert parser.error == '第 2 道题不是 JSON 对象'
+
+
+def test_stray_characters_between_questions_are_an_error():
+    parser = QuestionStreamParser()
+    parser.feed('{"questions": [{"题干": "a"} x {"题干": "b"}]}')
+    assert '非法字符' in parser.error
+
+
+def test_gives_up_when_no_json_start_is_found():
+    parser = QuestionStreamParser()
+    parser.feed('说明' * SEEK_LIMIT)
+    assert parser.gave_up and parser.error is None
+    assert parser.feed('{"questions": []}') == []
+
+
+def test_extract_questions_from_complete_output():
+    assert extract_questions(fenced(QUESTIONS)) == QUESTIONS
+
+
+def test_extract_questions_falls_back_to_outermost_braces():
+    # 裸 JSON 前有说明文字时增量解析找不到起点，按第一个 { 到最后一个 } 解析
+    text = '好的。' + json.dumps({'questions': QUESTIONS}, ensure_ascii=False) + ' 以上。'
+    assert extract_questions(text) == QUESTIONS
+
+
+def test_extract_questions_keeps_questions_before_truncation():
+    text = '```json\n{"questions": [{"题干": "a"}, {"题干": "b'
+    assert extract_questions(text) == [{'题干': 'a'}]
+    assert extract_questions('没有题目') is None
@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""命名样式导出与逐个单元格设置样式（旧写法）的结果必须完全一致"""
+import io
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Alignment, Border, Side, PatternFill
+from openpyxl.worksheet.dimensions import SheetFormatProperties
+
+from generate_excel import (SHEET_TITLE, HEADER_ROW_HEIGHT, DATA_ROW_HEIGHT, adjust_column_width,
+                            create_excel_from_questions)
+from header_utils import HEADERS, HeaderResolver
+
+QUESTION_COUNT = 60
+FLAGGED = {0, 7, 59}
+
+
+def legacy_excel(questions, output, flagged=None):
+    """旧写法：每个单元格新建样式对象"""
+    def border():
+        thin = Side(style='thin')
+        return Border(left=thin, right=thin, top=thin, bottom=thin)
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(SHEET_TITLE)
+    ws.sheet_format = SheetFormatProperties(defaultRowHeight=DATA_ROW_HEIGHT, customHeight=True)
+    ws.row_dimensions[1].height = HEADER_ROW_HEIGHT
+    adjust_column_width(ws)
+
+    row = []
+    for header in HEADERS:
+        cell = WriteOnlyCell(ws, value=header)
+        cell.font = Font(name='宋体', size=11, bold=True)
+        cell.alignment = Alignment(horizontal='center', vertical='center', wrap_text=True)
+        cell.border = border()
+        cell.fill = PatternFill(start_color="B4C7E7", end_color="B4C7E7", fill_type="solid")
+        row.append(cell)
+    ws.append(row)
+
+    resolver = HeaderResolver(HEADERS)
+    flagged = flagged or ()
+    for index, question in enumerate(questions):
+        row = []
+        for value in resolver.resolve(question):
+            cell = WriteOnlyCell(ws, value=value)
+            cell.font = Font(name='宋体', size=11)
+            cell.alignment = Alignment(horizontal='left', vertical='center', wrap_text=True)
+            cell.border = border()
+            if index in flagged:
+                cell.fill = PatternFill(start_color="F8CBAD", end_color="F8CBAD", fill_type="solid")
+            row.append(cell)
+        ws.append(row)
+    wb.save(output)
+
+
+def style_snapshot(data):
+    """读取导出结果中与显示相关的全部样式信息"""
+    ws = load_workbook(io.BytesIO(data)).active
+    cells = [
+        (cell.coordinate, cell.value, repr(cell.font), repr(cell.fill), repr(cell.border),
+         repr(cell.alignment), cell.number_format, repr(cell.protection))
+        for row in ws.iter_rows() for cell in row
+    ]
+    dimensions = {
+        'columns': {key: dim.width for key, dim in ws.column_dimensions.items()},
+        'default_row_height': ws.sheet_format.defaultRowHeight,
+        'custom_height': ws.sheet_format.customHeight,
+        'header_height': ws.row_dimensions[1].height,
+    }
+    table = sorted({cell[2:] for cell in cells})
+    return cells, dimensions, table
+
+
+def export_snapshot(build, questions, flagged):
+    buffer = io.BytesIO()
+    build(questions, buffer, flagged)
+    return style_snapshot(buffer.getvalue())
+
+
+def assert_same_styles(questions, flagged):
+    legacy_cells, legacy_dimensions, legacy_table = export_snapshot(legacy_excel, questions, flagged)
+    named_cells, named_dimensions, named_table = export_snapshot(create_excel_from_questions, questions, flagged)
+    assert len(named_cells) == len(legacy_cells) == (QUESTION_COUNT + 1) * len(HEADERS)
+    for legacy, named in zip(legacy_cells, named_cells):
+        assert named == legacy, f'样式不一致: {legacy[0]}'
+    assert named_dimensions == legacy_dimensions
+    assert named_table == legacy_table
+
+
+def test_named_styles_match_per_cell_styles(make_questions):
+    assert_same_styles(make_questions(QUESTION_COUNT), None)
+
+
+def test_flagged_rows_match_per_cell_styles(make_questions):
+    assert_same_styles(make_questions(QUESTION_COUNT), FLAGGED)
@@ -0,0 +1,99 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""token 用量统计和输出上限学习"""
+import asyncio
+import sqlite3
+
+import pytest
+
+import usage
+from config import DEFAULT_MODEL_LIMITS
+from shared_state import SQLiteState
+from usage import Usage, UsageTracker
+
+URL = 'https://api.example/v1'
+MESSAGES = [{'role': 'user', 'content': '材料'}]
+LIMIT = DEFAULT_MODEL_LIMITS['max_output']
+
+
+def truncate(tracker, completion_tokens):
+    tracker.record('m', URL, MESSAGES, '', {'prompt_tokens': 10, 'completion_tokens': completion_tokens}, 'length')
+
+
+def test_reported_and_estimated_usage():
+    tracker = UsageTracker()
+    request = Usage('m')
+    tracker.record('m', URL, MESSAGES, '', {'prompt_tokens': 10, 'completion_tokens': 20}, 'stop', request)
+    tracker.record('m', URL, MESSAGES, '题目', None, 'length', request)
+    assert (request.calls, request.prompt_tokens, request.completion_tokens) == (2, 12, 22)
+    assert (request.estimated, request.truncated) == (1, 1)
+    totals = asyncio.run(tracker.snapshot())['totals']
+    assert (totals['calls'], totals['totalTokens']) == (2, 34)
+
+
+def test_max_output_needs_repeated_truncations():
+    tracker = UsageTracker()
+    for tokens in (900, 1000):
+        truncate(tracker, tokens)
+        assert tracker.max_output('m') == LIMIT
+    truncate(tracker, 950)
+    assert tracker.max_output('m') == 1000
+    assert tracker.max_output('other') == LIMIT
+
+
+def test_learned_limit_never_exceeds_the_configured_one():
+    tracker = UsageTracker()
+    for _ in range(usage.USAGE_LIMIT_OBSERVATIONS):
+        truncate(tracker, LIMIT * 2)
+    assert tracker.max_output('m') == LIMIT
+
+
+def test_learned_limit_expires(monkeypatch):
+    tracker = UsageTracker()
+    for _ in range(usage.USAGE_LIMIT_OBSERVATIONS):
+        truncate(tracker, 800)
+    assert tracker.max_output('m') == 800
+    now = usage.time.time()
+    monkeypatch.setattr(usage.time, 'time', lambda: now + usage.USAGE_LIMIT_WINDOW + 1)
+    assert tracker.max_output('m') == LIMIT
+
+
+def test_truncated_generation_raises_the_output_ratio():
+    tracker = UsageTracker()
+    request = Usage('m')
+    request.add(100, 3000, True, True)
+    tracker.observe_generation('m', 1000, request)
+    assert tracker.output_ratio('m') == pytest.approx(6.0)
+    assert tracker.chunk_budget('m', 0) < tracker.chunk_budget('other', 0)
+
+
+def test_usage_is_batched_into_shared_state(tmp_path, monkeypatch):
+    state = SQLiteState(str(tmp_path / 'state.sqlite3'))
+    monkeypatch.setattr(usage, 'get_shared_state', lambda: state)
+    tracker = UsageTracker()
+    for _ in range(3):
+        tracker.record('m', URL, MESSAGES, '', {'prompt_tokens': 10, 'completion_tokens': 20}, 'stop')
+    assert state.usage_totals() == []
+
+    async def main():
+        await tracker.stop()
+        return await tracker.snapshot()
+
+    snapshot = asyncio.run(main())
+    assert [(row['calls'], row['totalTokens']) for row in snapshot['byUpstream']] == [(3, 90)]
+    assert tracker._unflushed == {}
+
+
+def test_failed_flush_keeps_usage_for_the_next_one(tmp_path, monkeypatch):
+    state = SQLiteState(str(tmp_path / 'state.sqlite3'))
+    monkeypatch.setattr(usage, 'get_shared_state', lambda: state)
+    tracker = UsageTracker()
+    tracker.record('m', URL, MESSAGES, '', {'prompt_tokens': 10, 'completion_tokens': 20}, 'stop')
+
+    def busy(rows):
+        raise sqlite3.OperationalError('database is locked')
+
+    monkeypatch.setattr(state, 'add_usage', busy)
+    asyncio.run(tracker.flush())
+    tracker.record('m', URL, MESSAGES, '', {'prompt_tokens': 10, 'completion_tokens': 20}, 'stop')
+    assert list(tracker._unflushed.values()) == [[2, 20, 40, 0, 0]]
@@ -0,0 +1,263 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+token 用量和费用统计，以及按用量调整生成请求的大小
+
+- 每次上游调用结束时记录 prompt / completion token 数：上游返回 usage 时使用返回值
+  （流式请求附带 stream_options.include_usage），否则按 estimate_tokens 估算
+- 按模型学习输出与材料 token 数之比，以及实际的输出上限（最近几次 finish_reason 为 length 时
+  已输出的 token 数，过期后恢复为 MODEL_LIMITS 中的值）；大段材料按此切分，使每段的输出不超过输出上限、输入加输出不超过上下文长度，
+  TPM 限速按 prompt 加预计输出预扣，结束后按实际用量修正
+- 累计用量和费用（MODEL_PRICES）通过 /api/usage 查询；多个工作进程时累计用量先在内存中合并，
+  由后台任务每 USAGE_FLUSH_INTERVAL 秒写入共享状态，学习到的比例和上限各进程独立
+"""
+import asyncio
+import sqlite3
+import threading
+import time
+from collections import deque
+import metrics
+from config import (MODEL_LIMITS, DEFAULT_MODEL_LIMITS, MODEL_PRICES, USAGE_OUTPUT_RATIO, USAGE_OUTPUT_HEADROOM,
+                    CHUNK_MAX_TOKENS, CHUNK_MIN_TOKENS, USAGE_FLUSH_INTERVAL, USAGE_LIMIT_OBSERVATIONS,
+                    USAGE_LIMIT_WINDOW)
+from shared_state import get_shared_state
+from utils import estimate_tokens
+
+RATIO_ALPHA = 0.3             # 输出比例的指数滑动平均系数
+TRUNCATED_RATIO_FACTOR = 2.0
+
+
+def model_limits(model):
+    """模型的上下文长度和单次输出上限（token）"""
+    return {**DEFAULT_MODEL_LIMITS, **MODEL_LIMITS.get(model, {})}
+
+
+def cost_of(model, prompt_tokens, completion_tokens):
+    """按 MODEL_PRICES（每百万 token）计算费用，未配置价格的模型返回 None"""
+    price = MODEL_PRICES.get(model)
+    if price is None:
+        return None
+    return (prompt_tokens * price.get('prompt', 0) + completion_tokens * price.get('completion', 0)) / 1e6
+
+
+def prompt_tokens_of(messages):
+    return sum(estimate_tokens(message['content']) for message in messages)
+
+
+class Usage:
+    """一个请求（或一批请求）的用量，记录时同时累加到 parent"""
+
+    def __init__(self, model, parent=None):
+        self.model = model
+        self.parent = parent
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.estimated = 0         # 上游没有返回 usage、按估算计入的调用数
+        self.truncated = 0         # 因达到输出上限被截断的调用数
+        self.last_completion = 0
+        self.last_truncated = False
+
+    def child(self):
+        return Usage(self.model, parent=self)
+
+    @property
+    def total_tokens(self):
+        return self.prompt_tokens + self.completion_tokens
+
+    def add(self, prompt_tokens, completion_tokens, reported, truncated):
+        self.calls += 1
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        self.estimated += not reported
+        self.truncated += truncated
+        self.last_completion = completion_tokens
+        self.last_truncated = truncated
+        if self.parent is not None:
+            self.parent.add(prompt_tokens, completion_tokens, reported, truncated)
+
+    def to_dict(self):
+        return {
+            'calls': self.calls,
+            'promptTokens': self.prompt_tokens,
+            'completionTokens': self.completion_tokens,
+            'totalTokens': self.total_tokens,
+            'estimated': self.estimated,
+            'truncated': self.truncated,
+            'cost': cost_of(self.model, self.prompt_tokens, self.completion_tokens)
+        }
+
+
+class UsageTracker:
+    """累计用量（按模型和上游）以及各模型学习到的输出比例和输出上限"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._unflushed = {}   # 多个工作进程时尚未写入共享状态的用量，(model, upstream) -> [调用数, prompt, ...]
+        self._ratios = {}
+        self._truncations = {}   # model -> 最近 USAGE_LIMIT_OBSERVATIONS 次截断的 (时间, 输出 token 数)
+        self._flush_task = None
+
+    def record(self, model, api_url, messages, output, reported=None, finish_reason=None, usage=None):
+        """
+        记录一次上游调用的用量
+
+        参数:
+            output: 已输出的文本，上游没有返回 usage 时用于估算
+            reported: 上游返回的 usage 对象
+            usage: 当前请求的 Usage，可选
+        """
+        prompt = completion = None
+        if isinstance(reported, dict):
+            prompt, completion = reported.get('prompt_tokens'), reported.get('completion_tokens')
+        is_reported = isinstance(prompt, int) and isinstance(completion, int)
+        if not is_reported:
+            prompt, completion = prompt_tokens_of(messages), estimate_tokens(output)
+        truncated = finish_reason == 'length'
+        upstream = metrics.upstream_label(api_url)
+        source = 'reported' if is_reported else 'estimated'
+        metrics.UPSTREAM_USAGE_TOKENS.inc(model, upstream, 'prompt', source, amount=prompt)
+        metrics.UPSTREAM_USAGE_TOKENS.inc(model, upstream, 'completion', source, amount=completion)
+        if truncated:
+            metrics.UPSTREAM_TRUNCATED.inc(model, upstream)
+            self._observe_limit(model, completion)
+        if usage is not None:
+            usage.add(prompt, completion, is_reported, truncated)
+
+        key = (model, upstream)
+        if get_shared_state() is not None:
+            with self._lock:
+                self._accumulate(key, (1, prompt, completion, int(not is_reported), int(truncated)))
+            return
+        with self._lock:
+            total = self._totals.get(key)
+            if total is None:
+                total = self._totals[key] = Usage(model)
+            total.add(prompt, completion, is_reported, truncated)
+
+    def _accumulate(self, key, counts):
+        pending = self._unflushed.setdefault(key, [0] * len(counts))
+        for i, count in enumerate(counts):
+            pending[i] += count
+
+    async def flush(self):
+        """把内存中合并的用量写入共享状态（在共享状态线程中执行），失败时留到下次"""
+        state = get_shared_state()
+        if state is None:
+            return
+        with self._lock:
+            pending, self._unflushed = self._unflushed, {}
+        if not pending:
+            return
+        try:
+            await state.run(state.add_usage, [key + tuple(counts) for key, counts in pending.items()])
+        except sqlite3.Error:
+            with self._lock:
+                for key, counts in pending.items():
+                    self._accumulate(key, counts)
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(USAGE_FLUSH_INTERVAL)
+            await self.flush()
+
+    def start(self):
+        """启动定期写入共享状态的后台任务（在应用启动时调用，单进程时不启动）"""
+        if get_shared_state() is not None and (self._flush_task is None or self._flush_task.done()):
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_loop())
+
+    async def stop(self):
+        """停止后台任务并写入剩余的用量"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        await self.flush()
+
+    def _observe_limit(self, model, completion_tokens):
+        """被截断时已输出的 token 数即实际的输出上限（上游请求不指定 max_tokens，截断只来自模型自身的上限）"""
+        if completion_tokens <= 0:
+            return
+        with self._lock:
+            truncations = self._truncations.setdefault(model, deque(maxlen=USAGE_LIMIT_OBSERVATIONS))
+            truncations.append((time.time(), completion_tokens))
+
+    def observe_generation(self, model, material_tokens, usage):
+        """
+        生成结束后按最后一次调用的输出更新该模型的输出比例（材料少于 CHUNK_MIN_TOKENS 时不计入）；
+        被截断时实际比例大于观察到的比例，按观察值的 TRUNCATED_RATIO_FACTOR 倍抬高当前估计，
+        使下一次切分的段明显变小（同时被截断的多段不会叠加放大）
+        """
+        if not usage.calls or usage.last_completion <= 0 or material_tokens <= 0:
+            return
+        if material_tokens < CHUNK_MIN_TOKENS and not usage.last_truncated:
+            # 材料很短时输出中固定格式的占比大，比例偏高，不计入
+            return
+        ratio = usage.last_completion / material_tokens
+        with self._lock:
+            current = self._ratios.get(model, USAGE_OUTPUT_RATIO if usage.last_truncated else None)
+            if usage.last_truncated:
+                self._ratios[model] = max(current, ratio * TRUNCATED_RATIO_FACTOR)
+            else:
+                self._ratios[model] = ratio if current is None else current + RATIO_ALPHA * (ratio - current)
+
+    def output_ratio(self, model):
+        return self._ratios.get(model, USAGE_OUTPUT_RATIO)
+
+    def max_output(self, model):
+        """
+        实际的输出上限：最近 USAGE_LIMIT_WINDOW 秒内已有 USAGE_LIMIT_OBSERVATIONS 次截断时取其中最大的输出
+        token 数（不超过配置的上限），否则为 model_limits 中的值
+        """
+        limit = model_limits(model)['max_output']
+        with self._lock:
+            truncations = list(self._truncations.get(model, ()))
+        if len(truncations) < USAGE_LIMIT_OBSERVATIONS or time.time() - truncations[0][0] > USAGE_LIMIT_WINDOW:
+            return limit
+        return min(limit, max(tokens for _, tokens in truncations))
+
+    def expected_output(self, model, material_tokens):
+        """按输出比例估计生成题目的输出 token 数（不超过输出上限）"""
+        return min(self.max_output(model), int(material_tokens * self.output_ratio(model)))
+
+    def chunk_budget(self, model, system_tokens):
+        """
+        每段材料的 token 预算：预计输出不超过输出上限的 USAGE_OUTPUT_HEADROOM，
+        system prompt、材料和输出之和不超过上下文长度，且不超过 CHUNK_MAX_TOKENS
+        """
+        max_output = self.max_output(model)
+        by_output = USAGE_OUTPUT_HEADROOM * max_output / self.output_ratio(model)
+        by_context = model_limits(model)['context'] - system_tokens - max_output
+        return max(CHUNK_MIN_TOKENS, int(min(CHUNK_MAX_TOKENS, by_output, by_context)))
+
+    async def snapshot(self):
+        """累计用量和各模型学习到的参数；共享状态繁忙时抛出 sqlite3.OperationalError"""
+        state = get_shared_state()
+        if state is not None:
+            await self.flush()
+            rows = await state.run(state.usage_totals)
+        else:
+            with self._lock:
+                rows = [{'model': model, 'upstream': upstream, **total.to_dict()}
+                        for (model, upstream), total in self._totals.items()]
+        for row in rows:
+            row['cost'] = cost_of(row['model'], row['promptTokens'], row['completionTokens'])
+        totals = Usage(None)
+        for row in rows:
+            totals.calls += row['calls']
+            totals.prompt_tokens += row['promptTokens']
+            totals.completion_tokens += row['completionTokens']
+            totals.estimated += row['estimated']
+            totals.truncated += row['truncated']
+        costs = [row['cost'] for row in rows if row['cost'] is not None]
+        models = sorted({row['model'] for row in rows} | set(self._ratios) | set(self._truncations))
+        return {
+            'totals': {**totals.to_dict(), 'cost': round(sum(costs), 6) if costs else None},
+            'byUpstream': rows,
+            'models': {model: {'outputRatio': round(self.output_ratio(model), 3),
+                               'maxOutput': self.max_output(model),
+                               'context': model_limits(model)['context']} for model in models}
+        }
+
+
+usage_tracker = UsageTracker()
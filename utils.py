@@ -6,20 +6,46 @@ from config import DEFAULT_SYSTEM_PROMPT
 
 
 def get_or_create_key():
-    """获取或创建加密密钥"""
-    if os.path.exists('key.txt'):
-        with open('key.txt', 'r') as f:
-            return f.read().strip()
-    else:
-        key = secrets.token_urlsafe(32)
-        with open('key.txt', 'w') as f:
-            f.write(key)
-        return key
+    """
+    获取或创建加密密钥
+
+    多个工作进程同时启动时只有一个能创建成功：新密钥先写入临时文件，再以硬链接
+    原子地创建 key.txt，已存在时读取已有的密钥，保证所有进程使用同一个密钥。
+    """
+    if not os.path.exists('key.txt'):
+        temp = f'key.txt.{os.getpid()}.tmp'
+        with open(temp, 'w') as f:
+            f.write(secrets.token_urlsafe(32))
+        try:
+            os.link(temp, 'key.txt')
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp)
+    with open('key.txt', 'r') as f:
+        return f.read().strip()
+
+
+_prompt_file_cache = {}
 
 
 def load_system_prompt():
-    """从本地文件读取系统提示词"""
-    if os.path.exists('system_prompt.txt'):
+    """从本地文件读取系统提示词（文件修改后才重新读取）"""
+    try:
+        stat = os.stat('system_prompt.txt')
+    except OSError:
+        return DEFAULT_SYSTEM_PROMPT
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if _prompt_file_cache.get('signature') != signature:
         with open('system_prompt.txt', 'r', encoding='utf-8') as f:
-            return f.read().strip()
-    return DEFAULT_SYSTEM_PROMPT
+            _prompt_file_cache['text'] = f.read().strip()
+        _prompt_file_cache['signature'] = signature
+    return _prompt_file_cache['text']
+
+
+def estimate_tokens(text):
+    """粗略估算文本的 token 数：非 ASCII 字符（中文等）按 1 个计，ASCII 字符按 4 个计 1 个"""
+    if not text:
+        return 0
+    ascii_count = sum(1 for ch in text if ord(ch) < 128)
+    return (len(text) - ascii_count) + (ascii_count + 3) // 4